@@ -0,0 +1,95 @@
+"""
+Benchmark: list endpoint serialization
+Times one page of stored T&M tags through the old response_model path and
+through trusted_rows + FastJSONResponse, with clean rows and with rows whose
+stored types need validating (e.g. date_of_work saved as a string by PUT).
+No database needed: documents are generated in memory
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+# server.py reads these at import; the client it creates never connects here
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'tm_tracker')
+
+from server import TMTag
+from service_fast_json import ORJSON_AVAILABLE, dumps, trusted_rows
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def labor_entry(worker: int, day: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()), "worker_name": f"Worker {worker}", "quantity": 1,
+        "st_hours": 8.0, "ot_hours": 2.0, "dt_hours": 0.0, "pot_hours": 0.0, "total_hours": 10.0, "date": day
+    }
+
+def stored_tm_tags(count: int, labor_entries: int, mistyped: bool = False) -> list:
+    """Tags shaped like tm_tags documents; mistyped ones carry date_of_work as an ISO string"""
+    start = datetime(2025, 1, 1, 7)
+    docs = []
+    for i in range(count):
+        worked = start + timedelta(days=i % 365)
+        day = worked.strftime("%Y-%m-%d")
+        docs.append({
+            "_id": uuid.uuid4().hex[:24], "id": str(uuid.uuid4()), "project_id": "p1", "project_name": "Alpha",
+            "cost_code": "FP-100", "date_of_work": worked.isoformat() if mistyped else worked,
+            "company_name": "", "tm_tag_title": f"Tag {i}", "description_of_work": "Sprinkler heads",
+            "labor_entries": [labor_entry(worker, day) for worker in range(labor_entries)],
+            "material_entries": [], "equipment_entries": [], "other_entries": [],
+            "gc_email": "gc@example.com", "signature_id": "0" * 64, "foreman_name": "Jesus Garcia",
+            "status": "completed", "created_at": worked, "submitted_at": worked, "work_date": day
+        })
+    return docs
+
+def model_path(docs: list) -> bytes:
+    """What the endpoints did before: a model per row, response_model re-validation, stdlib json"""
+    tm_tags = [TMTag(**doc) for doc in docs]
+    validated = [TMTag.model_validate(tm_tag.model_dump()) for tm_tag in tm_tags]
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+def trusted_path(docs: list) -> bytes:
+    return dumps(trusted_rows(docs, TMTag))
+
+def best_of(repeat: int, fn, docs: list) -> float:
+    """Fastest run in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        fn(docs)
+        timings.append((time.perf_counter() - began) * 1000)
+    return min(timings)
+
+def run_benchmark(count=1000, labor_entries=4, repeat=5) -> dict:
+    """Main benchmark function"""
+    clean = stored_tm_tags(count, labor_entries)
+    mistyped = stored_tm_tags(count, labor_entries, mistyped=True)
+    assert json.loads(trusted_path(clean)) == json.loads(model_path(clean))
+
+    results = {
+        "model path": best_of(repeat, model_path, clean),
+        "trusted rows (clean)": best_of(repeat, trusted_path, clean),
+        "trusted rows (all mistyped)": best_of(repeat, trusted_path, mistyped),
+    }
+    logger.info(f"{count} T&M tags x {labor_entries} labor entries, best of {repeat}, "
+                f"{'orjson' if ORJSON_AVAILABLE else 'stdlib json'}")
+    for name, ms in results.items():
+        logger.info(f"  {name:<28} {ms:8.1f} ms")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1000, help="T&M tags per page")
+    parser.add_argument("--labor-entries", type=int, default=4, help="Labor entries per tag")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per path (fastest is reported)")
+    args = parser.parse_args()
+
+    run_benchmark(args.count, args.labor_entries, args.repeat)
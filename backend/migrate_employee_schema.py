@@ -0,0 +1,111 @@
+"""
+Migration Script: legacy employee schema
+Converts employees from base_pay/burden_cost to hourly_rate/gc_billing_rate in
+batched bulk writes, replacing the per-document migration GET /api/employees used to do
+"""
+
+import argparse
+import asyncio
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from service_employee_rates import DEFAULT_HOURLY_RATE
+
+# Load environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Database connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'tm_tracker')
+
+DEFAULT_GC_BILLING_RATE = 95.0
+
+# Legacy base_pay/burden_cost documents, or documents missing either rate field
+LEGACY_QUERY = {"$or": [
+    {"base_pay": {"$exists": True}, "burden_cost": {"$exists": True}},
+    {"hourly_rate": {"$exists": False}},
+    {"gc_billing_rate": {"$exists": False}}
+]}
+
+def employee_update(employee):
+    """Update document bringing one employee to the current schema"""
+    update = {"$set": {}}
+
+    if "base_pay" in employee and "burden_cost" in employee:
+        # Old schema: true hourly cost is base pay plus burden
+        update["$set"]["hourly_rate"] = float(employee.get("base_pay") or 0) + float(employee.get("burden_cost") or 0)
+        update["$unset"] = {"base_pay": "", "burden_cost": ""}
+    elif "hourly_rate" not in employee:
+        update["$set"]["hourly_rate"] = DEFAULT_HOURLY_RATE
+
+    if "gc_billing_rate" not in employee:
+        update["$set"]["gc_billing_rate"] = DEFAULT_GC_BILLING_RATE
+
+    return update
+
+async def migrate_employees(dry_run=False, batch_size=500):
+    """Main migration function"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    try:
+        total = await db.employees.count_documents(LEGACY_QUERY)
+        logger.info(f"Found {total} employees needing schema migration{' (dry run)' if dry_run else ''}")
+
+        cursor = db.employees.find(
+            LEGACY_QUERY,
+            {"_id": 1, "id": 1, "name": 1, "base_pay": 1, "burden_cost": 1, "hourly_rate": 1, "gc_billing_rate": 1}
+        ).batch_size(batch_size)
+
+        processed = modified = 0
+        batch = []
+        async for employee in cursor:
+            update = employee_update(employee)
+            if dry_run and processed < 10:
+                logger.info(f"  - {employee.get('name')} ({employee.get('id')}): {update}")
+            batch.append(UpdateOne({"_id": employee["_id"]}, update))
+            processed += 1
+
+            if len(batch) >= batch_size:
+                modified += await flush(db, batch, dry_run)
+                batch = []
+                logger.info(f"Progress: {processed}/{total}")
+
+        if batch:
+            modified += await flush(db, batch, dry_run)
+            logger.info(f"Progress: {processed}/{total}")
+
+        if dry_run:
+            logger.info(f"Dry run complete - {processed} employees would be migrated")
+        else:
+            logger.info(f"Employee schema migration complete - {modified} employees updated")
+
+    except Exception as e:
+        logger.error(f"Employee schema migration failed: {str(e)}")
+        raise
+    finally:
+        client.close()
+
+async def flush(db, batch, dry_run):
+    """Write one batch of updates, returning the number of modified documents"""
+    if dry_run:
+        return 0
+    result = await db.employees.bulk_write(batch, ordered=False)
+    return result.modified_count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--batch-size", type=int, default=500, help="Updates per bulk_write")
+    args = parser.parse_args()
+
+    asyncio.run(migrate_employees(args.dry_run, args.batch_size))
@@ -0,0 +1,68 @@
+"""
+Migration Script: GC project PINs
+Seeds the gc_pins pool in batches (resumable, and a no-op once complete),
+retires free PINs of a previous GC_PIN_DIGITS width, reconciles the pool with
+the PINs projects hold and assigns a PIN to every legacy project without one.
+Startup seeds the pool too; run this to backfill legacy projects and whenever
+GC_PIN_DIGITS changes
+"""
+
+import argparse
+import asyncio
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from service_pin_allocator import GcPinAllocator
+
+# Load environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Database connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'tm_tracker')
+GC_PIN_DIGITS = int(os.environ.get('GC_PIN_DIGITS', '4'))
+
+async def migrate_project_pins(dry_run=False):
+    """Main migration function"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    allocator = GcPinAllocator(db, digits=GC_PIN_DIGITS)
+
+    try:
+        before = await allocator.check()
+        logger.info(f"Before: {before}")
+
+        if dry_run:
+            logger.info(f"Dry run complete - {before['projects_missing_pin']} projects would get a GC PIN")
+            return before
+
+        await allocator.seed()
+        await allocator.reconcile()
+        await allocator.retire_other_widths()
+        assigned = await allocator.backfill()
+        logger.info(f"Assigned GC PINs to {assigned} projects")
+
+        after = await allocator.check()
+        logger.info(f"After: {after}")
+        return after
+
+    except Exception as e:
+        logger.error(f"Project PIN migration failed: {str(e)}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    asyncio.run(migrate_project_pins(args.dry_run))
@@ -0,0 +1,116 @@
+"""
+Migration Script: T&M tag signatures
+Moves inline base64 signatures out of tm_tags into the content-addressed
+signatures collection in batches, leaving a signature_id reference behind;
+--prune removes stored signatures no tag references any more
+"""
+
+import argparse
+import asyncio
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from service_signature_store import SignatureStore
+
+# Load environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Database connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'tm_tracker')
+
+# Tags still carrying the image inline (null/empty signatures are just dropped)
+INLINE_QUERY = {"signature": {"$exists": True}}
+
+async def migrate_signatures(dry_run=False, batch_size=200):
+    """Main migration function"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    store = SignatureStore(db)
+
+    try:
+        total = await db.tm_tags.count_documents(INLINE_QUERY)
+        logger.info(f"Found {total} T&M tags with inline signatures{' (dry run)' if dry_run else ''}")
+
+        cursor = db.tm_tags.find(INLINE_QUERY, {"_id": 1, "signature": 1}).batch_size(batch_size)
+
+        processed = extracted = 0
+        inline_bytes = 0
+        distinct = set()
+        batch = []
+        async for tm_tag in cursor:
+            signature = tm_tag.get("signature")
+            processed += 1
+
+            if signature:
+                extracted += 1
+                inline_bytes += len(signature)
+                if dry_run:
+                    distinct.add(signature)
+                    continue
+                digest = await store.put(signature)
+                distinct.add(digest)
+                batch.append(UpdateOne(
+                    {"_id": tm_tag["_id"], "signature": signature},
+                    {"$set": {"signature_id": digest}, "$unset": {"signature": ""}}
+                ))
+            elif not dry_run:
+                batch.append(UpdateOne({"_id": tm_tag["_id"], "signature": signature}, {"$unset": {"signature": ""}}))
+
+            if len(batch) >= batch_size:
+                await db.tm_tags.bulk_write(batch, ordered=False)
+                batch = []
+                logger.info(f"Progress: {processed}/{total}")
+
+        if batch:
+            await db.tm_tags.bulk_write(batch, ordered=False)
+        logger.info(f"Progress: {processed}/{total}")
+
+        logger.info(
+            f"{'Would extract' if dry_run else 'Extracted'} {extracted} signatures "
+            f"({inline_bytes / 1024 / 1024:.1f} MB inline) into {len(distinct)} distinct images"
+        )
+
+    except Exception as e:
+        logger.error(f"Signature migration failed: {str(e)}")
+        raise
+    finally:
+        client.close()
+
+async def prune_signatures(dry_run=False):
+    """Delete stored signatures that no T&M tag references"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    try:
+        referenced = set(await db.tm_tags.distinct("signature_id"))
+        orphaned = [
+            doc["_id"] async for doc in db.signatures.find({}, {"_id": 1})
+            if doc["_id"] not in referenced
+        ]
+        if orphaned and not dry_run:
+            await db.signatures.delete_many({"_id": {"$in": orphaned}})
+        logger.info(f"{'Would prune' if dry_run else 'Pruned'} {len(orphaned)} unreferenced signatures")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--batch-size", type=int, default=200, help="Tags per bulk_write")
+    parser.add_argument("--prune", action="store_true", help="Only delete unreferenced signatures")
+    args = parser.parse_args()
+
+    if args.prune:
+        asyncio.run(prune_signatures(args.dry_run))
+    else:
+        asyncio.run(migrate_signatures(args.dry_run, args.batch_size))
@@ -0,0 +1,60 @@
+"""
+Migration Script: backfill updated_at
+Gives every existing document in the change feed collections an updated_at
+(its created_at date, or the migration time when it has none) so
+/api/changes and /api/sync can find writes with one indexed range query
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from service_change_feed import CHANGE_FEED_COLLECTIONS, create_change_feed_indexes
+
+# Load environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Database connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'tm_tracker')
+
+async def migrate_updated_at():
+    """Main migration function"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    logger.info("Starting updated_at backfill")
+    now = datetime.utcnow()
+
+    try:
+        for collection in CHANGE_FEED_COLLECTIONS:
+            # created_at when it's a real date (some legacy documents hold strings), else now
+            result = await db[collection].update_many(
+                {"updated_at": {"$exists": False}},
+                [{"$set": {"updated_at": {
+                    "$cond": [{"$eq": [{"$type": "$created_at"}, "date"]}, "$created_at", now]
+                }}}]
+            )
+            logger.info(f"{collection}: {result.modified_count} documents backfilled")
+
+        await create_change_feed_indexes(db)
+
+        logger.info("updated_at backfill completed successfully!")
+
+    except Exception as e:
+        logger.error(f"updated_at backfill failed: {str(e)}")
+        raise
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_updated_at())
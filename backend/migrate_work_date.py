@@ -0,0 +1,76 @@
+"""
+Migration Script: backfill canonical work_date keys
+Adds the normalized YYYY-MM-DD work_date field to existing tm_tags and crew_logs
+so the crew log <-> T&M tag sync can use the (project_id, work_date) index
+"""
+
+import asyncio
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+# Load environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Database connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'tm_tracker')
+
+# collection -> source date field
+DATE_FIELDS = {
+    "tm_tags": "date_of_work",
+    "crew_logs": "date",
+}
+
+async def migrate_work_dates():
+    """Main migration function"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+
+    logger.info("Starting work_date backfill")
+
+    try:
+        for collection, field in DATE_FIELDS.items():
+            await backfill_collection(db, collection, field)
+            await db[collection].create_index([("project_id", 1), ("work_date", 1)])
+
+        logger.info("work_date backfill completed successfully!")
+
+    except Exception as e:
+        logger.error(f"work_date backfill failed: {str(e)}")
+        raise
+    finally:
+        client.close()
+
+async def backfill_collection(db, collection, field):
+    """Set work_date server-side from a string or datetime date field"""
+    missing = {"work_date": {"$exists": False}}
+
+    # ISO strings ("2025-09-01" or "2025-09-01T08:00:00") -> first 10 characters
+    string_result = await db[collection].update_many(
+        {**missing, field: {"$type": "string"}},
+        [{"$set": {"work_date": {"$substrCP": [f"${field}", 0, 10]}}}]
+    )
+
+    # BSON dates -> formatted date string
+    date_result = await db[collection].update_many(
+        {**missing, field: {"$type": "date"}},
+        [{"$set": {"work_date": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${field}"}}}}]
+    )
+
+    remaining = await db[collection].count_documents(missing)
+
+    logger.info(f"{collection}: {string_result.modified_count} string dates, "
+                f"{date_result.modified_count} datetime dates backfilled")
+    if remaining:
+        logger.warning(f"{collection}: {remaining} documents have no usable {field} and were skipped")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_work_dates())
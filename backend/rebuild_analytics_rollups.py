@@ -0,0 +1,73 @@
+"""
+Rebuild Script: project analytics rollups
+Recomputes project_analytics_rollups from tm_tags, crew_logs and materials,
+or with --verify reports drift between the stored and recomputed totals
+"""
+
+import argparse
+import asyncio
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from service_analytics_rollups import AnalyticsRollups
+
+# Load environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Database connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'tm_tracker')
+
+async def rebuild_rollups(project_id=None, verify=False):
+    """Rebuild (or verify) rollups for one project or every project"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    rollups = AnalyticsRollups(db)
+
+    try:
+        await rollups.create_indexes()
+
+        if project_id:
+            project_ids = [project_id]
+        else:
+            project_ids = await db.projects.distinct("id")
+
+        drifted = 0
+        for pid in project_ids:
+            if verify:
+                drift = await rollups.drift(pid)
+                if drift:
+                    drifted += 1
+                    logger.warning(f"Project {pid}: {len(drift)} drifted fields")
+                    for path, (stored, expected) in sorted(drift.items()):
+                        logger.warning(f"  - {path}: stored {stored}, expected {expected}")
+            else:
+                await rollups.rebuild(pid)
+                logger.info(f"Rebuilt analytics rollup for project {pid}")
+
+        if verify:
+            logger.info(f"Verified {len(project_ids)} projects, {drifted} with drift")
+        else:
+            logger.info(f"Rebuilt {len(project_ids)} analytics rollups")
+
+        return drifted
+
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--project", help="Only rebuild/verify this project id")
+    parser.add_argument("--verify", action="store_true", help="Report drift without writing")
+    args = parser.parse_args()
+
+    drifted = asyncio.run(rebuild_rollups(args.project, args.verify))
+    raise SystemExit(1 if drifted else 0)
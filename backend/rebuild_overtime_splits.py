@@ -0,0 +1,91 @@
+"""
+Rebuild Script: crew log overtime splits
+Reclassifies every crew member's ST/OT/DT hours one pay week at a time using
+the project overtime rules, or with --dry-run reports the lines that would change
+"""
+
+import argparse
+import asyncio
+import logging
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+
+from service_overtime import OvertimeClassifier, week_start
+from service_sync_queue import SyncQueue
+
+# Load environment
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Database connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'tm_tracker')
+
+async def rebuild_overtime(start=None, end=None, dry_run=False):
+    """Reclassify (or report) the pay weeks with crew logs between start and end (YYYY-MM-DD)"""
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    classifier = OvertimeClassifier(db)
+    # Enqueue only: the server's sync workers bring the T&M tags in line
+    sync_queue = SyncQueue(db, {"crew_log_to_tm": None})
+
+    try:
+        work_dates = {"$ne": None}
+        if start:
+            work_dates["$gte"] = start
+        if end:
+            work_dates["$lte"] = end
+        weeks = set()
+        for day in await db.crew_logs.distinct("work_date", {"work_date": work_dates}):
+            try:
+                weeks.add(week_start(day))
+            except (TypeError, ValueError):
+                logger.warning(f"Skipping crew logs with work_date {day!r}: not YYYY-MM-DD")
+        weeks = sorted(weeks)
+
+        changed_lines = 0
+        changed_logs = 0
+        for week in weeks:
+            changes = await classifier.classify_week(week)
+            if not changes:
+                continue
+            changed_lines += len(changes)
+
+            if dry_run:
+                logger.warning(f"Week of {week}: {len(changes)} crew member lines would change")
+                for change in changes:
+                    logger.warning(f"  - {change['work_date']} {change['worker_name']} (crew log {change['crew_log_id']}): "
+                                   f"{change['before']} -> {change['after']}")
+                continue
+
+            touched = await classifier.apply(changes)
+            changed_logs += len(touched)
+            for crew_log in touched:
+                await sync_queue.enqueue("crew_log_to_tm", crew_log["project_id"], crew_log["work_date"], crew_log["id"])
+            logger.info(f"Week of {week}: reclassified {len(changes)} lines in {len(touched)} crew logs")
+
+        if dry_run:
+            logger.info(f"Checked {len(weeks)} weeks, {changed_lines} lines would change")
+        else:
+            logger.info(f"Checked {len(weeks)} weeks, updated {changed_logs} crew logs")
+
+        return changed_lines
+
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--start", help="First work date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last work date (YYYY-MM-DD)")
+    parser.add_argument("--dry-run", action="store_true", help="Report changes without writing")
+    args = parser.parse_args()
+
+    changed = asyncio.run(rebuild_overtime(args.start, args.end, args.dry_run))
+    raise SystemExit(1 if args.dry_run and changed else 0)
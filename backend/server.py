@@ -1,25 +1,26 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Response, Form, File, UploadFile, Header
 from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError, create_model
+from typing import List, Optional, Union
 import uuid
 import hashlib
 import secrets
 import bcrypt
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import asyncio
-import random
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
 import base64
+import json
+import csv
+import io
+from functools import lru_cache
 
 # Import financial models
 from models_financial import (
@@ -40,6 +41,24 @@ from models_gc_dashboard import (
     GcKeyAdmin, GcAccessLogAdmin
 )
 
+from service_sync_queue import SyncQueue
+from service_analytics_rollups import AnalyticsRollups, rollup_totals
+from service_analytics_pipeline import aggregate_project_totals
+from service_employee_rates import DEFAULT_HOURLY_RATE, EmployeeRateCache
+from service_pin_allocator import GcPinAllocator
+from service_email_outbox import EmailOutbox, SmtpConnection, AttachmentTooLarge
+from service_tm_tag_pdf import TmTagPdfRenderer
+from service_signature_store import SignatureStore, decode_data_url, signature_id
+from service_http_middleware import add_response_optimizations, RequestBodyLimitMiddleware
+from service_fast_json import FastJSONResponse, trusted_rows
+from service_event_bus import EventBus, ChangeStreamRelay
+from service_change_feed import CHANGE_FEED_COLLECTIONS, create_change_feed_indexes
+from service_payroll import TIMESHEET_COLUMNS, timesheet_pipeline, flatten_timesheet, week_days
+from service_overtime import OvertimeClassifier, OvertimeRules, week_start
+from service_idempotency import (
+    IdempotencyStore, IdempotencyKeyInvalid, IdempotencyKeyReused, IdempotencyKeyInProgress, request_fingerprint
+)
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -70,11 +89,37 @@ inspection_status_collection = db["inspection_status"]
 gc_narratives_collection = db["gc_narratives"]
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+def stamped(doc: dict) -> dict:
+    """Set updated_at - the change feed's index key - on a document or $set about to be written"""
+    doc["updated_at"] = datetime.utcnow()
+    return doc
+
+# Live dashboard events, streamed from /api/events
+EVENT_COLLECTIONS = {
+    # collection: field holding its project id
+    "tm_tags": "project_id",
+    "crew_logs": "project_id",
+    "phases": "project_id",
+    "project_phases": "projectId",
+    "inspections": "project_id"
+}
+
+events = EventBus(heartbeat=float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15')))
+change_relay = (
+    ChangeStreamRelay(db, events, EVENT_COLLECTIONS)
+    if os.environ.get('EVENT_CHANGE_STREAMS', 'false').lower() == 'true' else None
+)
+
+def publish_change(collection: str, action: str, doc: Optional[dict]):
+    """Project-scoped event for a write; with change streams on, the relay publishes instead (for every worker's writes)"""
+    if change_relay is None and doc and collection in EVENT_COLLECTIONS:
+        events.publish(f"{collection}.{action}", doc.get(EVENT_COLLECTIONS[collection]), {"id": doc.get("id")})
+
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -139,11 +184,27 @@ class TMTag(BaseModel):
     other_entries: List[OtherEntry] = []
     gc_email: str
     signature: Optional[str] = None
+    signature_id: Optional[str] = None  # Key into the signatures collection; stored tags don't carry the image inline
     foreman_name: str = "Jesus Garcia"
     status: str = "completed"
     created_at: datetime = Field(default_factory=datetime.utcnow)
     submitted_at: Optional[datetime] = None
 
+class TMTagSummary(BaseModel):
+    """fields=summary view of a T&M tag: no signature image or entry arrays"""
+    id: str
+    project_id: Optional[str] = None
+    project_name: str
+    cost_code: str
+    date_of_work: datetime
+    company_name: Optional[str] = ""
+    tm_tag_title: str
+    gc_email: str
+    foreman_name: str = "Jesus Garcia"
+    status: str = "completed"
+    created_at: Optional[datetime] = None
+    submitted_at: Optional[datetime] = None
+
 class TMTagCreate(BaseModel):
     project_id: Optional[str] = None  # Link to project
     project_name: str
@@ -164,8 +225,9 @@ class EmailRequest(BaseModel):
     cc_email: Optional[str] = ""
     subject: str
     message: str
-    pdf_data: str  # base64 encoded PDF
+    pdf_data: Optional[str] = None  # base64 encoded PDF
     tm_tag_id: str
+    render_pdf: bool = False  # Attach the server-rendered PDF instead of pdf_data
 
 class Worker(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -307,6 +369,7 @@ class Project(BaseModel):
     estimated_material_cost: Optional[float] = 0  # Forecasted material cost
     estimated_profit: Optional[float] = 0  # Expected profit
     address: Optional[str] = ""
+    overtime_rules: Optional[OvertimeRules] = None  # None: daily > 8 OT, > 12 DT, weekly > 40 OT
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -368,6 +431,18 @@ class CrewLog(BaseModel):
     logged_by: str = "Jesus Garcia"
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class CrewLogSummary(BaseModel):
+    """fields=summary view of a crew log, as build_crew_log / crew_log_from_tm_tag store it"""
+    id: str
+    project_id: str
+    work_date: Optional[str] = None
+    date: Optional[Union[datetime, str]] = None
+    crew_members: List[Union[dict, str]] = []
+    total_hours: float = 0  # Computed from crew_members, not stored
+    status: Optional[str] = None  # "pending_review" on logs generated from a T&M tag
+    synced_to_tm: bool = False
+    created_at: Optional[datetime] = None
+
 class CrewLogCreate(BaseModel):
     project_id: str
     project_name: str
@@ -398,6 +473,22 @@ class MaterialPurchase(BaseModel):
     purchased_by: str = "Jesus Garcia"
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class MaterialPurchaseSummary(BaseModel):
+    """fields=summary view of a material purchase: no receipt image"""
+    id: str
+    project_id: str
+    project_name: str
+    purchase_date: datetime
+    vendor: str
+    material_name: str
+    quantity: float
+    unit_cost: float
+    total_cost: float
+    invoice_number: Optional[str] = ""
+    category: str = "general"
+    purchased_by: str = "Jesus Garcia"
+    created_at: Optional[datetime] = None
+
 class MaterialPurchaseCreate(BaseModel):
     project_id: str
     project_name: str
@@ -435,55 +526,219 @@ async def get_status_checks():
     status_checks = await db.status_checks.find().to_list(1000)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
+# Idempotency-Key support for writes the frontend retries after saving offline
+idempotency_keys = IdempotencyStore(db, ttl_hours=float(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24')))
+
+async def run_idempotent(scope: str, key: Optional[str], payload, write):
+    """Run write() once per Idempotency-Key; retries with the same key and body get the stored response"""
+    if key is None:
+        return await write()
+    
+    try:
+        record = await idempotency_keys.begin(scope, key, request_fingerprint(jsonable_encoder(payload)))
+    except IdempotencyKeyInvalid as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyKeyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    if record is not None:
+        return FastJSONResponse(content=record["response"], status_code=record["status_code"],
+                                headers={"Idempotent-Replayed": "true"})
+    
+    try:
+        result = await write()
+    except BaseException:
+        await idempotency_keys.abandon(scope, key)
+        raise
+    
+    body = jsonable_encoder(result)
+    if isinstance(body, dict) and "error" in body:
+        await idempotency_keys.abandon(scope, key)  # Failed writes stay retryable
+    else:
+        await idempotency_keys.complete(scope, key, 200, body)
+    return result
+
 # T&M Tag Endpoints
+signature_store = SignatureStore(db)
+
+# Lists and sync pages leave signature images (inline on un-migrated tags) to GET /tm-tags/{id}/signature
+TM_TAG_LIST_PROJECTION = {"_id": 0, "signature": 0}
+
 # Enhanced T&M Tag Creation with Crew Log Sync
 @api_router.post("/tm-tags", response_model=TMTag)
-async def create_tm_tag(tm_tag: TMTagCreate):
+async def create_tm_tag(tm_tag: TMTagCreate, idempotency_key: Optional[str] = Header(None)):
+    return await run_idempotent("tm-tags", idempotency_key, tm_tag, lambda: insert_tm_tag(tm_tag))
+
+async def insert_tm_tag(tm_tag: TMTagCreate):
     tm_tag_dict = tm_tag.dict()
     tm_tag_obj = TMTag(**tm_tag_dict)
     tm_tag_obj.submitted_at = datetime.utcnow()
     
     # Insert into database
-    result = await db.tm_tags.insert_one(tm_tag_obj.dict())
+    tm_tag_doc = tm_tag_obj.dict()
+    tm_tag_doc["work_date"] = normalize_work_date(tm_tag_doc["date_of_work"])
+    await signature_store.extract(tm_tag_doc)
+    tm_tag_obj.signature_id = tm_tag_doc.get("signature_id")
+    tm_tag_obj.signature = None  # Respond (and record for Idempotency-Key replays) with the stored form
+    result = await db.tm_tags.insert_one(stamped(tm_tag_doc))
+    await analytics_rollups.apply("tm_tag", new=tm_tag_doc)
+    publish_change("tm_tags", "created", tm_tag_doc)
     
-    # Sync to crew logs
-    await sync_tm_to_crew_log(tm_tag_obj.dict())
+    # Sync to crew logs in the background
+    await sync_queue.enqueue("tm_to_crew_log", tm_tag_doc["project_id"], tm_tag_doc["work_date"], tm_tag_doc["id"])
     
     return tm_tag_obj
 
+@api_router.post("/tm-tags/bulk")
+async def create_tm_tags_bulk(tm_tags: List[TMTagCreate]):
+    """Create many T&M tags in one write and sync crew logs for all affected dates in one pass"""
+    if not tm_tags:
+        raise HTTPException(status_code=400, detail="No T&M tags provided")
+    if len(tm_tags) > MAX_BULK_TM_TAGS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_TM_TAGS} T&M tags per request")
+    
+    submitted_at = datetime.utcnow()
+    tm_tag_docs = []
+    for tm_tag in tm_tags:
+        tm_tag_obj = TMTag(**tm_tag.dict())
+        tm_tag_obj.submitted_at = submitted_at
+        tm_tag_doc = tm_tag_obj.dict()
+        tm_tag_doc["work_date"] = normalize_work_date(tm_tag_doc["date_of_work"])
+        tm_tag_docs.append(stamped(await signature_store.extract(tm_tag_doc)))
+    
+    await db.tm_tags.insert_many(tm_tag_docs)
+    await analytics_rollups.apply_many("tm_tag", tm_tag_docs)
+    for tm_tag_doc in tm_tag_docs:
+        publish_change("tm_tags", "created", tm_tag_doc)
+    
+    # Sync to crew logs
+    crew_logs_created = await sync_tm_tags_to_crew_logs(tm_tag_docs)
+    
+    return {
+        "message": f"Created {len(tm_tag_docs)} T&M tags",
+        "count": len(tm_tag_docs),
+        "ids": [tm_tag_doc["id"] for tm_tag_doc in tm_tag_docs],
+        "crew_logs_created": crew_logs_created
+    }
+
 @api_router.get("/tm-tags", response_model=List[TMTag])
-async def get_tm_tags(skip: int = 0, limit: int = 100):
-    tm_tags = await db.tm_tags.find().skip(skip).limit(limit).to_list(limit)
-    return [TMTag(**tm_tag) for tm_tag in tm_tags]
+async def get_tm_tags(response: Response, after: Optional[str] = None, limit: int = 100, fields: Optional[str] = None):
+    """T&M tag page; signatures come back as signature_id only, the image is at /tm-tags/{id}/signature"""
+    projection, view = resolve_fields(fields, TMTag, {"summary": TMTagSummary})
+    tm_tags = await fetch_page(db.tm_tags, {}, after, limit, response, projection or TM_TAG_LIST_PROJECTION)
+    if view:
+        return projected_response(tm_tags, view, response)
+    return trusted_response(tm_tags, TMTag, response)
+
+@api_router.get("/tm-tags/export")
+async def export_tm_tags(project_id: str, format: str = "ndjson"):
+    """Stream a project's full T&M tag history, one row per labor/material/equipment/other entry"""
+    cursor = db.tm_tags.find({"project_id": project_id}, {"_id": 0, "signature": 0}).sort(PAGE_SORT)
+    return export_response(cursor, flatten_tm_tag, TM_TAG_EXPORT_COLUMNS, format, f"tm_tags_{project_id}")
 
 @api_router.get("/tm-tags/{tm_tag_id}")
 async def get_tm_tag(tm_tag_id: str):
     tm_tag = await db.tm_tags.find_one({"id": tm_tag_id})
     if tm_tag:
+        await signature_store.hydrate([tm_tag])
         return TMTag(**tm_tag)
     return {"error": "T&M Tag not found"}
 
+@api_router.get("/tm-tags/{tm_tag_id}/signature")
+async def get_tm_tag_signature(tm_tag_id: str):
+    """Signature image for a T&M tag, served from the content-addressed signature store"""
+    tm_tag = await db.tm_tags.find_one({"id": tm_tag_id}, {"_id": 0, "signature": 1, "signature_id": 1})
+    if not tm_tag:
+        raise HTTPException(status_code=404, detail="T&M tag not found")
+    
+    # Un-migrated tags still carry the image inline
+    data = tm_tag.get("signature")
+    digest = tm_tag.get("signature_id")
+    if not data and digest:
+        data = await signature_store.get(digest)
+    if not data:
+        raise HTTPException(status_code=404, detail="T&M tag has no signature")
+    
+    media_type, image = decode_data_url(data)
+    return Response(
+        content=image,
+        media_type=media_type,
+        headers={"ETag": f'"{digest or signature_id(data)}"', "Cache-Control": "private, max-age=31536000, immutable"}
+    )
+
+tm_tag_pdfs = TmTagPdfRenderer(db, workers=int(os.environ.get('PDF_RENDER_WORKERS', '2')))
+
+@api_router.get("/tm-tags/{tm_tag_id}/pdf")
+async def get_tm_tag_pdf(tm_tag_id: str):
+    """Server-rendered T&M tag PDF (same layout as the client PDFGenerator), cached by content hash"""
+    tm_tag = await db.tm_tags.find_one({"id": tm_tag_id}, {"_id": 0})
+    if not tm_tag:
+        raise HTTPException(status_code=404, detail="T&M tag not found")
+    
+    await signature_store.hydrate([tm_tag])
+    pdf, digest = await tm_tag_pdfs.render(tm_tag)
+    filename = await tm_tag_pdf_filename(tm_tag_id)
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={filename}", "ETag": f'"{digest}"'}
+    )
+
+@api_router.get("/tm-tags/pdf/stats")
+async def get_tm_tag_pdf_stats():
+    """PDF render cache hit/miss counters"""
+    return tm_tag_pdfs.stats()
+
 @api_router.delete("/tm-tags/{tm_tag_id}")
 async def delete_tm_tag(tm_tag_id: str):
-    result = await db.tm_tags.delete_one({"id": tm_tag_id})
-    if result.deleted_count == 1:
+    deleted_tag = await db.tm_tags.find_one_and_delete({"id": tm_tag_id})
+    if deleted_tag:
+        await analytics_rollups.apply("tm_tag", old=deleted_tag)
+        await record_deletions("tm_tags", [deleted_tag])
         return {"message": "T&M Tag deleted successfully", "id": tm_tag_id}
     return {"error": "T&M Tag not found"}
 
+async def tm_tag_update(update_data: dict) -> dict:
+    """Mongo update for changed T&M tag fields; signatures live in the signature store and clearing one drops the reference"""
+    update = {"$set": update_data}
+    if "signature" in update_data:
+        signature = update_data.pop("signature")
+        if signature:
+            update_data["signature_id"] = await signature_store.put(signature)
+            update["$unset"] = {"signature": ""}
+        else:
+            update["$unset"] = {"signature": "", "signature_id": ""}
+    return update
+
 @api_router.put("/tm-tags/{tm_tag_id}")
 async def update_tm_tag(tm_tag_id: str, update_data: dict):
     """Update T&M tag with new data"""
     try:
         # Add updated timestamp
         update_data["updated_at"] = datetime.utcnow()
+        if "date_of_work" in update_data:
+            update_data["work_date"] = normalize_work_date(update_data["date_of_work"])
+        
+        signature = update_data.get("signature")
+        update = await tm_tag_update(update_data)
         
-        result = await db.tm_tags.update_one(
+        previous_tag = await db.tm_tags.find_one_and_update(
             {"id": tm_tag_id},
-            {"$set": update_data}
+            update
         )
         
-        if result.modified_count == 1:
-            updated_tag = await db.tm_tags.find_one({"id": tm_tag_id})
+        if previous_tag:
+            updated_tag = {**previous_tag, **update_data}
+            for field in update.get("$unset", {}):
+                updated_tag.pop(field, None)
+            await analytics_rollups.apply("tm_tag", old=previous_tag, new=updated_tag)
+            publish_change("tm_tags", "updated", updated_tag)
+            if signature:
+                updated_tag["signature"] = signature
+            else:
+                await signature_store.hydrate([updated_tag])
             return TMTag(**updated_tag)
         return {"error": "T&M Tag not found"}
         
@@ -514,7 +769,7 @@ async def delete_worker(worker_id: str):
     return {"error": "Worker not found"}
 
 # Project Management Endpoints
-@api_router.post("/projects", response_model=Project)
+@api_router.post("/projects")
 async def create_project(project: ProjectCreate):
     try:
         project_dict = project.dict()
@@ -544,11 +799,8 @@ async def create_project(project: ProjectCreate):
             "updated_at": datetime.now(timezone.utc)
         }
         
-        # Auto-generate GC PIN for new projects
-        gc_pin = generate_project_pin()
-        # Ensure PIN uniqueness
-        while await db.projects.find_one({"gc_pin": gc_pin}):
-            gc_pin = generate_project_pin()
+        # Auto-assign a unique GC PIN from the pool for new projects
+        gc_pin = await pin_allocator.allocate(project_data["id"])
         
         project_data["gc_pin"] = gc_pin
         project_data["gc_pin_used"] = False
@@ -557,17 +809,19 @@ async def create_project(project: ProjectCreate):
         
         logger.info(f"Created project: {project_data['name']} with GC PIN: {gc_pin}")
         
+        # The full project (the frontend adds it to its list as-is) plus its PIN, which Project doesn't carry
         return {
-            "id": project_data["id"],
-            "name": project_data["name"],
-            "status": "success",
+            **Project(**project_data).model_dump(),
             "gc_pin": gc_pin,
+            "gc_pin_used": False,
             "message": f"Project created with GC PIN: {gc_pin}"
         }
     except Exception as e:
         logger.error(f"Error creating project: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+PROJECT_LIST_PROJECTION = {"_id": 0, **{field: 1 for field in Project.model_fields}}
+
 @api_router.get("/projects", response_model=List[Project])
 async def get_projects(status: Optional[str] = None):
     try:
@@ -575,18 +829,10 @@ async def get_projects(status: Optional[str] = None):
         if status:
             query["status"] = status
         
-        projects = await db.projects.find(query).to_list(1000)
-        
-        # Ensure all projects have GC PINs
-        for project in projects:
-            if not project.get("gc_pin"):
-                # Generate PIN for existing project
-                pin = await ensure_project_has_pin(project["id"])
-                if pin:
-                    project["gc_pin"] = pin
-                    project["gc_pin_used"] = False
+        # PINs are assigned on create (legacy projects: migrate_project_pins.py), never on read
+        projects = await db.projects.find(query, PROJECT_LIST_PROJECTION).to_list(1000)
         
-        return [Project(**project) for project in projects]
+        return trusted_response(projects, Project)
     except Exception as e:
         logger.error(f"Error fetching projects: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -615,8 +861,11 @@ async def update_project(project_id: str, project_update: ProjectCreate):
 
 @api_router.delete("/projects/{project_id}")
 async def delete_project(project_id: str):
-    result = await db.projects.delete_one({"id": project_id})
-    if result.deleted_count == 1:
+    deleted_project = await db.projects.find_one_and_delete({"id": project_id})
+    if deleted_project:
+        await analytics_rollups.rollups.delete_one({"project_id": project_id})
+        await pin_allocator.release(deleted_project.get("gc_pin"), project_id)
+        await record_deletions("projects", [{"id": project_id, "project_id": project_id}])
         return {"message": "Project deleted successfully", "id": project_id}
     return {"error": "Project not found"}
 
@@ -627,58 +876,27 @@ async def create_employee(employee: EmployeeCreate):
     employee_obj = Employee(**employee_dict)
     
     # Insert into database
-    result = await db.employees.insert_one(employee_obj.dict())
+    result = await db.employees.insert_one(stamped(employee_obj.dict()))
+    employee_rates.invalidate()
     
     return employee_obj
 
 @api_router.get("/employees", response_model=List[Employee])
-async def get_employees(status: Optional[str] = None):
+async def get_employees(response: Response, status: Optional[str] = None, after: Optional[str] = None, limit: int = 1000):
     query = {}
     if status:
         query["status"] = status
     else:
         query["status"] = "active"  # Default to active employees
     
-    employees = await db.employees.find(query).to_list(1000)
+    employees = await fetch_page(db.employees, query, after, limit, response)
     
-    # Handle schema migration - convert old schema to new schema
-    processed_employees = []
+    # Legacy base_pay/burden_cost documents are converted offline by migrate_employee_schema.py
     for employee in employees:
-        if "_id" in employee:
-            del employee["_id"]  # Remove MongoDB ObjectId
-        
-        # Convert old schema to new schema if needed
-        if "base_pay" in employee and "burden_cost" in employee:
-            # Old schema: convert to new schema
-            total_cost = float(employee.get("base_pay", 0)) + float(employee.get("burden_cost", 0))
-            employee["hourly_rate"] = total_cost
-            employee["gc_billing_rate"] = employee.get("gc_billing_rate", 95.0)
-            
-            # Remove old fields
-            employee.pop("base_pay", None)
-            employee.pop("burden_cost", None)
-            
-            # Update in database to new schema
-            await db.employees.update_one(
-                {"id": employee["id"]},
-                {"$set": {
-                    "hourly_rate": total_cost,
-                    "gc_billing_rate": 95.0
-                }, "$unset": {
-                    "base_pay": "",
-                    "burden_cost": ""
-                }}
-            )
-        
-        # Ensure required fields exist
-        if "hourly_rate" not in employee:
-            employee["hourly_rate"] = 40.0  # Default value
-        if "gc_billing_rate" not in employee:
-            employee["gc_billing_rate"] = 95.0  # Default value
-            
-        processed_employees.append(employee)
+        employee.setdefault("hourly_rate", DEFAULT_HOURLY_RATE)
+        employee.setdefault("gc_billing_rate", 95.0)  # Default value
     
-    return [Employee(**employee) for employee in processed_employees]
+    return trusted_response(employees, Employee, response)
 
 @api_router.get("/employees/{employee_id}")
 async def get_employee(employee_id: str):
@@ -693,44 +911,71 @@ async def update_employee(employee_id: str, employee_update: EmployeeCreate):
     
     result = await db.employees.update_one(
         {"id": employee_id}, 
-        {"$set": update_dict}
+        {"$set": stamped(update_dict)}
     )
     
     if result.modified_count == 1:
+        employee_rates.invalidate()
         updated_employee = await db.employees.find_one({"id": employee_id})
         return Employee(**updated_employee)
     return {"error": "Employee not found"}
 
 @api_router.delete("/employees/{employee_id}")
 async def delete_employee(employee_id: str):
-    result = await db.employees.delete_one({"id": employee_id})
-    if result.deleted_count == 1:
+    deleted_employee = await db.employees.find_one_and_delete({"id": employee_id})
+    if deleted_employee:
+        employee_rates.invalidate()
+        await record_deletions("employees", [deleted_employee])
         return {"message": "Employee deleted successfully", "id": employee_id}
     return {"error": "Employee not found"}
 
 # Crew Logging Endpoints with T&M Integration
 @api_router.post("/crew-logs")
-async def create_crew_log(crew_log_data: dict):
+async def create_crew_log(crew_log_data: dict, idempotency_key: Optional[str] = Header(None)):
     """Create crew log and automatically sync with T&M data"""
+    return await run_idempotent("crew-logs", idempotency_key, crew_log_data, lambda: insert_crew_log(crew_log_data))
+
+def crew_log_total_hours(log: dict) -> float:
+    """Hours on a crew log: its members' totals, or hours_worked for old name-only logs"""
+    total = 0.0
+    for crew_member in log.get("crew_members") or []:
+        if isinstance(crew_member, dict):
+            hours = crew_member.get("total_hours")
+            if hours is None:
+                hours = sum(float(crew_member.get(f"{hour_class}_hours") or 0) for hour_class in ("st", "ot", "dt", "pot"))
+            total += float(hours or 0)
+        elif isinstance(crew_member, str):
+            return float(log.get("hours_worked") or 0)
+    return round(total, 2)
+
+def build_crew_log(crew_log_data: dict, log_id: Optional[str] = None) -> dict:
+    """New crew log document from client data"""
+    return {
+        "id": log_id or str(uuid.uuid4()),
+        "project_id": crew_log_data.get("project_id"),
+        "date": crew_log_data.get("date"),
+        "work_date": normalize_work_date(crew_log_data.get("date")),
+        "crew_members": crew_log_data.get("crew_members", []),
+        "work_description": crew_log_data.get("work_description", ""),
+        "weather_conditions": crew_log_data.get("weather_conditions", "clear"),
+        "expenses": crew_log_data.get("expenses", {}),
+        "created_at": datetime.utcnow(),
+        "synced_to_tm": False
+    }
+
+async def insert_crew_log(crew_log_data: dict):
     try:
         # Create crew log entry
-        crew_log = {
-            "id": str(uuid.uuid4()),
-            "project_id": crew_log_data.get("project_id"),
-            "date": crew_log_data.get("date"),
-            "crew_members": crew_log_data.get("crew_members", []),
-            "work_description": crew_log_data.get("work_description", ""),
-            "weather_conditions": crew_log_data.get("weather_conditions", "clear"),
-            "expenses": crew_log_data.get("expenses", {}),
-            "created_at": datetime.utcnow(),
-            "synced_to_tm": False
-        }
+        crew_log = build_crew_log(crew_log_data)
         
         # Insert crew log
-        await db.crew_logs.insert_one(crew_log)
+        await db.crew_logs.insert_one(stamped(crew_log))
+        await analytics_rollups.apply("crew_log", new=crew_log)
+        publish_change("crew_logs", "created", crew_log)
+        await reclassify_overtime([crew_log])
         
-        # Auto-sync to T&M if project has active T&M tag for same date
-        await sync_crew_log_to_tm(crew_log)
+        # Auto-sync to T&M in the background (creates the tag if none exists for the date)
+        await sync_queue.enqueue("crew_log_to_tm", crew_log["project_id"], crew_log["work_date"], crew_log["id"])
         
         return {"message": "Crew log created successfully", "id": crew_log["id"]}
         
@@ -738,40 +983,57 @@ async def create_crew_log(crew_log_data: dict):
         return {"error": str(e)}
 
 @api_router.get("/crew-logs")
-async def get_crew_logs(project_id: Optional[str] = None, date: Optional[str] = None):
+async def get_crew_logs(response: Response, project_id: Optional[str] = None, date: Optional[str] = None,
+                        after: Optional[str] = None, limit: int = 1000, fields: Optional[str] = None):
     """Get crew logs with optional filtering"""
     query = {}
     if project_id:
         query["project_id"] = project_id
     if date:
         query["date"] = date
-        
-    crew_logs = await db.crew_logs.find(query).to_list(1000)
     
-    # Convert to serializable format
-    serializable_logs = []
-    for log in crew_logs:
-        if "_id" in log:
-            del log["_id"]  # Remove MongoDB ObjectId
-        serializable_logs.append(log)
+    projection, view = resolve_fields(fields, CrewLog, {"summary": CrewLogSummary})
+    if view is CrewLogSummary:
+        projection["hours_worked"] = 1  # Old name-only logs keep their hours at the log level
+    crew_logs = await fetch_page(db.crew_logs, query, after, limit, response, projection)
+    if view is CrewLogSummary:
+        for log in crew_logs:
+            log["total_hours"] = crew_log_total_hours(log)
+    if view:
+        return projected_response(crew_logs, view, response)
     
-    return serializable_logs
+    # No response_model here: crew logs go out as stored, minus the ObjectId
+    for log in crew_logs:
+        log.pop("_id", None)
+    return FastJSONResponse(content=crew_logs, headers=cursor_headers(response))
+
+@api_router.get("/crew-logs/export")
+async def export_crew_logs(project_id: str, format: str = "ndjson"):
+    """Stream a project's full crew log history, one row per crew member"""
+    cursor = db.crew_logs.find({"project_id": project_id}, {"_id": 0}).sort(PAGE_SORT)
+    return export_response(cursor, flatten_crew_log, CREW_LOG_EXPORT_COLUMNS, format, f"crew_logs_{project_id}")
 
 @api_router.put("/crew-logs/{log_id}")
 async def update_crew_log(log_id: str, crew_log_data: dict):
     """Update crew log and sync changes to T&M if linked"""
     try:
         crew_log_data["updated_at"] = datetime.utcnow()
+        if "date" in crew_log_data:
+            crew_log_data["work_date"] = normalize_work_date(crew_log_data["date"])
         
-        result = await db.crew_logs.update_one(
+        previous_log = await db.crew_logs.find_one_and_update(
             {"id": log_id},
             {"$set": crew_log_data}
         )
         
-        if result.modified_count == 1:
-            # Re-sync to T&M tags
-            updated_log = await db.crew_logs.find_one({"id": log_id})
-            await sync_crew_log_to_tm(updated_log)
+        if previous_log:
+            updated_log = {**previous_log, **crew_log_data}
+            await analytics_rollups.apply("crew_log", old=previous_log, new=updated_log)
+            publish_change("crew_logs", "updated", updated_log)
+            await reclassify_overtime([previous_log, updated_log])
+            
+            # Re-sync to T&M tags in the background
+            await sync_queue.enqueue("crew_log_to_tm", updated_log.get("project_id"), updated_log.get("work_date"), log_id)
             
             return {"message": "Crew log updated successfully"}
         return {"error": "Crew log not found"}
@@ -783,9 +1045,11 @@ async def update_crew_log(log_id: str, crew_log_data: dict):
 async def delete_crew_log(log_id: str):
     """Delete crew log"""
     try:
-        result = await db.crew_logs.delete_one({"id": log_id})
+        deleted_log = await db.crew_logs.find_one_and_delete({"id": log_id})
         
-        if result.deleted_count == 1:
+        if deleted_log:
+            await analytics_rollups.apply("crew_log", old=deleted_log)
+            await record_deletions("crew_logs", [deleted_log])
             return {"message": "Crew log deleted successfully"}
         return {"error": "Crew log not found"}
         
@@ -815,240 +1079,299 @@ async def manual_sync_crew_log(log_id: str):
         logger.error(f"Manual sync error for log {log_id}: {e}")
         return {"error": str(e)}
 
+def normalize_work_date(value):
+    """Canonical YYYY-MM-DD key for a crew log / T&M tag date (string or datetime)"""
+    if not value:
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return value.split("T")[0] if isinstance(value, str) else str(value)
+
 async def sync_crew_log_to_tm(crew_log):
-    """Sync crew log data to T&M tags - create if doesn't exist"""
-    try:
-        project_id = crew_log.get("project_id")
-        log_date = crew_log.get("date")
+    """Sync crew log data to T&M tags - create if doesn't exist. Errors propagate so the sync queue retries"""
+    project_id = crew_log.get("project_id")
+    log_date = crew_log.get("date")
+    
+    logger.info(f"Starting sync for crew log {crew_log.get('id')} - Project: {project_id}, Date: {log_date}")
+    
+    if not project_id or not log_date:
+        logger.error(f"Missing required data - project_id: {project_id}, log_date: {log_date}")
+        return
         
-        logger.info(f"Starting sync for crew log {crew_log.get('id')} - Project: {project_id}, Date: {log_date}")
+    # Get date string for comparison
+    date_str = normalize_work_date(log_date)
         
-        if not project_id or not log_date:
-            logger.error(f"Missing required data - project_id: {project_id}, log_date: {log_date}")
-            return
-            
-        # Get date string for comparison
-        if hasattr(log_date, 'strftime'):
-            date_str = log_date.strftime('%Y-%m-%d')
-        else:
-            date_str = log_date.split("T")[0] if isinstance(log_date, str) else str(log_date)
-            
-        logger.info(f"Looking for T&M tag with project_id: {project_id}, date: {date_str}")
-            
-        # Check if T&M tag exists for same project and date
-        # Use a safer approach that handles both string and date formats
-        # First try to find by string match (most common case)
-        tm_tag = await db.tm_tags.find_one({
-            "project_id": project_id,
-            "date_of_work": {"$regex": f"^{date_str}"}
-        })
+    logger.info(f"Looking for T&M tag with project_id: {project_id}, date: {date_str}")
         
-        # If not found, try to find by date conversion (only if no string matches exist)
-        if not tm_tag:
-            try:
-                tm_tag = await db.tm_tags.find_one({
-                    "project_id": project_id,
-                    "$expr": {
-                        "$eq": [
-                            {"$dateToString": {"format": "%Y-%m-%d", "date": "$date_of_work"}},
-                            date_str
-                        ]
-                    }
-                })
-            except Exception as date_query_error:
-                logger.warning(f"Date query failed (expected for string dates): {date_query_error}")
-                # This is expected when date_of_work is stored as string
+    # Point lookup on the (project_id, work_date) index
+    tm_tag = await db.tm_tags.find_one({
+        "project_id": project_id,
+        "work_date": date_str
+    })
+    
+    if tm_tag:
+        logger.info(f"Found existing T&M tag: {tm_tag.get('id')}, updating with crew log data")
+        # Update existing T&M tag with crew log data
+        labor_entries = []
+        for crew_member in crew_log.get("crew_members", []):
+            labor_entry = {
+                "id": str(uuid.uuid4()),
+                "worker_name": crew_member.get("name"),
+                "quantity": 1,
+                "st_hours": float(crew_member.get("st_hours", 0)),
+                "ot_hours": float(crew_member.get("ot_hours", 0)),
+                "dt_hours": float(crew_member.get("dt_hours", 0)),
+                "pot_hours": float(crew_member.get("pot_hours", 0)),
+                "total_hours": float(crew_member.get("total_hours", 0)),
+                "date": log_date
+            }
+            labor_entries.append(labor_entry)
+        
+        # Update T&M tag with crew data
+        tag_update = {
+            "labor_entries": labor_entries,
+            "description_of_work": crew_log.get("work_description", tm_tag.get("description_of_work", "")),
+            "crew_log_synced": True,
+            "status": "approved"  # Auto-approve when synced from crew log
+        }
+        await db.tm_tags.update_one(
+            {"id": tm_tag["id"]},
+            {"$set": stamped(tag_update)}
+        )
+        await analytics_rollups.apply("tm_tag", old=tm_tag, new={**tm_tag, **tag_update})
+        publish_change("tm_tags", "updated", tm_tag)
         
-        if tm_tag:
-            logger.info(f"Found existing T&M tag: {tm_tag.get('id')}, updating with crew log data")
-            # Update existing T&M tag with crew log data
-            labor_entries = []
-            for crew_member in crew_log.get("crew_members", []):
-                labor_entry = {
-                    "id": str(uuid.uuid4()),
-                    "worker_name": crew_member.get("name"),
-                    "quantity": 1,
-                    "st_hours": float(crew_member.get("st_hours", 0)),
-                    "ot_hours": float(crew_member.get("ot_hours", 0)),
-                    "dt_hours": float(crew_member.get("dt_hours", 0)),
-                    "pot_hours": float(crew_member.get("pot_hours", 0)),
-                    "total_hours": float(crew_member.get("total_hours", 0)),
-                    "date": log_date
-                }
-                labor_entries.append(labor_entry)
-            
-            # Update T&M tag with crew data
-            await db.tm_tags.update_one(
-                {"id": tm_tag["id"]},
-                {"$set": {
-                    "labor_entries": labor_entries,
-                    "description_of_work": crew_log.get("work_description", tm_tag.get("description_of_work", "")),
-                    "crew_log_synced": True,
-                    "status": "approved"  # Auto-approve when synced from crew log
-                }}
-            )
-            
-            # Mark crew log as synced
-            await db.crew_logs.update_one(
-                {"id": crew_log["id"]},
-                {"$set": {"synced_to_tm": True, "tm_tag_id": tm_tag["id"]}}
-            )
-            logger.info(f"Successfully updated existing T&M tag and marked crew log as synced")
-        else:
-            logger.info(f"No existing T&M tag found, creating new one")
-            # Create new T&M tag from crew log data
-            # Get project details for T&M tag
-            project = await db.projects.find_one({"id": project_id})
-            if not project:
-                logger.error(f"Project not found for ID: {project_id}")
-                return
-                
-            logger.info(f"Found project: {project.get('name')}")
-            
-            labor_entries = []
-            for crew_member in crew_log.get("crew_members", []):
-                labor_entry = {
-                    "id": str(uuid.uuid4()),
-                    "worker_name": crew_member.get("name"),
-                    "quantity": 1,
-                    "st_hours": float(crew_member.get("st_hours", 0)),
-                    "ot_hours": float(crew_member.get("ot_hours", 0)),
-                    "dt_hours": float(crew_member.get("dt_hours", 0)),
-                    "pot_hours": float(crew_member.get("pot_hours", 0)),
-                    "total_hours": float(crew_member.get("total_hours", 0)),
-                    "date": log_date
-                }
-                labor_entries.append(labor_entry)
+        # Mark crew log as synced
+        await db.crew_logs.update_one(
+            {"id": crew_log["id"]},
+            {"$set": stamped({"synced_to_tm": True, "tm_tag_id": tm_tag["id"]})}
+        )
+        publish_change("crew_logs", "updated", crew_log)
+        logger.info(f"Successfully updated existing T&M tag and marked crew log as synced")
+    else:
+        logger.info(f"No existing T&M tag found, creating new one")
+        # Create new T&M tag from crew log data
+        # Get project details for T&M tag
+        project = await db.projects.find_one({"id": project_id})
+        if not project:
+            logger.error(f"Project not found for ID: {project_id}")
+            return
             
-            new_tm_tag = {
+        logger.info(f"Found project: {project.get('name')}")
+        
+        labor_entries = []
+        for crew_member in crew_log.get("crew_members", []):
+            labor_entry = {
                 "id": str(uuid.uuid4()),
-                "project_id": project_id,
-                "project_name": project.get("name", ""),
-                "cost_code": "",
-                "date_of_work": date_str,  # Use the processed date string to ensure consistency
-                "company_name": project.get("client_company", ""),
-                "tm_tag_title": f"Auto-generated from Crew Log - {date_str}",
-                "description_of_work": crew_log.get("work_description", ""),
-                "labor_entries": labor_entries,
-                "material_entries": [],
-                "equipment_entries": [],
-                "other_entries": [],
-                "gc_email": project.get("gc_email", ""),
-                "signature": None,
-                "foreman_name": crew_log.get("crew_members", [{}])[0].get("name", "Unknown") if crew_log.get("crew_members") else "Unknown",
-                "status": "pending_review",  # Needs review since auto-generated
-                "created_at": datetime.now(timezone.utc),
-                "submitted_at": datetime.now(timezone.utc),
-                "crew_log_synced": True
+                "worker_name": crew_member.get("name"),
+                "quantity": 1,
+                "st_hours": float(crew_member.get("st_hours", 0)),
+                "ot_hours": float(crew_member.get("ot_hours", 0)),
+                "dt_hours": float(crew_member.get("dt_hours", 0)),
+                "pot_hours": float(crew_member.get("pot_hours", 0)),
+                "total_hours": float(crew_member.get("total_hours", 0)),
+                "date": log_date
             }
-            
-            await db.tm_tags.insert_one(new_tm_tag)
-            logger.info(f"Created new T&M tag: {new_tm_tag['id']}")
-            
-            # Mark crew log as synced
-            await db.crew_logs.update_one(
-                {"id": crew_log["id"]},
-                {"$set": {"synced_to_tm": True, "tm_tag_id": new_tm_tag["id"]}}
-            )
-            logger.info(f"Marked crew log {crew_log['id']} as synced")
-            
-    except Exception as e:
-        logger.error(f"Error syncing crew log to T&M: {e}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+            labor_entries.append(labor_entry)
+        
+        new_tm_tag = {
+            "id": str(uuid.uuid4()),
+            "project_id": project_id,
+            "project_name": project.get("name", ""),
+            "cost_code": "",
+            "date_of_work": date_str,  # Use the processed date string to ensure consistency
+            "work_date": date_str,
+            "company_name": project.get("client_company", ""),
+            "tm_tag_title": f"Auto-generated from Crew Log - {date_str}",
+            "description_of_work": crew_log.get("work_description", ""),
+            "labor_entries": labor_entries,
+            "material_entries": [],
+            "equipment_entries": [],
+            "other_entries": [],
+            "gc_email": project.get("gc_email", ""),
+            "signature": None,
+            "foreman_name": crew_log.get("crew_members", [{}])[0].get("name", "Unknown") if crew_log.get("crew_members") else "Unknown",
+            "status": "pending_review",  # Needs review since auto-generated
+            "created_at": datetime.now(timezone.utc),
+            "submitted_at": datetime.now(timezone.utc),
+            "crew_log_synced": True
+        }
+        
+        await db.tm_tags.insert_one(stamped(new_tm_tag))
+        await analytics_rollups.apply("tm_tag", new=new_tm_tag)
+        publish_change("tm_tags", "created", new_tm_tag)
+        logger.info(f"Created new T&M tag: {new_tm_tag['id']}")
+        
+        # Mark crew log as synced
+        await db.crew_logs.update_one(
+            {"id": crew_log["id"]},
+            {"$set": stamped({"synced_to_tm": True, "tm_tag_id": new_tm_tag["id"]})}
+        )
+        publish_change("crew_logs", "updated", crew_log)
+        logger.info(f"Marked crew log {crew_log['id']} as synced")
+
+
+def crew_log_from_tm_tag(tm_tag, date_str):
+    """Build a pending-review crew log document from a T&M tag's labor entries"""
+    crew_members = []
+    for labor_entry in tm_tag.get("labor_entries", []):
+        crew_member = {
+            "name": labor_entry.get("worker_name"),
+            "st_hours": labor_entry.get("st_hours", 0),
+            "ot_hours": labor_entry.get("ot_hours", 0),
+            "dt_hours": labor_entry.get("dt_hours", 0),
+            "pot_hours": labor_entry.get("pot_hours", 0),
+            "total_hours": labor_entry.get("total_hours", 0)
+        }
+        crew_members.append(crew_member)
+    
+    return {
+        "id": str(uuid.uuid4()),
+        "project_id": tm_tag.get("project_id"),
+        "date": tm_tag.get("date_of_work"),
+        "work_date": date_str,
+        "crew_members": crew_members,
+        "work_description": tm_tag.get("description_of_work", ""),
+        "weather_conditions": "clear",
+        "expenses": {},
+        "created_at": datetime.utcnow(),
+        "synced_from_tm": True,
+        "tm_tag_id": tm_tag["id"],
+        "synced_to_tm": True,  # Already synced since it came from T&M
+        "status": "pending_review"  # Needs review since auto-generated
+    }
 
 async def sync_tm_to_crew_log(tm_tag):
-    """Sync T&M tag labor data to crew logs - create if doesn't exist"""
+    """Sync T&M tag labor data to crew logs - create if doesn't exist. Errors propagate so the sync queue retries"""
+    project_id = tm_tag.get("project_id")
+    work_date = tm_tag.get("date_of_work")
+    
+    if not project_id or not work_date:
+        return
+        
+    # Get date string for comparison
+    date_str = normalize_work_date(work_date)
+        
+    # Point lookup on the (project_id, work_date) index
+    crew_log = await db.crew_logs.find_one({
+        "project_id": project_id,
+        "work_date": date_str
+    })
+    
+    if not crew_log:
+        # Create new crew log from T&M data
+        new_crew_log = crew_log_from_tm_tag(tm_tag, date_str)
+        await db.crew_logs.insert_one(stamped(new_crew_log))
+        await analytics_rollups.apply("crew_log", new=new_crew_log)
+        publish_change("crew_logs", "created", new_crew_log)
+
+async def sync_tm_tags_to_crew_logs(tm_tags):
+    """Batched sync_tm_to_crew_log: one lookup and one insert for every (project_id, work_date) pair;
+    a failed batch falls back to queued per-tag syncs"""
     try:
-        project_id = tm_tag.get("project_id")
-        work_date = tm_tag.get("date_of_work")
+        # First tag per pair wins, matching the sequential per-tag sync
+        tags_by_pair = {}
+        for tm_tag in tm_tags:
+            if tm_tag.get("project_id") and tm_tag.get("work_date"):
+                tags_by_pair.setdefault((tm_tag["project_id"], tm_tag["work_date"]), tm_tag)
+        
+        if not tags_by_pair:
+            return 0
+        
+        dates_by_project = {}
+        for project_id, work_date in tags_by_pair:
+            dates_by_project.setdefault(project_id, []).append(work_date)
+        
+        existing_logs = await db.crew_logs.find(
+            {"$or": [
+                {"project_id": project_id, "work_date": {"$in": dates}}
+                for project_id, dates in dates_by_project.items()
+            ]},
+            {"_id": 0, "project_id": 1, "work_date": 1}
+        ).to_list(None)
+        existing_pairs = {(log["project_id"], log["work_date"]) for log in existing_logs}
+        
+        new_crew_logs = [
+            crew_log_from_tm_tag(tm_tag, work_date)
+            for (project_id, work_date), tm_tag in tags_by_pair.items()
+            if (project_id, work_date) not in existing_pairs
+        ]
         
-        if not project_id or not work_date:
-            return
-            
-        # Get date string for comparison
-        if hasattr(work_date, 'strftime'):
-            date_str = work_date.strftime('%Y-%m-%d')
-        else:
-            date_str = work_date.split("T")[0] if isinstance(work_date, str) else str(work_date)
-            
-        # Check if crew log exists for same project and date
-        # Use a safer approach that handles both string and date formats
-        # First try to find by string match (most common case)
-        crew_log = await db.crew_logs.find_one({
-            "project_id": project_id,
-            "date": {"$regex": f"^{date_str}"}
-        })
+        if new_crew_logs:
+            await db.crew_logs.insert_many([stamped(crew_log) for crew_log in new_crew_logs])
+            await analytics_rollups.apply_many("crew_log", new_crew_logs)
+            for crew_log in new_crew_logs:
+                publish_change("crew_logs", "created", crew_log)
         
-        # If not found, try to find by date conversion (only if no string matches exist)
-        if not crew_log:
-            try:
-                crew_log = await db.crew_logs.find_one({
-                    "project_id": project_id,
-                    "$expr": {
-                        "$eq": [
-                            {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
-                            date_str
-                        ]
-                    }
-                })
-            except Exception as date_query_error:
-                logger.warning(f"Date query failed (expected for string dates): {date_query_error}")
-                # This is expected when date is stored as string
+        return len(new_crew_logs)
         
-        if not crew_log:
-            # Create new crew log from T&M data
-            crew_members = []
-            for labor_entry in tm_tag.get("labor_entries", []):
-                crew_member = {
-                    "name": labor_entry.get("worker_name"),
-                    "st_hours": labor_entry.get("st_hours", 0),
-                    "ot_hours": labor_entry.get("ot_hours", 0),
-                    "dt_hours": labor_entry.get("dt_hours", 0),
-                    "pot_hours": labor_entry.get("pot_hours", 0),
-                    "total_hours": labor_entry.get("total_hours", 0)
-                }
-                crew_members.append(crew_member)
-            
-            new_crew_log = {
-                "id": str(uuid.uuid4()),
-                "project_id": project_id,
-                "date": work_date,
-                "crew_members": crew_members,
-                "work_description": tm_tag.get("description_of_work", ""),
-                "weather_conditions": "clear",
-                "expenses": {},
-                "created_at": datetime.utcnow(),
-                "synced_from_tm": True,
-                "tm_tag_id": tm_tag["id"],
-                "synced_to_tm": True,  # Already synced since it came from T&M
-                "status": "pending_review"  # Needs review since auto-generated
-            }
-            
-            await db.crew_logs.insert_one(new_crew_log)
-            
     except Exception as e:
-        print(f"Error syncing T&M to crew log: {e}")
+        # Hand every tag to the sync queue so the failed batch is retried one tag at a time
+        logger.error(f"Error batch syncing T&M tags to crew logs, queueing per-tag syncs: {e}")
+        for tm_tag in tm_tags:
+            await sync_queue.enqueue("tm_to_crew_log", tm_tag.get("project_id"), tm_tag.get("work_date"), tm_tag["id"])
+        return 0
+
+async def run_sync_job(job):
+    """Sync queue handler: re-read the source document and run the matching sync"""
+    if job["kind"] == "crew_log_to_tm":
+        crew_log = await db.crew_logs.find_one({"id": job["source_id"]})
+        if crew_log:
+            await sync_crew_log_to_tm(crew_log)
+    elif job["kind"] == "tm_to_crew_log":
+        tm_tag = await db.tm_tags.find_one({"id": job["source_id"]})
+        if tm_tag:
+            await sync_tm_to_crew_log(tm_tag)
+
+analytics_rollups = AnalyticsRollups(db)
+
+employee_rates = EmployeeRateCache(db, ttl=float(os.environ.get('EMPLOYEE_RATE_CACHE_TTL', '300')))
+
+@api_router.get("/employee-rates/stats")
+async def get_employee_rate_cache_stats():
+    """Employee rate cache size and hit/miss counters"""
+    return employee_rates.stats()
+
+sync_queue = SyncQueue(
+    db,
+    {"crew_log_to_tm": run_sync_job, "tm_to_crew_log": run_sync_job},
+    workers=int(os.environ.get('SYNC_WORKERS', '2')),
+    poll_interval=float(os.environ.get('SYNC_POLL_INTERVAL', '5'))
+)
+
+@api_router.get("/sync/stats")
+async def get_sync_stats():
+    """Crew log <-> T&M sync queue depth and lag"""
+    return await sync_queue.stats()
 
 # Material Purchase Endpoints
 @api_router.post("/materials", response_model=MaterialPurchase)
-async def create_material_purchase(material: MaterialPurchaseCreate):
+async def create_material_purchase(material: MaterialPurchaseCreate, idempotency_key: Optional[str] = Header(None)):
+    return await run_idempotent("materials", idempotency_key, material, lambda: insert_material_purchase(material))
+
+async def insert_material_purchase(material: MaterialPurchaseCreate):
     material_dict = material.dict()
     material_obj = MaterialPurchase(**material_dict)
     
     # Insert into database
-    result = await db.materials.insert_one(material_obj.dict())
+    material_doc = material_obj.dict()
+    result = await db.materials.insert_one(stamped(material_doc))
+    await analytics_rollups.apply("material", new=material_doc)
     
     return material_obj
 
 @api_router.get("/materials", response_model=List[MaterialPurchase])
-async def get_materials(project_id: Optional[str] = None, skip: int = 0, limit: int = 100):
+async def get_materials(response: Response, project_id: Optional[str] = None, after: Optional[str] = None, limit: int = 100,
+                        fields: Optional[str] = None):
     query = {}
     if project_id:
         query["project_id"] = project_id
     
-    materials = await db.materials.find(query).skip(skip).limit(limit).to_list(limit)
-    return [MaterialPurchase(**material) for material in materials]
+    projection, view = resolve_fields(fields, MaterialPurchase, {"summary": MaterialPurchaseSummary})
+    materials = await fetch_page(db.materials, query, after, limit, response, projection)
+    if view:
+        return projected_response(materials, view, response)
+    return trusted_response(materials, MaterialPurchase, response)
 
 @api_router.get("/materials/{material_id}")
 async def get_material(material_id: str):
@@ -1059,11 +1382,309 @@ async def get_material(material_id: str):
 
 @api_router.delete("/materials/{material_id}")
 async def delete_material(material_id: str):
-    result = await db.materials.delete_one({"id": material_id})
-    if result.deleted_count == 1:
+    deleted_material = await db.materials.find_one_and_delete({"id": material_id})
+    if deleted_material:
+        await analytics_rollups.apply("material", old=deleted_material)
+        await record_deletions("materials", [deleted_material])
         return {"message": "Material purchase deleted successfully", "id": material_id}
     return {"error": "Material purchase not found"}
 
+# Delta sync for the offline-capable frontend
+SYNC_COLLECTIONS = ("tm_tags", "crew_logs", "materials")
+SYNC_ROLLUP_KINDS = {"tm_tags": "tm_tag", "crew_logs": "crew_log", "materials": "material"}
+SYNC_JOBS = {"tm_tags": "tm_to_crew_log", "crew_logs": "crew_log_to_tm"}
+SYNC_PROTECTED_FIELDS = ("_id", "id", "created_at")
+MAX_SYNC_OPERATIONS = 500
+SYNC_PAGE_SIZE = 500  # Documents per collection in one sync response; more come back with a cursor
+SYNC_TOMBSTONE_DAYS = 30
+SYNC_WATERMARK_OVERLAP = timedelta(seconds=5)  # Re-send writes that committed just behind the previous watermark
+
+class SyncOperation(BaseModel):
+    op: str  # create, update or delete
+    collection: str  # tm_tags, crew_logs or materials
+    id: Optional[str] = None  # Client-generated on create, so a replayed create can't duplicate
+    data: dict = {}
+
+class SyncRequest(BaseModel):
+    since: Optional[str] = None  # watermark from the previous sync; omit for a full download (needs project_id)
+    project_id: Optional[str] = None
+    cursor: Optional[str] = None  # from a response with has_more, to fetch the next page of changes
+    limit: int = SYNC_PAGE_SIZE
+    operations: List[SyncOperation] = []
+
+async def record_deletions(collection: str, docs: List[dict]):
+    """Tombstones that tell delta-sync and change feed clients which documents were deleted"""
+    if docs:
+        now = datetime.utcnow()
+        await db.sync_tombstones.insert_many([
+            {"collection": collection, "id": doc.get("id"), "project_id": doc.get("project_id"), "deleted_at": now}
+            for doc in docs
+        ])
+        for doc in docs:
+            publish_change(collection, "deleted", doc)
+
+def parse_watermark(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid since watermark: {value}")
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed - SYNC_WATERMARK_OVERLAP
+
+async def build_sync_document(collection: str, operation: SyncOperation) -> dict:
+    """Document for a synced create, built the same way as the create endpoints build theirs"""
+    if collection == "crew_logs":
+        return build_crew_log(operation.data, operation.id)
+    
+    if collection == "tm_tags":
+        fields = TMTagCreate(**operation.data).dict()
+    else:
+        fields = MaterialPurchaseCreate(**operation.data).dict()
+    if operation.id:
+        fields["id"] = operation.id
+    
+    if collection == "tm_tags":
+        doc = TMTag(**fields).dict()
+        doc["submitted_at"] = datetime.utcnow()
+        doc["work_date"] = normalize_work_date(doc["date_of_work"])
+        return await signature_store.extract(doc)
+    return MaterialPurchase(**fields).dict()
+
+async def sync_creates(collection: str, operations: list, results: list):
+    docs = {}
+    for index, operation in operations:
+        try:
+            docs[index] = await build_sync_document(collection, operation)
+        except ValidationError as e:
+            results[index] = {"status": "rejected", "error": str(e)}
+    
+    # Replayed creates (same client id) are acknowledged, not inserted twice
+    existing = set(await db[collection].distinct("id", {"id": {"$in": [doc["id"] for doc in docs.values()]}}))
+    new_docs = []
+    for index, doc in docs.items():
+        results[index] = {"status": "exists" if doc["id"] in existing else "applied", "id": doc["id"]}
+        if doc["id"] not in existing:
+            existing.add(doc["id"])
+            new_docs.append(doc)
+    
+    if new_docs:
+        await db[collection].insert_many([stamped(doc) for doc in new_docs], ordered=False)
+        await analytics_rollups.apply_many(SYNC_ROLLUP_KINDS[collection], new_docs)
+        for doc in new_docs:
+            publish_change(collection, "created", doc)
+        if collection == "crew_logs":
+            await reclassify_overtime(new_docs)
+        if collection in SYNC_JOBS:
+            for doc in new_docs:
+                await sync_queue.enqueue(SYNC_JOBS[collection], doc.get("project_id"), doc.get("work_date"), doc["id"])
+
+async def sync_updates(collection: str, operations: list, results: list):
+    current = {
+        doc["id"]: doc
+        async for doc in db[collection].find({"id": {"$in": [operation.id for _, operation in operations]}})
+    }
+    
+    writes = []
+    changed = []
+    for index, operation in operations:
+        previous = current.get(operation.id)
+        if previous is None:
+            results[index] = {"status": "not_found", "id": operation.id}
+            continue
+        
+        update_data = {key: value for key, value in operation.data.items() if key not in SYNC_PROTECTED_FIELDS}
+        update_data["updated_at"] = datetime.utcnow()
+        if collection == "tm_tags" and "date_of_work" in update_data:
+            update_data["work_date"] = normalize_work_date(update_data["date_of_work"])
+        if collection == "crew_logs" and "date" in update_data:
+            update_data["work_date"] = normalize_work_date(update_data["date"])
+        update = await tm_tag_update(update_data) if collection == "tm_tags" else {"$set": update_data}
+        writes.append(UpdateOne({"id": operation.id}, update))
+        
+        updated = {**previous, **update_data}
+        for field in update.get("$unset", {}):
+            updated.pop(field, None)
+        current[operation.id] = updated  # Later updates to the same document build on this one
+        changed.append((previous, updated))
+        results[index] = {"status": "applied", "id": operation.id}
+    
+    if writes:
+        await db[collection].bulk_write(writes, ordered=True)
+    for previous, updated in changed:
+        await analytics_rollups.apply(SYNC_ROLLUP_KINDS[collection], old=previous, new=updated)
+        publish_change(collection, "updated", updated)
+        if collection == "crew_logs":
+            await reclassify_overtime([previous, updated])
+            await sync_queue.enqueue("crew_log_to_tm", updated.get("project_id"), updated.get("work_date"), updated["id"])
+
+async def sync_deletes(collection: str, operations: list, results: list):
+    ids = list({operation.id for _, operation in operations})
+    deleted = await db[collection].find({"id": {"$in": ids}}).to_list(len(ids))
+    if deleted:
+        await db[collection].delete_many({"id": {"$in": [doc["id"] for doc in deleted]}})
+        for doc in deleted:
+            await analytics_rollups.apply(SYNC_ROLLUP_KINDS[collection], old=doc)
+        await record_deletions(collection, deleted)
+    
+    found = {doc["id"] for doc in deleted}
+    for index, operation in operations:
+        results[index] = {"status": "applied" if operation.id in found else "not_found", "id": operation.id}
+
+def encode_sync_cursor(watermark: datetime, positions: dict) -> str:
+    """Opaque sync cursor: the first page's watermark plus a keyset position per collection with more to send"""
+    return base64.urlsafe_b64encode(json.dumps([watermark.isoformat(), positions]).encode()).decode()
+
+def decode_sync_cursor(cursor: str):
+    try:
+        watermark, positions = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(watermark), positions
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+
+async def collect_changes(since: Optional[datetime], project_id: Optional[str], positions: dict, limit: int):
+    """One page of documents written since the watermark per collection, and ids deleted since then
+
+    positions maps each collection still being paged to its keyset cursor (None: from the start).
+    Returns the changes and the positions for the next page ({} when everything was sent).
+    """
+    scope = {"project_id": project_id} if project_id else {}
+    changed = {**scope, "$or": [{"updated_at": {"$gt": since}}, {"created_at": {"$gt": since}}]} if since else scope
+    
+    async def page(collection):
+        if collection not in positions:
+            return []
+        query = keyset_filter(changed, positions[collection])
+        projection = TM_TAG_LIST_PROJECTION if collection == "tm_tags" else {"_id": 0}
+        return await db[collection].find(query, projection).sort(PAGE_SORT).limit(limit + 1).to_list(limit + 1)
+    
+    pages = dict(zip(SYNC_COLLECTIONS, await asyncio.gather(*(page(collection) for collection in SYNC_COLLECTIONS))))
+    next_positions = {}
+    for collection, docs in pages.items():
+        if len(docs) > limit:
+            del docs[limit:]
+            next_positions[collection] = encode_cursor(docs[-1])
+    
+    changes = {
+        "tm_tags": trusted_rows(pages["tm_tags"], TMTag),
+        "crew_logs": pages["crew_logs"],  # Crew logs are stored and served as-is
+        "materials": trusted_rows(pages["materials"], MaterialPurchase),
+        "deleted": {collection: [] for collection in SYNC_COLLECTIONS}
+    }
+    
+    # Deletes are small and go out in full with the first page
+    first_page = all(position is None for position in positions.values())
+    if since and first_page:
+        tombstones = {**scope, "collection": {"$in": list(SYNC_COLLECTIONS)}, "deleted_at": {"$gt": since}}
+        async for tombstone in db.sync_tombstones.find(tombstones, {"collection": 1, "id": 1}):
+            changes["deleted"][tombstone["collection"]].append(tombstone["id"])
+    return changes, next_positions
+
+@api_router.post("/sync")
+async def delta_sync(sync_request: SyncRequest):
+    """Apply a batch of queued offline writes, then return what changed on the server since the client's watermark"""
+    operations = sync_request.operations
+    if len(operations) > MAX_SYNC_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SYNC_OPERATIONS} operations per sync")
+    since = parse_watermark(sync_request.since)
+    if since and since < datetime.utcnow() - timedelta(days=SYNC_TOMBSTONE_DAYS):
+        since = None  # Tombstones that old have expired; only a full download is safe
+    if since is None and not sync_request.project_id:
+        raise HTTPException(status_code=400, detail="project_id is required for a full download (no since watermark, or one older than the tombstone window)")
+    limit = max(1, min(sync_request.limit, SYNC_PAGE_SIZE))
+    
+    results = [None] * len(operations)
+    for index, operation in enumerate(operations):
+        if operation.collection not in SYNC_COLLECTIONS or operation.op not in ("create", "update", "delete"):
+            results[index] = {"status": "rejected", "error": f"Unsupported operation {operation.op} on {operation.collection}"}
+        elif operation.op != "create" and not operation.id:
+            results[index] = {"status": "rejected", "error": f"{operation.op} requires an id"}
+    
+    # Per collection: all creates, then updates, then deletes - each phase one bulk write
+    for collection in SYNC_COLLECTIONS:
+        for op, apply in (("create", sync_creates), ("update", sync_updates), ("delete", sync_deletes)):
+            batch = [
+                (index, operation) for index, operation in enumerate(operations)
+                if results[index] is None and operation.collection == collection and operation.op == op
+            ]
+            if batch:
+                await apply(collection, batch, results)
+    
+    if sync_request.cursor:
+        # Later pages keep the first page's watermark, so writes made while paging are re-sent next sync
+        watermark, positions = decode_sync_cursor(sync_request.cursor)
+        positions = {collection: position for collection, position in positions.items() if collection in SYNC_COLLECTIONS}
+    else:
+        # Taken before reading, so anything written during the read is re-sent next time
+        watermark = datetime.utcnow()
+        positions = {collection: None for collection in SYNC_COLLECTIONS}
+    changes, next_positions = await collect_changes(since, sync_request.project_id, positions, limit)
+    
+    return FastJSONResponse(content={
+        "watermark": watermark.isoformat(),
+        "full": since is None,  # changes hold every document in scope; replace local state
+        "results": [{"index": index, **result} for index, result in enumerate(results)],
+        "changes": changes,
+        # More changes: repeat the request (same since, no operations) with this cursor until has_more is false
+        "has_more": bool(next_positions),
+        "cursor": encode_sync_cursor(watermark, next_positions) if next_positions else None
+    })
+
+# Change feed: ids and versions of documents written since a timestamp (collections in service_change_feed)
+@api_router.get("/changes")
+async def get_changes(since: str, collections: Optional[str] = None, project_id: Optional[str] = None):
+    """Ids and versions (updated_at) written since a timestamp, and ids deleted since then, so screens refresh only changed rows"""
+    since_at = parse_watermark(since)
+    names = [name.strip() for name in collections.split(",") if name.strip()] if collections else list(CHANGE_FEED_COLLECTIONS)
+    unknown = [name for name in names if name not in CHANGE_FEED_COLLECTIONS]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown collections: {', '.join(unknown) or collections}. Use a comma list of: {', '.join(CHANGE_FEED_COLLECTIONS)}"
+        )
+    
+    # Taken before reading, so anything written during the read is reported next time
+    watermark = datetime.utcnow()
+    
+    def changed(name):
+        query = {"updated_at": {"$gt": since_at}}
+        if project_id and CHANGE_FEED_COLLECTIONS[name]:
+            query[CHANGE_FEED_COLLECTIONS[name]] = project_id
+        return db[name].find(query, {"_id": 0, "id": 1, "updated_at": 1}).sort("updated_at", 1).to_list(None)
+    
+    versions = await asyncio.gather(*(changed(name) for name in names))
+    
+    deleted = {name: [] for name in names}
+    async for tombstone in db.sync_tombstones.find({"collection": {"$in": names}, "deleted_at": {"$gt": since_at}}):
+        if project_id and CHANGE_FEED_COLLECTIONS[tombstone["collection"]] and tombstone.get("project_id") != project_id:
+            continue
+        deleted[tombstone["collection"]].append(tombstone["id"])
+    
+    return FastJSONResponse(content={
+        "watermark": watermark.isoformat(),
+        # Deletes older than the tombstone window can't be listed; the client must reload in full
+        "reload_required": since_at < watermark - timedelta(days=SYNC_TOMBSTONE_DAYS),
+        "changes": dict(zip(names, versions)),
+        "deleted": deleted
+    })
+
+@api_router.get("/events")
+async def stream_events(project_id: Optional[str] = None, last_event_id: Optional[str] = Header(None)):
+    """Server-Sent Events for T&M tag, crew log, phase and inspection changes (one project, or all for admin views)"""
+    subscription = events.subscribe(project_id, last_event_id)
+    return StreamingResponse(
+        events.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # Don't let nginx buffer the stream
+    )
+
+@api_router.get("/events/stats")
+async def get_event_stats():
+    """Live event subscriber and publish counters"""
+    return {**events.stats(), "change_streams": change_relay is not None}
+
 # Enhanced AI Super Tracking Endpoints
 
 # Phase Management
@@ -1071,7 +1692,9 @@ async def delete_material(material_id: str):
 async def create_phase(phase: PhaseCreate):
     phase_dict = phase.dict()
     phase_obj = Phase(**phase_dict)
-    result = await db.phases.insert_one(phase_obj.dict())
+    phase_doc = phase_obj.dict()
+    result = await db.phases.insert_one(phase_doc)
+    publish_change("phases", "created", phase_doc)
     return phase_obj
 
 @api_router.get("/phases", response_model=List[Phase])
@@ -1084,8 +1707,9 @@ async def get_phases(project_id: Optional[str] = None):
 
 @api_router.delete("/phases/{phase_id}")
 async def delete_phase(phase_id: str):
-    result = await db.phases.delete_one({"id": phase_id})
-    if result.deleted_count == 1:
+    deleted_phase = await db.phases.find_one_and_delete({"id": phase_id})
+    if deleted_phase:
+        await record_deletions("phases", [deleted_phase])
         return {"message": "Phase deleted successfully", "id": phase_id}
     return {"error": "Phase not found"}
 
@@ -1224,117 +1848,41 @@ async def approve_tm_ticket(ticket_id: str, approver: str):
 
 # Project Analytics with Consolidated Data
 @api_router.get("/projects/{project_id}/analytics")
-async def get_project_analytics(project_id: str):
-    """Get comprehensive project analytics including crew logs and T&M data"""
+async def get_project_analytics(project_id: str, engine: str = "rollup"):
+    """Get comprehensive project analytics including crew logs and T&M data
+    
+    engine=rollup reads the incrementally maintained rollup document;
+    engine=aggregate computes the totals with an aggregation pipeline inside MongoDB.
+    """
+    if engine not in ("rollup", "aggregate"):
+        raise HTTPException(status_code=400, detail="engine must be 'rollup' or 'aggregate'")
+    
     try:
-        # Get all T&M tags for project
-        tm_tags = await db.tm_tags.find({"project_id": project_id}).to_list(1000)
-        
-        # Get all crew logs for project
-        crew_logs = await db.crew_logs.find({"project_id": project_id}).to_list(1000)
-        
-        # Consolidate analytics
-        total_hours = 0
-        total_labor_cost = 0
-        total_material_cost = 0
-        total_other_cost = 0
-        unique_crew_members = set()
-        work_days = set()
-        
         # Get project details for labor rate
         project = await db.projects.find_one({"id": project_id})
         contract_amount = project.get("contract_amount", 0) if project else 0
         project_labor_rate = project.get("labor_rate", 95.0) if project else 95.0  # Use project-specific rate
+        project_type = project.get("project_type", "full_project") if project else "full_project"
         
-        # Get employee data for accurate cost calculations
-        employees = await db.employees.find({"status": "active"}).to_list(1000)
-        employee_rates = {emp["name"]: emp.get("hourly_rate", 40) for emp in employees}  # Default to $40
-        
-        # Process T&M tags
-        total_true_cost = 0  # True employee cost
-        total_gc_billing = 0  # Amount billed to GC
-        
-        for tag in tm_tags:
-            for labor_entry in tag.get("labor_entries", []):
-                hours = float(labor_entry.get("total_hours", 0))
-                worker_name = labor_entry.get("worker_name", "")
-                
-                total_hours += hours
-                
-                # Calculate true cost using employee's hourly rate
-                hourly_rate = employee_rates.get(worker_name, 40)  # Default $40
-                
-                total_true_cost += hours * hourly_rate
-                total_gc_billing += hours * project_labor_rate  # Use project-specific rate
-                
-                unique_crew_members.add(worker_name)
-            
-            for material_entry in tag.get("material_entries", []):
-                total_material_cost += float(material_entry.get("total", 0))
-                
-            for other_entry in tag.get("other_entries", []):
-                total_other_cost += float(other_entry.get("total", 0))
-                
-            # Handle date properly - check if it's already a string or datetime object
-            work_date = tag.get("date_of_work", "")
-            if hasattr(work_date, 'strftime'):  # It's a datetime object
-                work_days.add(work_date.strftime('%Y-%m-%d'))
-            elif isinstance(work_date, str) and work_date:
-                work_days.add(work_date.split("T")[0])
-        
-        # Process crew logs - count ALL crew logs for comprehensive analytics
-        crew_log_hours = 0
-        crew_log_true_cost = 0
-        crew_log_gc_billing = 0
-        
-        for log in crew_logs:
-            crew_members = log.get("crew_members", [])
+        if engine == "aggregate":
+            totals = await aggregate_project_totals(db, project_id, project_labor_rate)
+        else:
+            # Running totals maintained on every tm_tag / crew_log / material write
+            rollup = await analytics_rollups.get(project_id)
             
-            # Handle different crew member formats
-            if isinstance(crew_members, list):
-                for crew_member in crew_members:
-                    if isinstance(crew_member, dict):
-                        # New format with detailed hours
-                        member_hours = float(crew_member.get("total_hours", 0))
-                        worker_name = crew_member.get("name", "Unknown")
-                        
-                        hourly_rate = employee_rates.get(worker_name, 40)  # Default $40
-                        
-                        crew_log_hours += member_hours
-                        crew_log_true_cost += member_hours * hourly_rate
-                        crew_log_gc_billing += member_hours * project_labor_rate  # Use project-specific rate
-                        unique_crew_members.add(worker_name)
-                    elif isinstance(crew_member, str):
-                        # Old format - just names, use hours_worked from log level
-                        log_hours = float(log.get("hours_worked", 0)) / len(crew_members) if crew_members else 0
-                        hourly_rate = employee_rates.get(crew_member, 40)  # Default $40
-                        
-                        crew_log_hours += log_hours
-                        crew_log_true_cost += log_hours * hourly_rate
-                        crew_log_gc_billing += log_hours * project_labor_rate  # Use project-specific rate
-                        unique_crew_members.add(crew_member)
+            # Cached employee rates for accurate cost calculations
+            rates = await employee_rates.rates_by_name()
             
-            # Handle date properly - check if it's already a string or datetime object
-            log_date = log.get("date", "")
-            if hasattr(log_date, 'strftime'):  # It's a datetime object
-                work_days.add(log_date.strftime('%Y-%m-%d'))
-            elif isinstance(log_date, str) and log_date:
-                work_days.add(log_date.split("T")[0])
+            totals = rollup_totals(rollup, rates, project_labor_rate)
         
         # Use the higher values to avoid underestimating
-        total_hours = max(total_hours, crew_log_hours)
-        final_true_cost = max(total_true_cost, crew_log_true_cost)
-        final_gc_billing = max(total_gc_billing, crew_log_gc_billing)
+        total_hours = max(totals["tm_hours"], totals["crew_hours"])
+        final_true_cost = max(totals["tm_true_cost"], totals["crew_true_cost"])
+        final_gc_billing = max(totals["tm_gc_billing"], totals["crew_gc_billing"])
         
-        # Get project details
-        project = await db.projects.find_one({"id": project_id})
-        contract_amount = project.get("contract_amount", 0) if project else 0
-        project_type = project.get("project_type", "full_project") if project else "full_project"
-        
-        # Get material purchases for project and add to T&M tag materials
-        materials = await db.materials.find({"project_id": project_id}).to_list(1000)
-        material_purchases_cost = sum(float(material.get("total_cost", 0)) for material in materials)
-        total_material_cost += material_purchases_cost  # Add to existing T&M tag materials
+        # Material purchases for project are added to T&M tag materials
+        total_material_cost = totals["tm_material_cost"] + totals["material_purchases_cost"]
+        total_other_cost = totals["tm_other_cost"]
         
         # Calculate profit based on project type
         total_project_cost = final_true_cost + total_material_cost + total_other_cost
@@ -1383,66 +1931,91 @@ async def get_project_analytics(project_id: str):
             "material_cost_variance": total_material_cost - estimated_material_cost if estimated_material_cost > 0 else 0,
             "profit_variance": total_profit - estimated_profit if estimated_profit != 0 else 0,
             # Other metrics
-            "unique_crew_members": len(unique_crew_members),
-            "work_days": len(work_days),
-            "crew_members_list": list(unique_crew_members),
-            "tm_tags_count": len(tm_tags),
-            "tm_tag_count": len(tm_tags),
-            "crew_logs_count": len(crew_logs),
-            "crew_log_count": len(crew_logs),
-            "material_purchase_count": len(materials)
+            "unique_crew_members": len(totals["crew_members"]),
+            "work_days": totals["work_days"],
+            "crew_members_list": totals["crew_members"],
+            "tm_tags_count": totals["tm_count"],
+            "tm_tag_count": totals["tm_count"],
+            "crew_logs_count": totals["crew_count"],
+            "crew_log_count": totals["crew_count"],
+            "material_purchase_count": totals["material_purchase_count"]
         }
         
     except Exception as e:
         return {"error": str(e)}
 
 # Endpoint to get daily crew data for auto-population
+MAX_CREW_DATA_WINDOW = 31
+
+def daily_crew_entry(crew_log, tm_tag):
+    """Auto-population payload for one day, preferring the crew log over the T&M tag"""
+    if crew_log:
+        return {
+            "source": "crew_log",
+            "data": crew_log,
+            "crew_members": crew_log.get("crew_members", []),
+            "work_description": crew_log.get("work_description", "")
+        }
+    
+    if tm_tag:
+        # Convert labor entries to crew member format
+        crew_members = []
+        for labor_entry in tm_tag.get("labor_entries", []):
+            crew_member = {
+                "name": labor_entry.get("worker_name"),
+                "st_hours": labor_entry.get("st_hours", 0),
+                "ot_hours": labor_entry.get("ot_hours", 0),
+                "dt_hours": labor_entry.get("dt_hours", 0),
+                "pot_hours": labor_entry.get("pot_hours", 0),
+                "total_hours": labor_entry.get("total_hours", 0)
+            }
+            crew_members.append(crew_member)
+        
+        return {
+            "source": "tm_tag",
+            "data": tm_tag,
+            "crew_members": crew_members,
+            "work_description": tm_tag.get("description_of_work", "")
+        }
+    
+    return {"source": None, "data": None, "crew_members": [], "work_description": ""}
+
 @api_router.get("/daily-crew-data")
-async def get_daily_crew_data(project_id: str, date: str):
-    """Get existing crew data for a specific project and date for auto-population"""
+async def get_daily_crew_data(project_id: str, date: str, window: Optional[int] = None):
+    """Get existing crew data for a project and date (or `window` days from it) for auto-population"""
     try:
-        # Check crew logs first
-        crew_log = await db.crew_logs.find_one({
-            "project_id": project_id,
-            "date": {"$regex": date}
-        })
+        start = normalize_work_date(date)
+        if window is None:
+            days = [start]
+        elif 1 <= window <= MAX_CREW_DATA_WINDOW:
+            first = datetime.strptime(start, '%Y-%m-%d')
+            days = [(first + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(window)]
+        else:
+            return {"error": f"window must be between 1 and {MAX_CREW_DATA_WINDOW} days"}
         
-        if crew_log:
-            return {
-                "source": "crew_log",
-                "data": crew_log,
-                "crew_members": crew_log.get("crew_members", []),
-                "work_description": crew_log.get("work_description", "")
-            }
+        # Exact work_date keys on the (project_id, work_date) indexes
+        query = {"project_id": project_id, "work_date": {"$in": days}}
+        crew_logs, tm_tags = await asyncio.gather(
+            db.crew_logs.find(query, {"_id": 0}).sort(PAGE_SORT).to_list(None),
+            db.tm_tags.find(query, {"_id": 0}).sort(PAGE_SORT).to_list(None)
+        )
         
-        # Check T&M tags
-        tm_tag = await db.tm_tags.find_one({
-            "project_id": project_id,
-            "date_of_work": {"$regex": date}
-        })
+        # First (oldest) document per day, as find_one returned before
+        crew_by_day, tm_by_day = {}, {}
+        for crew_log in crew_logs:
+            crew_by_day.setdefault(crew_log["work_date"], crew_log)
+        for tm_tag in tm_tags:
+            tm_by_day.setdefault(tm_tag["work_date"], tm_tag)
         
-        if tm_tag:
-            # Convert labor entries to crew member format
-            crew_members = []
-            for labor_entry in tm_tag.get("labor_entries", []):
-                crew_member = {
-                    "name": labor_entry.get("worker_name"),
-                    "st_hours": labor_entry.get("st_hours", 0),
-                    "ot_hours": labor_entry.get("ot_hours", 0),
-                    "dt_hours": labor_entry.get("dt_hours", 0),
-                    "pot_hours": labor_entry.get("pot_hours", 0),
-                    "total_hours": labor_entry.get("total_hours", 0)
-                }
-                crew_members.append(crew_member)
-            
-            return {
-                "source": "tm_tag",
-                "data": tm_tag,
-                "crew_members": crew_members,
-                "work_description": tm_tag.get("description_of_work", "")
-            }
+        if window is None:
+            return daily_crew_entry(crew_by_day.get(start), tm_by_day.get(start))
         
-        return {"source": None, "data": None, "crew_members": [], "work_description": ""}
+        return {
+            "project_id": project_id,
+            "start": days[0],
+            "end": days[-1],
+            "days": {day: daily_crew_entry(crew_by_day.get(day), tm_by_day.get(day)) for day in days}
+        }
         
     except Exception as e:
         return {"error": str(e)}
@@ -1496,79 +2069,156 @@ async def parse_email_content(
         return {"success": False, "error": str(e)}
 
 # Email Endpoint
+def smtp_connection():
+    """Authenticated SMTP session for one outbox sender"""
+    return SmtpConnection(
+        os.environ.get('SMTP_SERVER', 'smtp.gmail.com'),
+        int(os.environ.get('SMTP_PORT', '587')),
+        os.environ.get('SMTP_USERNAME', ''),
+        os.environ.get('SMTP_PASSWORD', ''),
+        starttls=os.environ.get('SMTP_STARTTLS', 'true').lower() == 'true'
+    )
+
+email_outbox = EmailOutbox(
+    db,
+    smtp_connection,
+    workers=int(os.environ.get('EMAIL_SENDERS', '2')),
+    poll_interval=float(os.environ.get('EMAIL_POLL_INTERVAL', '5')),
+    retry_delay=float(os.environ.get('EMAIL_RETRY_DELAY', '30'))
+)
+
+MAX_EMAIL_ATTACHMENT_BYTES = int(os.environ.get('MAX_EMAIL_ATTACHMENT_MB', '25')) * 1024 * 1024
+EMAIL_FORM_OVERHEAD_BYTES = 256 * 1024  # Multipart boundaries and the text fields around the PDF
+
+async def tm_tag_pdf_filename(tm_tag_id: str) -> str:
+    tm_tag = await db.tm_tags.find_one({"id": tm_tag_id}, {"_id": 0, "date_of_work": 1})
+    date_str = str(tm_tag['date_of_work'])[:10] if tm_tag else datetime.utcnow().strftime('%Y-%m-%d')
+    return f"TM_Tag_{date_str}.pdf"
+
+async def queue_email(from_email: str, to_email: str, cc_email: Optional[str], subject: str, message: str,
+                      tm_tag_id: str, filename: Optional[str] = None, file_id=None) -> dict:
+    """Queue for the background senders; GET /email-logs/{email_id} reports delivery"""
+    try:
+        email_id = await email_outbox.enqueue(
+            from_email,
+            to_email,
+            cc_email,
+            subject,
+            message,
+            tm_tag_id=tm_tag_id,
+            attachment_filename=filename,
+            attachment_file_id=file_id
+        )
+    except Exception:
+        await email_outbox.discard_attachment(file_id)  # Not queued: nothing will ever send or delete it
+        raise
+    return {"message": "Email queued for delivery", "status": "queued", "email_id": email_id}
+
 @api_router.post("/send-email")
 async def send_email(email_request: EmailRequest):
     try:
         # Get email configuration from environment
-        smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
-        smtp_port = int(os.environ.get('SMTP_PORT', '587'))
         smtp_username = os.environ.get('SMTP_USERNAME', '')
         smtp_password = os.environ.get('SMTP_PASSWORD', '')
         
         if not smtp_username or not smtp_password:
             return {"error": "Email configuration not set up"}
         
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = smtp_username
-        msg['To'] = email_request.to_email
-        if email_request.cc_email:
-            msg['Cc'] = email_request.cc_email
-        msg['Subject'] = email_request.subject
-        
-        # Add body
-        msg.attach(MIMEText(email_request.message, 'plain'))
-        
-        # Add PDF attachment
-        if email_request.pdf_data:
+        # Decode PDF attachment
+        pdf_data = None
+        filename = None
+        if email_request.render_pdf:
+            # Render (or reuse the cached render of) the stored tag
+            tm_tag = await db.tm_tags.find_one({"id": email_request.tm_tag_id}, {"_id": 0})
+            if not tm_tag:
+                return {"error": "T&M tag not found"}
+            await signature_store.hydrate([tm_tag])
+            pdf_data, _ = await tm_tag_pdfs.render(tm_tag)
+            filename = await tm_tag_pdf_filename(email_request.tm_tag_id)
+        elif email_request.pdf_data:
             # Decode base64 PDF
             pdf_data = base64.b64decode(email_request.pdf_data.split(',')[1] if ',' in email_request.pdf_data else email_request.pdf_data)
             
-            # Create attachment
-            pdf_attachment = MIMEBase('application', 'octet-stream')
-            pdf_attachment.set_payload(pdf_data)
-            encoders.encode_base64(pdf_attachment)
-            
             # Generate filename
-            tm_tag = await db.tm_tags.find_one({"id": email_request.tm_tag_id})
-            date_str = tm_tag['date_of_work'][:10] if tm_tag else datetime.utcnow().strftime('%Y-%m-%d')
-            filename = f"TM_Tag_{date_str}.pdf"
-            
-            pdf_attachment.add_header(
-                'Content-Disposition',
-                f'attachment; filename= {filename}'
-            )
-            msg.attach(pdf_attachment)
+            filename = await tm_tag_pdf_filename(email_request.tm_tag_id)
+        
+        # Attachments go to GridFS, as uploads do, so the outbox document stays far below 16MB
+        file_id = None
+        if pdf_data is not None:
+            file_id = await email_outbox.store_attachment_data(pdf_data, filename, MAX_EMAIL_ATTACHMENT_BYTES)
+        
+        return await queue_email(
+            smtp_username,
+            email_request.to_email,
+            email_request.cc_email,
+            email_request.subject,
+            email_request.message,
+            email_request.tm_tag_id,
+            filename,
+            file_id
+        )
         
-        # Send email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_username, smtp_password)
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"Email queueing failed: {str(e)}")
+        return {"error": f"Failed to send email: {str(e)}"}
+
+@api_router.post("/send-email/upload")
+async def send_email_upload(
+    to_email: str = Form(...),
+    subject: str = Form(...),
+    message: str = Form(...),
+    tm_tag_id: str = Form(...),
+    cc_email: Optional[str] = Form(""),
+    pdf: Optional[UploadFile] = File(None)
+):
+    """Multipart variant of /send-email: the PDF is streamed to GridFS instead of base64 in JSON"""
+    try:
+        smtp_username = os.environ.get('SMTP_USERNAME', '')
+        smtp_password = os.environ.get('SMTP_PASSWORD', '')
         
-        recipients = [email_request.to_email]
-        if email_request.cc_email:
-            recipients.append(email_request.cc_email)
-            
-        server.sendmail(smtp_username, recipients, msg.as_string())
-        server.quit()
+        if not smtp_username or not smtp_password:
+            return {"error": "Email configuration not set up"}
         
-        # Log the email
-        email_log = {
-            "id": str(uuid.uuid4()),
-            "to_email": email_request.to_email,
-            "cc_email": email_request.cc_email,
-            "subject": email_request.subject,
-            "tm_tag_id": email_request.tm_tag_id,
-            "sent_at": datetime.utcnow(),
-            "status": "sent"
-        }
-        await db.email_logs.insert_one(email_log)
+        file_id = None
+        filename = None
+        if pdf is not None:
+            filename = await tm_tag_pdf_filename(tm_tag_id)
+            file_id = await email_outbox.store_attachment(pdf, filename, MAX_EMAIL_ATTACHMENT_BYTES)
         
-        return {"message": "Email sent successfully", "status": "sent"}
+        return await queue_email(smtp_username, to_email, cc_email, subject, message, tm_tag_id, filename, file_id)
         
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        logger.error(f"Email sending failed: {str(e)}")
+        logger.error(f"Email queueing failed: {str(e)}")
         return {"error": f"Failed to send email: {str(e)}"}
+    finally:
+        if pdf is not None:
+            await pdf.close()
+
+@api_router.get("/email-logs/{email_id}")
+async def get_email_delivery_status(email_id: str):
+    """Delivery status of a queued email: queued, retrying, sent or failed (with attempts and the last error)"""
+    status = await email_outbox.delivery_status(email_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return status
+
+@api_router.get("/email-outbox/stats")
+async def get_email_outbox_stats():
+    """Outgoing email queue depth, lag and delivery counters"""
+    return await email_outbox.stats()
+
+# ETag/304 and gzip/brotli responses (inside CORS so 304s still get CORS headers)
+add_response_optimizations(app, minimum_size=int(os.environ.get('COMPRESS_MIN_BYTES', '1024')))
+
+# Reject oversized uploads before Starlette spools the multipart body
+app.add_middleware(
+    RequestBodyLimitMiddleware,
+    limits={"/api/send-email/upload": MAX_EMAIL_ATTACHMENT_BYTES + EMAIL_FORM_OVERHEAD_BYTES}
+)
 
 # CORS middleware configuration
 app.add_middleware(
@@ -1577,6 +2227,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Helper function to serialize MongoDB documents
@@ -1588,9 +2239,336 @@ def serialize_doc(doc):
         del doc["_id"]
     return doc
 
-def generate_project_pin():
-    """Generate a unique 4-digit PIN for project access"""
-    return f"{random.randint(1000, 9999)}"
+# Keyset pagination over (created_at, id)
+MAX_PAGE_SIZE = 1000
+PAGE_SORT = [("created_at", 1), ("id", 1)]
+
+def encode_cursor(doc):
+    """Opaque cursor pointing just past a document in (created_at, id) order"""
+    created_at = doc.get("created_at")
+    if isinstance(created_at, datetime):
+        position = ["date", created_at.isoformat(), doc.get("id")]
+    else:
+        position = ["raw", created_at, doc.get("id")]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor: str):
+    """Decode a cursor produced by encode_cursor into (created_at, id)"""
+    try:
+        kind, created_at, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if kind == "date":
+            created_at = datetime.fromisoformat(created_at)
+        return created_at, last_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def keyset_filter(query: dict, after: Optional[str]):
+    """Restrict a query to documents after the cursor position"""
+    if not after:
+        return query
+    
+    created_at, last_id = decode_cursor(after)
+    
+    # BSON sorts null/missing < strings < dates, so later type brackets always follow
+    position = [{"created_at": created_at, "id": {"$gt": last_id}}]
+    if created_at is None:
+        position.append({"created_at": {"$type": ["string", "date"]}})
+    elif isinstance(created_at, str):
+        position.append({"created_at": {"$gt": created_at}})
+        position.append({"created_at": {"$type": "date"}})
+    else:
+        position.append({"created_at": {"$gt": created_at}})
+    
+    keyset = {"$or": position}
+    return {"$and": [query, keyset]} if query else keyset
+
+async def fetch_page(collection, query: dict, after: Optional[str], limit: int, response: Response,
+                     projection: Optional[dict] = None):
+    """Fetch one page in (created_at, id) order, setting X-Next-Cursor when more rows exist"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    docs = await collection.find(keyset_filter(query, after), projection).sort(PAGE_SORT).limit(limit + 1).to_list(limit + 1)
+    
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1])
+    
+    return docs
+
+# Field projection (fields= on list endpoints)
+@lru_cache(maxsize=64)
+def partial_model(model, names: tuple):
+    """Response model with only the named fields of model, all optional"""
+    return create_model(
+        f"{model.__name__}Fields",
+        **{name: (Optional[model.model_fields[name].annotation], None) for name in names}
+    )
+
+def resolve_fields(fields: Optional[str], model, presets: dict):
+    """(Mongo projection, response model) for a fields= preset or comma list; (None, None) means full documents"""
+    if not fields:
+        return None, None
+    
+    if fields in presets:
+        view = presets[fields]
+        names = list(view.model_fields)
+    else:
+        names = sorted({name.strip() for name in fields.split(",") if name.strip()})
+        unknown = [name for name in names if name not in model.model_fields]
+        if unknown or not names:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown) or fields}. Use a comma list of {model.__name__} fields or one of: {', '.join(presets)}"
+            )
+        view = partial_model(model, tuple(names))
+    
+    # The pagination cursor needs the sort keys even when they aren't requested
+    projection = {"_id": 0, **{name: 1 for name in names}, **{key: 1 for key, _ in PAGE_SORT}}
+    return projection, view
+
+def cursor_headers(response: Response):
+    """X-Next-Cursor set by fetch_page, for endpoints that return their own Response"""
+    return {"X-Next-Cursor": response.headers["X-Next-Cursor"]} if "X-Next-Cursor" in response.headers else None
+
+def projected_response(docs, view, response: Response):
+    """Serialize a projected page with its lightweight model, bypassing the endpoint's full response_model"""
+    return FastJSONResponse(content=trusted_rows(docs, view), headers=cursor_headers(response))
+
+def trusted_response(docs, model, response: Optional[Response] = None):
+    """Serialize a page of documents that model already validated on write, without rebuilding each row"""
+    return FastJSONResponse(content=trusted_rows(docs, model), headers=cursor_headers(response) if response else None)
+
+# Bulk ingest
+MAX_BULK_TM_TAGS = 500
+
+# Streaming exports
+EXPORT_BATCH_SIZE = 200
+
+TM_TAG_EXPORT_COLUMNS = [
+    "tm_tag_id", "project_id", "project_name", "work_date", "tm_tag_title", "cost_code",
+    "company_name", "foreman_name", "status", "entry_type", "entry_id", "item_name",
+    "st_hours", "ot_hours", "dt_hours", "pot_hours", "total_hours",
+    "quantity", "unit_of_measure", "unit_cost", "total"
+]
+
+CREW_LOG_EXPORT_COLUMNS = [
+    "crew_log_id", "project_id", "work_date", "work_description", "weather_conditions",
+    "worker_name", "st_hours", "ot_hours", "dt_hours", "pot_hours", "total_hours",
+    "synced_to_tm", "tm_tag_id"
+]
+
+def flatten_tm_tag(tag):
+    """Yield one export row per entry of a T&M tag (or a single row if it has none)"""
+    base = {
+        "tm_tag_id": tag.get("id"),
+        "project_id": tag.get("project_id"),
+        "project_name": tag.get("project_name", ""),
+        "work_date": tag.get("work_date") or normalize_work_date(tag.get("date_of_work")),
+        "tm_tag_title": tag.get("tm_tag_title", ""),
+        "cost_code": tag.get("cost_code", ""),
+        "company_name": tag.get("company_name", ""),
+        "foreman_name": tag.get("foreman_name", ""),
+        "status": tag.get("status", "")
+    }
+    
+    rows = []
+    for entry in tag.get("labor_entries") or []:
+        rows.append({
+            "entry_type": "labor",
+            "entry_id": entry.get("id"),
+            "item_name": entry.get("worker_name"),
+            "st_hours": entry.get("st_hours", 0),
+            "ot_hours": entry.get("ot_hours", 0),
+            "dt_hours": entry.get("dt_hours", 0),
+            "pot_hours": entry.get("pot_hours", 0),
+            "total_hours": entry.get("total_hours", 0),
+            "quantity": entry.get("quantity")
+        })
+    for entry in tag.get("material_entries") or []:
+        rows.append({
+            "entry_type": "material",
+            "entry_id": entry.get("id"),
+            "item_name": entry.get("material_name"),
+            "quantity": entry.get("quantity"),
+            "unit_of_measure": entry.get("unit_of_measure"),
+            "unit_cost": entry.get("unit_cost"),
+            "total": entry.get("total", 0)
+        })
+    for entry in tag.get("equipment_entries") or []:
+        rows.append({
+            "entry_type": "equipment",
+            "entry_id": entry.get("id"),
+            "item_name": entry.get("equipment_name"),
+            "quantity": entry.get("quantity"),
+            "unit_of_measure": entry.get("unit_of_measure"),
+            "total": entry.get("total", 0)
+        })
+    for entry in tag.get("other_entries") or []:
+        rows.append({
+            "entry_type": "other",
+            "entry_id": entry.get("id"),
+            "item_name": entry.get("other_name"),
+            "quantity": entry.get("quantity_of_unit"),
+            "unit_of_measure": entry.get("unit_of_measure"),
+            "total": entry.get("total", 0)
+        })
+    
+    if not rows:
+        rows.append({})
+    for row in rows:
+        yield {**base, **row}
+
+def flatten_crew_log(log):
+    """Yield one export row per crew member of a crew log (or a single row if it has none)"""
+    base = {
+        "crew_log_id": log.get("id"),
+        "project_id": log.get("project_id"),
+        "work_date": log.get("work_date") or normalize_work_date(log.get("date")),
+        "work_description": log.get("work_description", ""),
+        "weather_conditions": log.get("weather_conditions", ""),
+        "synced_to_tm": log.get("synced_to_tm", False),
+        "tm_tag_id": log.get("tm_tag_id")
+    }
+    
+    crew_members = log.get("crew_members") or []
+    if not crew_members:
+        yield base
+    for crew_member in crew_members:
+        if isinstance(crew_member, dict):
+            yield {
+                **base,
+                "worker_name": crew_member.get("name"),
+                "st_hours": crew_member.get("st_hours", 0),
+                "ot_hours": crew_member.get("ot_hours", 0),
+                "dt_hours": crew_member.get("dt_hours", 0),
+                "pot_hours": crew_member.get("pot_hours", 0),
+                "total_hours": crew_member.get("total_hours", 0)
+            }
+        else:
+            # Old format - just names, hours_worked is split evenly at log level
+            yield {
+                **base,
+                "worker_name": crew_member,
+                "total_hours": float(log.get("hours_worked", 0)) / len(crew_members)
+            }
+
+async def iter_export_lines(cursor, flatten, columns, format):
+    """Encode flattened rows from a Motor cursor as NDJSON or CSV lines"""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        yield buffer.getvalue()
+    
+    async for doc in cursor.batch_size(EXPORT_BATCH_SIZE):
+        if format == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(flatten(doc))
+            yield buffer.getvalue()
+        else:
+            yield "".join(json.dumps(row, default=str) + "\n" for row in flatten(doc))
+
+def export_response(cursor, flatten, columns, format, filename):
+    """StreamingResponse for an export, without buffering the result set"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        iter_export_lines(cursor, flatten, columns, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}.{format}"}
+    )
+
+# Payroll
+@api_router.get("/payroll/timesheet")
+async def get_payroll_timesheet(week: Optional[str] = None, format: str = "csv"):
+    """Each worker's ST/OT/DT/POT hours for a pay week across all projects, streamed as CSV (or NDJSON)"""
+    try:
+        days = week_days(week)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="week must be an ISO week (2025-W36) or a date (2025-09-01)")
+    
+    cursor = db.crew_logs.aggregate(timesheet_pipeline(days), allowDiskUse=True)
+    return export_response(cursor, flatten_timesheet, TIMESHEET_COLUMNS, format, f"timesheet_{days[0]}")
+
+# Overtime classification
+overtime = OvertimeClassifier(db)
+OVERTIME_AUTO_CLASSIFY = os.environ.get('OVERTIME_AUTO_CLASSIFY', 'false').lower() == 'true'
+
+async def apply_overtime_changes(changes: list) -> list:
+    """Write reclassified splits, then notify dashboards and re-sync the affected T&M tags"""
+    touched = await overtime.apply(changes)
+    for crew_log in touched:
+        publish_change("crew_logs", "updated", crew_log)
+        await sync_queue.enqueue("crew_log_to_tm", crew_log["project_id"], crew_log["work_date"], crew_log["id"])
+    return touched
+
+async def reclassify_overtime(crew_logs: list):
+    """On-write pass: re-split the pay weeks of the logs' crew members (OVERTIME_AUTO_CLASSIFY=true)"""
+    if not OVERTIME_AUTO_CLASSIFY:
+        return
+    weeks = {}
+    for crew_log in crew_logs:
+        if not crew_log or not crew_log.get("work_date"):
+            continue
+        try:
+            week = week_start(crew_log["work_date"])
+        except (TypeError, ValueError):
+            logger.warning(f"Skipping overtime reclassification of crew log {crew_log.get('id')}: work_date {crew_log['work_date']!r} is not YYYY-MM-DD")
+            continue
+        for member in crew_log.get("crew_members") or []:
+            if isinstance(member, dict) and member.get("name"):
+                weeks.setdefault(week, set()).add(member["name"])
+    try:
+        # One load and classification per pay week, however many of its days the logs cover
+        for week, workers in weeks.items():
+            changes = await overtime.classify_week(week, sorted(workers))
+            if changes:
+                await apply_overtime_changes(changes)
+    except Exception as e:
+        # The crew log itself is saved; the split can be fixed by /overtime/classify or the backfill
+        logger.error(f"Overtime reclassification failed: {e}")
+
+@api_router.get("/projects/{project_id}/overtime-rules")
+async def get_overtime_rules(project_id: str):
+    """The project's overtime thresholds (defaults when it has none configured)"""
+    project = await db.projects.find_one({"id": project_id}, {"_id": 0, "overtime_rules": 1})
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return OvertimeRules(**(project.get("overtime_rules") or {}))
+
+@api_router.put("/projects/{project_id}/overtime-rules")
+async def update_overtime_rules(project_id: str, rules: OvertimeRules):
+    """Set the project's overtime thresholds; null turns a rule off. Existing logs change on the next classify"""
+    if rules.daily_ot_after is not None and rules.daily_dt_after is not None and rules.daily_dt_after < rules.daily_ot_after:
+        raise HTTPException(status_code=400, detail="daily_dt_after must not be below daily_ot_after")
+    
+    result = await db.projects.update_one(
+        {"id": project_id},
+        {"$set": {"overtime_rules": rules.dict(), "updated_at": datetime.utcnow()}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return rules
+
+@api_router.post("/overtime/classify")
+async def classify_overtime(week: Optional[str] = None, workers: Optional[str] = None, apply: bool = False):
+    """Recompute the ST/OT/DT split of a pay week's crew logs (optionally comma-separated workers); returns the lines whose stored split differs"""
+    try:
+        days = week_days(week)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="week must be an ISO week (2025-W36) or a date (2025-09-01)")
+    
+    worker_names = [name.strip() for name in workers.split(",") if name.strip()] if workers else None
+    changes = await overtime.classify_week(days[0], worker_names)
+    touched = await apply_overtime_changes(changes) if apply and changes else []
+    return {
+        "week_start": days[0],
+        "applied": bool(touched),
+        "crew_logs_updated": len(touched),
+        "changes": changes
+    }
 
 async def ensure_project_has_pin(project_id: str):
     """Ensure project has a GC access PIN, generate if missing"""
@@ -1601,18 +2579,8 @@ async def ensure_project_has_pin(project_id: str):
             
         # Check if project has a PIN
         if not project.get("gc_pin"):
-            # Generate new PIN
-            new_pin = generate_project_pin()
-            
-            # Make sure PIN is unique across all projects
-            while await db.projects.find_one({"gc_pin": new_pin}):
-                new_pin = generate_project_pin()
-            
-            # Update project with new PIN
-            await db.projects.update_one(
-                {"id": project_id},
-                {"$set": {"gc_pin": new_pin, "gc_pin_used": False}}
-            )
+            # Claim a unique PIN from the pool unless another request got there first
+            new_pin = await pin_allocator.assign(project_id)
             
             logger.info(f"Generated new PIN for project {project_id}: {new_pin}")
             return new_pin
@@ -1627,11 +2595,11 @@ async def ensure_project_has_pin(project_id: str):
 
 # INVOICES API ROUTES
 @api_router.get("/invoices/{project_id}", response_model=List[Invoice])
-async def get_invoices_by_project(project_id: str):
+async def get_invoices_by_project(project_id: str, response: Response, after: Optional[str] = None, limit: int = 1000):
     """Fetch all invoices for a project"""
     try:
-        invoices = await invoices_collection.find({"project_id": project_id}).to_list(1000)
-        return [Invoice(**serialize_doc(invoice)) for invoice in invoices]
+        invoices = await fetch_page(invoices_collection, {"project_id": project_id}, after, limit, response)
+        return trusted_response(invoices, Invoice, response)
     except Exception as e:
         logger.error(f"Error fetching invoices for project {project_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1643,7 +2611,7 @@ async def create_invoice(invoice: InvoiceCreate):
         invoice_dict = invoice.dict()
         invoice_obj = Invoice(**invoice_dict)
         
-        result = await invoices_collection.insert_one(invoice_obj.dict())
+        result = await invoices_collection.insert_one(stamped(invoice_obj.dict()))
         logger.info(f"Created invoice: {invoice_obj.invoice_number}")
         
         return invoice_obj
@@ -1678,10 +2646,11 @@ async def update_invoice(invoice_id: str, invoice_update: InvoiceUpdate):
 async def delete_invoice(invoice_id: str):
     """Delete invoice"""
     try:
-        result = await invoices_collection.delete_one({"id": invoice_id})
+        deleted = await invoices_collection.find_one_and_delete({"id": invoice_id})
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Invoice not found")
+        await record_deletions("invoices", [deleted])
         
         return {"message": "Invoice deleted successfully", "id": invoice_id}
     except HTTPException:
@@ -1692,11 +2661,11 @@ async def delete_invoice(invoice_id: str):
 
 # PAYABLES API ROUTES
 @api_router.get("/payables/{project_id}", response_model=List[Payable])
-async def get_payables_by_project(project_id: str):
+async def get_payables_by_project(project_id: str, response: Response, after: Optional[str] = None, limit: int = 1000):
     """Fetch all payables for a project"""
     try:
-        payables = await payables_collection.find({"project_id": project_id}).to_list(1000)
-        return [Payable(**serialize_doc(payable)) for payable in payables]
+        payables = await fetch_page(payables_collection, {"project_id": project_id}, after, limit, response)
+        return trusted_response(payables, Payable, response)
     except Exception as e:
         logger.error(f"Error fetching payables for project {project_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1708,7 +2677,7 @@ async def create_payable(payable: PayableCreate):
         payable_dict = payable.dict()
         payable_obj = Payable(**payable_dict)
         
-        result = await payables_collection.insert_one(payable_obj.dict())
+        result = await payables_collection.insert_one(stamped(payable_obj.dict()))
         logger.info(f"Created payable: {payable_obj.description}")
         
         return payable_obj
@@ -1724,7 +2693,7 @@ async def update_payable(payable_id: str, payable_update: PayableUpdate):
         
         result = await payables_collection.update_one(
             {"id": payable_id}, 
-            {"$set": update_dict}
+            {"$set": stamped(update_dict)}
         )
         
         if result.modified_count == 0:
@@ -1742,10 +2711,11 @@ async def update_payable(payable_id: str, payable_update: PayableUpdate):
 async def delete_payable(payable_id: str):
     """Delete payable"""
     try:
-        result = await payables_collection.delete_one({"id": payable_id})
+        deleted = await payables_collection.find_one_and_delete({"id": payable_id})
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Payable not found")
+        await record_deletions("payables", [deleted])
         
         return {"message": "Payable deleted successfully", "id": payable_id}
     except HTTPException:
@@ -1756,11 +2726,11 @@ async def delete_payable(payable_id: str):
 
 # CASHFLOW API ROUTES
 @api_router.get("/cashflow/{project_id}", response_model=List[CashflowForecast])
-async def get_cashflow_by_project(project_id: str):
+async def get_cashflow_by_project(project_id: str, response: Response, after: Optional[str] = None, limit: int = 1000):
     """Fetch cashflow forecast for a project"""
     try:
-        forecasts = await cashflow_forecasts_collection.find({"project_id": project_id}).to_list(1000)
-        return [CashflowForecast(**serialize_doc(forecast)) for forecast in forecasts]
+        forecasts = await fetch_page(cashflow_forecasts_collection, {"project_id": project_id}, after, limit, response)
+        return trusted_response(forecasts, CashflowForecast, response)
     except Exception as e:
         logger.error(f"Error fetching cashflow for project {project_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1772,7 +2742,7 @@ async def create_cashflow_forecast(forecast: CashflowForecastCreate):
         forecast_dict = forecast.dict()
         forecast_obj = CashflowForecast(**forecast_dict)
         
-        result = await cashflow_forecasts_collection.insert_one(forecast_obj.dict())
+        result = await cashflow_forecasts_collection.insert_one(stamped(forecast_obj.dict()))
         logger.info(f"Created cashflow forecast for project {forecast_obj.project_id}")
         
         return forecast_obj
@@ -1788,7 +2758,7 @@ async def update_cashflow_forecast(forecast_id: str, forecast_update: CashflowFo
         
         result = await cashflow_forecasts_collection.update_one(
             {"id": forecast_id}, 
-            {"$set": update_dict}
+            {"$set": stamped(update_dict)}
         )
         
         if result.modified_count == 0:
@@ -1806,10 +2776,11 @@ async def update_cashflow_forecast(forecast_id: str, forecast_update: CashflowFo
 async def delete_cashflow_forecast(forecast_id: str):
     """Delete forecast"""
     try:
-        result = await cashflow_forecasts_collection.delete_one({"id": forecast_id})
+        deleted = await cashflow_forecasts_collection.find_one_and_delete({"id": forecast_id})
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Forecast not found")
+        await record_deletions("cashflow_forecasts", [deleted])
         
         return {"message": "Forecast deleted successfully", "id": forecast_id}
     except HTTPException:
@@ -1820,11 +2791,11 @@ async def delete_cashflow_forecast(forecast_id: str):
 
 # PROFITABILITY API ROUTES
 @api_router.get("/profitability/{project_id}", response_model=List[Profitability])
-async def get_profitability_by_project(project_id: str):
+async def get_profitability_by_project(project_id: str, response: Response, after: Optional[str] = None, limit: int = 1000):
     """Fetch profitability data for a project"""
     try:
-        profitability_data = await profitability_collection.find({"project_id": project_id}).to_list(1000)
-        return [Profitability(**serialize_doc(data)) for data in profitability_data]
+        profitability_data = await fetch_page(profitability_collection, {"project_id": project_id}, after, limit, response)
+        return trusted_response(profitability_data, Profitability, response)
     except Exception as e:
         logger.error(f"Error fetching profitability for project {project_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1836,7 +2807,7 @@ async def create_profitability_entry(profitability: ProfitabilityCreate):
         profitability_dict = profitability.dict()
         profitability_obj = Profitability(**profitability_dict)
         
-        result = await profitability_collection.insert_one(profitability_obj.dict())
+        result = await profitability_collection.insert_one(stamped(profitability_obj.dict()))
         logger.info(f"Created profitability entry for project {profitability_obj.project_id}")
         
         return profitability_obj
@@ -1852,7 +2823,7 @@ async def update_profitability_entry(profitability_id: str, profitability_update
         
         result = await profitability_collection.update_one(
             {"id": profitability_id}, 
-            {"$set": update_dict}
+            {"$set": stamped(update_dict)}
         )
         
         if result.modified_count == 0:
@@ -1870,10 +2841,11 @@ async def update_profitability_entry(profitability_id: str, profitability_update
 async def delete_profitability_entry(profitability_id: str):
     """Delete profitability"""
     try:
-        result = await profitability_collection.delete_one({"id": profitability_id})
+        deleted = await profitability_collection.find_one_and_delete({"id": profitability_id})
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Profitability entry not found")
+        await record_deletions("profitability", [deleted])
         
         return {"message": "Profitability entry deleted successfully", "id": profitability_id}
     except HTTPException:
@@ -1884,11 +2856,11 @@ async def delete_profitability_entry(profitability_id: str):
 
 # INSPECTIONS API ROUTES
 @api_router.get("/inspections/{project_id}", response_model=List[Inspection])
-async def get_inspections_by_project(project_id: str):
+async def get_inspections_by_project(project_id: str, response: Response, after: Optional[str] = None, limit: int = 1000):
     """Fetch all inspections for a project"""
     try:
-        inspections = await inspections_collection.find({"project_id": project_id}).to_list(1000)
-        return [Inspection(**serialize_doc(inspection)) for inspection in inspections]
+        inspections = await fetch_page(inspections_collection, {"project_id": project_id}, after, limit, response)
+        return trusted_response(inspections, Inspection, response)
     except Exception as e:
         logger.error(f"Error fetching inspections for project {project_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1900,7 +2872,9 @@ async def create_inspection(inspection: InspectionCreate):
         inspection_dict = inspection.dict()
         inspection_obj = Inspection(**inspection_dict)
         
-        result = await inspections_collection.insert_one(inspection_obj.dict())
+        inspection_doc = stamped(inspection_obj.dict())
+        result = await inspections_collection.insert_one(inspection_doc)
+        publish_change("inspections", "created", inspection_doc)
         logger.info(f"Created inspection: {inspection_obj.inspection_type} for project {inspection_obj.project_id}")
         
         return inspection_obj
@@ -1924,6 +2898,7 @@ async def update_inspection(inspection_id: str, inspection_update: InspectionUpd
             raise HTTPException(status_code=404, detail="Inspection not found")
         
         updated_inspection = await inspections_collection.find_one({"id": inspection_id})
+        publish_change("inspections", "updated", updated_inspection)
         return Inspection(**serialize_doc(updated_inspection))
     except HTTPException:
         raise
@@ -1935,10 +2910,11 @@ async def update_inspection(inspection_id: str, inspection_update: InspectionUpd
 async def delete_inspection(inspection_id: str):
     """Delete inspection"""
     try:
-        result = await inspections_collection.delete_one({"id": inspection_id})
+        deleted = await inspections_collection.find_one_and_delete({"id": inspection_id})
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Inspection not found")
+        await record_deletions("inspections", [deleted])
         
         return {"message": "Inspection deleted successfully", "id": inspection_id}
     except HTTPException:
@@ -1949,6 +2925,14 @@ async def delete_inspection(inspection_id: str):
 
 # GC DASHBOARD API ROUTES - SIMPLIFIED PIN SYSTEM
 
+# GC PIN pool (GC_PIN_DIGITS widens the PIN space)
+pin_allocator = GcPinAllocator(db, digits=int(os.environ.get('GC_PIN_DIGITS', '4')))
+
+@api_router.get("/gc-pins/stats")
+async def get_gc_pin_stats():
+    """Free / assigned counts for the GC PIN pool"""
+    return await pin_allocator.stats()
+
 @api_router.get("/projects/{project_id}/gc-pin")
 async def get_project_gc_pin(project_id: str):
     """Admin: Get current GC PIN for project"""
@@ -2001,23 +2985,25 @@ async def gc_login_simple(login_data: dict):
             })
             raise HTTPException(status_code=401, detail="Invalid PIN or PIN already used")
         
-        # Mark PIN as used and generate new one
-        new_pin = generate_project_pin()
+        # Mark PIN as used and claim a new one from the pool
+        new_pin = await pin_allocator.allocate(project_id)
         
-        # Ensure new PIN is unique
-        while await db.projects.find_one({"gc_pin": new_pin}):
-            new_pin = generate_project_pin()
-        
-        # Update project with new PIN
-        await db.projects.update_one(
-            {"id": project_id},
+        # Rotate atomically so concurrent logins with the same PIN can't both succeed
+        rotated = await db.projects.update_one(
+            {"id": project_id, "gc_pin": pin, "gc_pin_used": False},
             {"$set": {
                 "gc_pin": new_pin,
                 "gc_pin_used": False,
                 "gc_last_access": datetime.now(timezone.utc),
-                "gc_last_ip": ip
+                "gc_last_ip": ip,
+                "updated_at": datetime.utcnow()
             }}
         )
+        if rotated.modified_count == 0:
+            await pin_allocator.release(new_pin, project_id)
+            raise HTTPException(status_code=401, detail="Invalid PIN or PIN already used")
+        
+        await pin_allocator.release(pin, project_id)
         
         # Log successful access
         await gc_access_logs_collection.insert_one({
@@ -2194,7 +3180,9 @@ async def create_project_phase(phase: ProjectPhaseCreate):
         phase_dict = phase.dict()
         phase_obj = ProjectPhaseModel(**phase_dict)
         
-        result = await project_phases_collection.insert_one(phase_obj.dict())
+        phase_doc = stamped(phase_obj.dict())
+        result = await project_phases_collection.insert_one(phase_doc)
+        publish_change("project_phases", "created", phase_doc)
         logger.info(f"Created project phase: {phase_obj.phase} for project {phase_obj.projectId}")
         
         return phase_obj
@@ -2228,6 +3216,7 @@ async def update_project_phase(phase_id: str, phase_update: ProjectPhaseUpdate):
             raise HTTPException(status_code=404, detail="Project phase not found")
         
         updated_phase = await project_phases_collection.find_one({"id": phase_id})
+        publish_change("project_phases", "updated", updated_phase)
         return ProjectPhaseModel(**serialize_doc(updated_phase))
     except HTTPException:
         raise
@@ -2276,6 +3265,103 @@ async def health_check():
 # Include the router in the main app (MUST be after all endpoints are defined)
 app.include_router(api_router)
 
+@app.on_event("startup")
+async def create_indexes():
+    """Create indexes backing the hot query paths"""
+    try:
+        # Crew log <-> T&M tag sync point lookups
+        await db.tm_tags.create_index([("project_id", 1), ("work_date", 1)])
+        await db.crew_logs.create_index([("project_id", 1), ("work_date", 1)])
+        await db.tm_tags.create_index("work_date")  # Payroll timesheet week match
+        await db.crew_logs.create_index("work_date")
+        await db.crew_logs.create_index([("crew_members.name", 1), ("work_date", 1)])  # Overtime worker-week lookups
+        await db.crew_logs.create_index("tm_tag_id", sparse=True)  # Payroll: is this T&M tag mirrored by a crew log?
+        
+        await analytics_rollups.create_indexes()
+        await tm_tag_pdfs.create_indexes()
+        await idempotency_keys.create_indexes()
+        await db.employees.create_index([("name", 1), ("status", 1)])  # Analytics rate $lookup
+        await db.projects.create_index("status")  # Project list filter
+        
+        # Keyset pagination on list endpoints
+        await db.tm_tags.create_index(PAGE_SORT)
+        await db.crew_logs.create_index(PAGE_SORT)
+        await db.crew_logs.create_index([("project_id", 1)] + PAGE_SORT)
+        await db.materials.create_index(PAGE_SORT)
+        await db.materials.create_index([("project_id", 1)] + PAGE_SORT)
+        await db.employees.create_index([("status", 1)] + PAGE_SORT)
+        await db.tm_tags.create_index([("project_id", 1)] + PAGE_SORT)
+        
+        # Delta sync and change feed: writes and deletes since a watermark
+        await create_change_feed_indexes(db)
+        await db.sync_tombstones.create_index("deleted_at", expireAfterSeconds=SYNC_TOMBSTONE_DAYS * 24 * 3600)
+        await db.sync_tombstones.create_index([("project_id", 1), ("deleted_at", 1)])
+        await db.sync_tombstones.create_index([("collection", 1), ("deleted_at", 1)])
+        for collection in (invoices_collection, payables_collection, cashflow_forecasts_collection,
+                           profitability_collection, inspections_collection):
+            await collection.create_index([("project_id", 1)] + PAGE_SORT)
+    except Exception as e:
+        logger.error(f"Error creating indexes: {e}")
+
+@app.on_event("startup")
+async def prepare_pin_pool():
+    """Seed any missing GC PIN pool batches, enforce PIN uniqueness and check projects against the pool"""
+    try:
+        await pin_allocator.create_indexes()
+        # Resumable: a complete pool costs one count per batch, so this is safe on every restart
+        if await pin_allocator.seed():
+            await pin_allocator.reconcile()  # Fresh PINs: mark the ones projects already hold
+        
+        check = await pin_allocator.check()
+        if not check["pool_seeded"]:
+            logger.warning(f"GC PIN pool has no free {pin_allocator.digits}-digit PINs left")
+        if check["projects_missing_pin"]:
+            logger.warning(f"{check['projects_missing_pin']} projects have no GC PIN - run migrate_project_pins.py")
+        if not check["consistent"]:
+            logger.warning(f"GC PIN pool out of sync: {check['projects_with_pin']} projects hold PINs, "
+                           f"{check['pool_assigned']} pool PINs assigned - run migrate_project_pins.py")
+    except Exception as e:
+        logger.error(f"Error preparing GC PIN pool: {e}")
+
+@app.on_event("startup")
+async def load_employee_rates():
+    """Warm the employee rate cache"""
+    try:
+        await employee_rates.load()
+    except Exception as e:
+        logger.error(f"Error loading employee rates: {e}")
+
+@app.on_event("startup")
+async def start_sync_queue():
+    """Requeue interrupted sync jobs and start the background workers"""
+    try:
+        await sync_queue.create_indexes()
+        await sync_queue.recover()
+    except Exception as e:
+        logger.error(f"Error preparing sync queue: {e}")
+    sync_queue.start()
+
+@app.on_event("startup")
+async def start_email_outbox():
+    """Requeue interrupted emails and start the background senders"""
+    try:
+        await email_outbox.create_indexes()
+        await email_outbox.recover()
+    except Exception as e:
+        logger.error(f"Error preparing email outbox: {e}")
+    email_outbox.start()
+
+@app.on_event("startup")
+async def start_change_relay():
+    """Feed the event bus from MongoDB change streams when enabled (needs a replica set)"""
+    if change_relay:
+        change_relay.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await sync_queue.stop()
+    await email_outbox.stop()
+    if change_relay:
+        await change_relay.stop()
+    tm_tag_pdfs.shutdown()
     client.close()
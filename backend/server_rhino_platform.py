@@ -37,6 +37,8 @@ from models_project_intelligence import (
     EmailExtractionResult, ProjectIntelligence, SystemIntelligence
 )
 
+from service_http_middleware import add_response_optimizations
+
 # Import LLM service (optional)
 try:
     from service_project_intelligence import intelligence_llm
@@ -64,6 +66,9 @@ app = FastAPI(
     version="2.0.0"
 )
 
+# ETag/304 and gzip/brotli responses (inside CORS so 304s still get CORS headers)
+add_response_optimizations(app, minimum_size=int(os.environ.get('COMPRESS_MIN_BYTES', '1024')))
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,149 @@
+"""
+Project Analytics Aggregation Engine
+Computes the raw analytics totals inside MongoDB ($unwind labor entries / crew
+members, $lookup employee rates) so only the final numbers leave the database
+"""
+
+import asyncio
+import logging
+
+from service_employee_rates import DEFAULT_HOURLY_RATE
+
+logger = logging.getLogger(__name__)
+
+def _work_day(field: str) -> dict:
+    """Canonical day key, falling back to the raw date field for un-backfilled documents"""
+    return {"$ifNull": ["$work_date", {"$substrCP": [{"$toString": f"${field}"}, 0, 10]}]}
+
+def _worker_cost_stages() -> list:
+    """Stages turning {_id: worker name, hours} rows into hours / true cost / worker list"""
+    return [
+        {"$lookup": {
+            "from": "employees",
+            "localField": "_id",
+            "foreignField": "name",
+            "as": "employee"
+        }},
+        # Last active employee with the name wins, as in the employee_rates dict
+        {"$project": {
+            "hours": 1,
+            "rate": {"$ifNull": [
+                {"$arrayElemAt": [
+                    {"$map": {
+                        "input": {"$filter": {"input": "$employee", "as": "e", "cond": {"$eq": ["$$e.status", "active"]}}},
+                        "as": "e",
+                        "in": "$$e.hourly_rate"
+                    }},
+                    -1
+                ]},
+                DEFAULT_HOURLY_RATE
+            ]}
+        }},
+        {"$group": {
+            "_id": None,
+            "hours": {"$sum": "$hours"},
+            "true_cost": {"$sum": {"$multiply": ["$hours", "$rate"]}},
+            "workers": {"$addToSet": "$_id"}
+        }}
+    ]
+
+def tm_tag_pipeline(project_id: str) -> list:
+    return [
+        {"$match": {"project_id": project_id}},
+        {"$facet": {
+            "labor": [
+                {"$unwind": "$labor_entries"},
+                {"$group": {
+                    "_id": {"$ifNull": ["$labor_entries.worker_name", "Unknown"]},
+                    "hours": {"$sum": {"$toDouble": {"$ifNull": ["$labor_entries.total_hours", 0]}}}
+                }},
+                *_worker_cost_stages()
+            ],
+            "summary": [
+                {"$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    "material_cost": {"$sum": {"$sum": "$material_entries.total"}},
+                    "other_cost": {"$sum": {"$sum": "$other_entries.total"}},
+                    "days": {"$addToSet": _work_day("date_of_work")}
+                }}
+            ]
+        }}
+    ]
+
+def crew_log_pipeline(project_id: str) -> list:
+    is_object = {"$eq": [{"$type": "$member"}, "object"]}
+    return [
+        {"$match": {"project_id": project_id}},
+        {"$facet": {
+            "labor": [
+                {"$project": {
+                    "member": {"$cond": [{"$isArray": "$crew_members"}, "$crew_members", []]},
+                    "member_count": {"$cond": [{"$isArray": "$crew_members"}, {"$size": "$crew_members"}, 0]},
+                    "hours_worked": {"$toDouble": {"$ifNull": ["$hours_worked", 0]}}
+                }},
+                {"$unwind": "$member"},
+                {"$match": {"$expr": {"$in": [{"$type": "$member"}, ["object", "string"]]}}},
+                # New format carries detailed hours; old format splits hours_worked across names
+                {"$group": {
+                    "_id": {"$cond": [is_object, {"$ifNull": ["$member.name", "Unknown"]}, "$member"]},
+                    "hours": {"$sum": {"$cond": [
+                        is_object,
+                        {"$toDouble": {"$ifNull": ["$member.total_hours", 0]}},
+                        {"$divide": ["$hours_worked", "$member_count"]}
+                    ]}}
+                }},
+                *_worker_cost_stages()
+            ],
+            "summary": [
+                {"$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    "days": {"$addToSet": _work_day("date")}
+                }}
+            ]
+        }}
+    ]
+
+def material_pipeline(project_id: str) -> list:
+    return [
+        {"$match": {"project_id": project_id}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "cost": {"$sum": "$total_cost"}}}
+    ]
+
+async def _first(cursor) -> dict:
+    rows = await cursor.to_list(1)
+    return rows[0] if rows else {}
+
+async def aggregate_project_totals(db, project_id: str, labor_rate: float) -> dict:
+    """Raw analytics totals for a project, shaped like rollup_totals()"""
+    tm, crew, materials = await asyncio.gather(
+        _first(db.tm_tags.aggregate(tm_tag_pipeline(project_id))),
+        _first(db.crew_logs.aggregate(crew_log_pipeline(project_id))),
+        _first(db.materials.aggregate(material_pipeline(project_id)))
+    )
+
+    totals = {}
+    crew_members = set()
+    work_days = set()
+    for source, result in (("tm", tm), ("crew", crew)):
+        labor = (result.get("labor") or [{}])[0]
+        summary = (result.get("summary") or [{}])[0]
+
+        totals[f"{source}_hours"] = labor.get("hours", 0)
+        totals[f"{source}_true_cost"] = labor.get("true_cost", 0)
+        totals[f"{source}_gc_billing"] = labor.get("hours", 0) * labor_rate
+        totals[f"{source}_count"] = summary.get("count", 0)
+
+        crew_members.update(labor.get("workers", []))
+        work_days.update(day for day in summary.get("days", []) if day)
+
+    tm_summary = (tm.get("summary") or [{}])[0]
+    totals["tm_material_cost"] = tm_summary.get("material_cost", 0)
+    totals["tm_other_cost"] = tm_summary.get("other_cost", 0)
+    totals["material_purchases_cost"] = materials.get("cost", 0)
+    totals["material_purchase_count"] = materials.get("count", 0)
+    totals["crew_members"] = sorted(crew_members)
+    totals["work_days"] = len(work_days)
+
+    return totals
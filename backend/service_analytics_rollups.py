@@ -0,0 +1,269 @@
+"""
+Project Analytics Rollups
+Per-project running totals in project_analytics_rollups, maintained with $inc
+deltas on every tm_tag / crew_log / material write so analytics is a document read
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from service_employee_rates import DEFAULT_HOURLY_RATE
+
+logger = logging.getLogger(__name__)
+
+DRIFT_TOLERANCE = 0.01
+REBUILD_ATTEMPTS = 5
+
+def _key(value) -> str:
+    """Make a worker name / date safe to use as a MongoDB field name"""
+    return str(value).replace("$", "＄").replace(".", "．")
+
+def _unkey(key: str) -> str:
+    return key.replace("＄", "$").replace("．", ".")
+
+def _work_day(doc: dict, field: str) -> Optional[str]:
+    if doc.get("work_date"):
+        return doc["work_date"]
+    value = doc.get(field)
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, str) and value:
+        return value.split("T")[0]
+    return None
+
+def tm_tag_contribution(tag: dict) -> Dict[str, float]:
+    """Flat {rollup field path: amount} a T&M tag adds to its project's rollup"""
+    contribution = defaultdict(float)
+    contribution["tm.count"] += 1
+
+    for labor_entry in tag.get("labor_entries") or []:
+        worker = _key(labor_entry.get("worker_name") or "Unknown")
+        contribution[f"tm.workers.{worker}.hours"] += float(labor_entry.get("total_hours", 0))
+        contribution[f"tm.workers.{worker}.refs"] += 1
+
+    for material_entry in tag.get("material_entries") or []:
+        contribution["tm.material_cost"] += float(material_entry.get("total", 0))
+
+    for other_entry in tag.get("other_entries") or []:
+        contribution["tm.other_cost"] += float(other_entry.get("total", 0))
+
+    work_day = _work_day(tag, "date_of_work")
+    if work_day:
+        contribution[f"work_days.{_key(work_day)}"] += 1
+
+    return contribution
+
+def crew_log_contribution(log: dict) -> Dict[str, float]:
+    """Flat {rollup field path: amount} a crew log adds to its project's rollup"""
+    contribution = defaultdict(float)
+    contribution["crew.count"] += 1
+
+    crew_members = log.get("crew_members", [])
+    if isinstance(crew_members, list):
+        for crew_member in crew_members:
+            if isinstance(crew_member, dict):
+                # New format with detailed hours
+                worker = _key(crew_member.get("name") or "Unknown")
+                hours = float(crew_member.get("total_hours", 0))
+            elif isinstance(crew_member, str):
+                # Old format - just names, use hours_worked from log level
+                worker = _key(crew_member)
+                hours = float(log.get("hours_worked", 0)) / len(crew_members)
+            else:
+                continue
+            contribution[f"crew.workers.{worker}.hours"] += hours
+            contribution[f"crew.workers.{worker}.refs"] += 1
+
+    work_day = _work_day(log, "date")
+    if work_day:
+        contribution[f"work_days.{_key(work_day)}"] += 1
+
+    return contribution
+
+def material_contribution(material: dict) -> Dict[str, float]:
+    """Flat {rollup field path: amount} a material purchase adds to its project's rollup"""
+    return {
+        "materials.count": 1,
+        "materials.cost": float(material.get("total_cost", 0))
+    }
+
+CONTRIBUTIONS = {
+    "tm_tag": tm_tag_contribution,
+    "crew_log": crew_log_contribution,
+    "material": material_contribution,
+}
+
+def _nest(flat: Dict[str, float]) -> dict:
+    """Expand dotted contribution paths into a rollup document body"""
+    doc = {}
+    for path, amount in flat.items():
+        node = doc
+        *parents, leaf = path.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = node.get(leaf, 0) + amount
+    return doc
+
+def _flatten(doc: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in doc.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+def rollup_totals(rollup: Optional[dict], employee_rates: Dict[str, float], labor_rate: float) -> dict:
+    """Turn a rollup document into the raw totals used by project analytics"""
+    rollup = rollup or {}
+    totals = {}
+
+    crew_members = set()
+    for source in ("tm", "crew"):
+        section = rollup.get(source, {})
+        hours = true_cost = 0
+        for worker_key, worker in section.get("workers", {}).items():
+            if worker.get("refs", 0) <= 0:
+                continue
+            name = _unkey(worker_key)
+            worker_hours = worker.get("hours", 0)
+            hours += worker_hours
+            true_cost += worker_hours * employee_rates.get(name, DEFAULT_HOURLY_RATE)
+            crew_members.add(name)
+        totals[f"{source}_hours"] = hours
+        totals[f"{source}_true_cost"] = true_cost
+        totals[f"{source}_gc_billing"] = hours * labor_rate
+        totals[f"{source}_count"] = int(section.get("count", 0))
+
+    totals["tm_material_cost"] = rollup.get("tm", {}).get("material_cost", 0)
+    totals["tm_other_cost"] = rollup.get("tm", {}).get("other_cost", 0)
+    totals["material_purchases_cost"] = rollup.get("materials", {}).get("cost", 0)
+    totals["material_purchase_count"] = int(rollup.get("materials", {}).get("count", 0))
+    totals["crew_members"] = sorted(crew_members)
+    totals["work_days"] = len([day for day, refs in rollup.get("work_days", {}).items() if refs > 0])
+
+    return totals
+
+class AnalyticsRollups:
+    """Incremental maintenance of project_analytics_rollups"""
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def rollups(self):
+        return self.db.project_analytics_rollups
+
+    async def create_indexes(self):
+        await self.rollups.create_index("project_id", unique=True)
+
+    async def apply(self, kind: str, old: Optional[dict] = None, new: Optional[dict] = None):
+        """Apply the delta between a document's old and new state (either may be None)"""
+        try:
+            contribution = CONTRIBUTIONS[kind]
+            deltas = defaultdict(lambda: defaultdict(float))
+
+            if old and old.get("project_id"):
+                for path, amount in contribution(old).items():
+                    deltas[old["project_id"]][path] -= amount
+            if new and new.get("project_id"):
+                for path, amount in contribution(new).items():
+                    deltas[new["project_id"]][path] += amount
+
+            for project_id, delta in deltas.items():
+                await self._inc(project_id, delta)
+        except Exception as e:
+            logger.error(f"Error applying {kind} analytics rollup delta: {e}")
+
+    async def apply_many(self, kind: str, docs):
+        """Apply the contributions of newly inserted documents, one update per project"""
+        try:
+            contribution = CONTRIBUTIONS[kind]
+            deltas = defaultdict(lambda: defaultdict(float))
+            for doc in docs:
+                if doc.get("project_id"):
+                    for path, amount in contribution(doc).items():
+                        deltas[doc["project_id"]][path] += amount
+
+            for project_id, delta in deltas.items():
+                await self._inc(project_id, delta)
+        except Exception as e:
+            logger.error(f"Error applying {kind} analytics rollup deltas: {e}")
+
+    async def _inc(self, project_id: str, delta: Dict[str, float]):
+        delta = {path: amount for path, amount in delta.items() if amount}
+        if not delta:
+            return
+        # Only existing rollups are maintained; a missing one is rebuilt on first read.
+        # version tells a concurrent rebuild that its recompute may have missed this write
+        await self.rollups.update_one(
+            {"project_id": project_id},
+            {"$inc": {**delta, "version": 1}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+
+    async def compute(self, project_id: str) -> dict:
+        """Recompute a project's rollup from scratch"""
+        flat = defaultdict(float)
+        sources = [
+            (self.db.tm_tags, tm_tag_contribution, {"signature": 0}),
+            (self.db.crew_logs, crew_log_contribution, None),
+            (self.db.materials, material_contribution, {"total_cost": 1}),
+        ]
+        for collection, contribution, projection in sources:
+            async for doc in collection.find({"project_id": project_id}, projection):
+                for path, amount in contribution(doc).items():
+                    flat[path] += amount
+
+        rollup = _nest(flat)
+        rollup["project_id"] = project_id
+        return rollup
+
+    async def rebuild(self, project_id: str) -> dict:
+        """Recompute and store a project's rollup, retrying when a write lands during the recompute
+
+        The stored document must exist first (a placeholder without rebuilt_at) so concurrent writes
+        $inc its version; the recompute is only stored if the version is unchanged since it started.
+        """
+        await self.rollups.update_one(
+            {"project_id": project_id},
+            {"$setOnInsert": {"project_id": project_id, "version": 0, "rebuilt_at": None}},
+            upsert=True
+        )
+        for _ in range(REBUILD_ATTEMPTS):
+            current = await self.rollups.find_one({"project_id": project_id}, {"version": 1})
+            version = current.get("version") if current else None
+
+            rollup = await self.compute(project_id)
+            rollup["version"] = (version or 0) + 1
+            rollup["updated_at"] = datetime.utcnow()
+            rollup["rebuilt_at"] = rollup["updated_at"]
+            result = await self.rollups.replace_one({"project_id": project_id, "version": version}, rollup)
+            if result.matched_count:
+                return rollup
+
+        # Writes kept landing mid-recompute: serve this fresh result, rebuild again next time
+        logger.warning(f"Analytics rollup rebuild for {project_id} lost {REBUILD_ATTEMPTS} races with writes; not stored")
+        rollup["rebuilt_at"] = None
+        return rollup
+
+    async def get(self, project_id: str) -> dict:
+        """Stored rollup for a project, building it on first use (or after an unfinished rebuild)"""
+        rollup = await self.rollups.find_one({"project_id": project_id}, {"_id": 0})
+        if rollup is None or not rollup.get("rebuilt_at"):
+            rollup = await self.rebuild(project_id)
+        return rollup
+
+    async def drift(self, project_id: str) -> Dict[str, tuple]:
+        """Fields where the stored rollup differs from a fresh recompute: {path: (stored, expected)}"""
+        stored = await self.rollups.find_one({"project_id": project_id}, {"_id": 0}) or {}
+        expected = _flatten(await self.compute(project_id))
+        actual = _flatten({k: v for k, v in stored.items() if k in ("tm", "crew", "materials", "work_days")})
+
+        drift = {}
+        for path in set(expected) | set(actual):
+            if abs(actual.get(path, 0) - expected.get(path, 0)) > DRIFT_TOLERANCE:
+                drift[path] = (actual.get(path, 0), expected.get(path, 0))
+        return drift
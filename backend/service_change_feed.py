@@ -0,0 +1,27 @@
+"""
+Change Feed Collections
+The collections /api/changes and /api/sync report writes for, with the field
+holding each one's project id; shared by server.py and migrate_updated_at.py
+"""
+
+CHANGE_FEED_COLLECTIONS = {
+    # collection: field holding its project id (None: not project-scoped)
+    "projects": "id",
+    "tm_tags": "project_id",
+    "crew_logs": "project_id",
+    "materials": "project_id",
+    "employees": None,
+    "invoices": "project_id",
+    "payables": "project_id",
+    "cashflow_forecasts": "project_id",
+    "profitability": "project_id",
+    "inspections": "project_id",
+    "project_phases": "projectId"
+}
+
+async def create_change_feed_indexes(db):
+    """updated_at range indexes, per project where the collection is project-scoped"""
+    for collection, project_field in CHANGE_FEED_COLLECTIONS.items():
+        await db[collection].create_index("updated_at")
+        if project_field:
+            await db[collection].create_index([(project_field, 1), ("updated_at", 1)])
@@ -0,0 +1,413 @@
+"""
+Email Outbox
+Mongo-backed queue of outgoing emails drained by background senders, each
+reusing one authenticated SMTP connection off the event loop
+"""
+
+import asyncio
+import base64
+import logging
+import smtplib
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import BinaryIO, Callable, List, Optional, Union
+
+from bson import ObjectId
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_CHUNK_SIZE = 255 * 1024  # GridFS default chunk size
+SPOOL_WRITE_SIZE = 64 * 1024
+
+class AttachmentTooLarge(Exception):
+    """Uploaded attachment exceeds the configured size cap"""
+
+class SmtpConnection:
+    """One authenticated SMTP session reused across sends (blocking - run in a thread)"""
+
+    def __init__(self, host: str, port: int, username: str = "", password: str = "",
+                 starttls: bool = True, timeout: float = 30.0, max_idle: float = 240.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_idle = max_idle  # Servers drop idle sessions; reconnect rather than fail a send
+
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    def _connect(self):
+        self.close()
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._smtp = smtp
+        self.connects += 1
+
+    def send(self, sender: str, recipients: List[str], message: Union[str, BinaryIO]):
+        """Send a message given as a string or a binary file of RFC 5322 text"""
+        for attempt in range(2):
+            if self._smtp is None or time.monotonic() - self._last_used > self.max_idle:
+                self._connect()
+            try:
+                if isinstance(message, str):
+                    self._smtp.sendmail(sender, recipients, message)
+                else:
+                    message.seek(0)
+                    self._send_file(sender, recipients, message)
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                # Session dropped since the last send; retry once on a fresh one
+                self.close()
+                if attempt:
+                    raise
+            except smtplib.SMTPRecipientsRefused:
+                raise
+            except Exception:
+                self.close()
+                raise
+
+    def _send_file(self, sender: str, recipients: List[str], message: BinaryIO):
+        """sendmail() for a spooled message, streamed to the server a line at a time"""
+        smtp = self._smtp
+        smtp.ehlo_or_helo_if_needed()
+
+        code, response = smtp.mail(sender)
+        if code != 250:
+            smtp.rset()
+            raise smtplib.SMTPSenderRefused(code, response, sender)
+
+        refused = {}
+        for recipient in recipients:
+            code, response = smtp.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            smtp.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, response = smtp.docmd("data")
+        if code != 354:
+            smtp.rset()
+            raise smtplib.SMTPDataError(code, response)
+
+        # CRLF line endings and dot-stuffing, as sendmail() does for in-memory messages
+        buffer = bytearray()
+        for line in message:
+            line = line.rstrip(b"\r\n")
+            if line.startswith(b"."):
+                buffer += b"."
+            buffer += line + b"\r\n"
+            if len(buffer) >= SPOOL_WRITE_SIZE:
+                smtp.send(bytes(buffer))
+                buffer.clear()
+        buffer += b".\r\n"
+        smtp.send(bytes(buffer))
+
+        code, response = smtp.getreply()
+        if code != 250:
+            smtp.rset()
+            raise smtplib.SMTPDataError(code, response)
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+def build_message(email: dict, boundary: Optional[str] = None) -> str:
+    """MIME message for an outbox document, without its attachment (streamed in by _spool_message)"""
+    msg = MIMEMultipart(boundary=boundary)
+    msg['From'] = email["from_email"]
+    msg['To'] = email["to_email"]
+    if email.get("cc_email"):
+        msg['Cc'] = email["cc_email"]
+    msg['Subject'] = email["subject"]
+
+    msg.attach(MIMEText(email["message"], 'plain'))
+    return msg.as_string()
+
+class EmailOutbox:
+    """Persistent outgoing email queue with retry/backoff, mirrored into email_logs"""
+
+    def __init__(self, db, connect: Callable[[], SmtpConnection], workers: int = 2,
+                 poll_interval: float = 5.0, max_attempts: int = 5, retry_delay: float = 30.0):
+        self.db = db
+        self.connect = connect
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self._tasks = []
+        self._connections: List[SmtpConnection] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+        # In-process counters since startup
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def outbox(self):
+        return self.db.email_outbox
+
+    @property
+    def attachments(self):
+        return AsyncIOMotorGridFSBucket(self.db, bucket_name="email_attachments")
+
+    async def store_attachment(self, upload, filename: str, max_bytes: int):
+        """Stream an uploaded file into GridFS chunk by chunk, enforcing max_bytes; returns the file id"""
+        file_id = ObjectId()
+        grid_in = self.attachments.open_upload_stream_with_id(file_id, filename)
+        size = 0
+        try:
+            while True:
+                chunk = await upload.read(ATTACHMENT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise AttachmentTooLarge(f"Attachment exceeds {max_bytes} bytes")
+                await grid_in.write(chunk)
+            await grid_in.close()
+        except BaseException:
+            await grid_in.abort()
+            raise
+        return file_id
+
+    async def store_attachment_data(self, data: bytes, filename: str, max_bytes: int):
+        """Store an attachment already in memory (decoded from a JSON request) in GridFS; returns the file id"""
+        if len(data) > max_bytes:
+            raise AttachmentTooLarge(f"Attachment exceeds {max_bytes} bytes")
+        file_id = ObjectId()
+        await self.attachments.upload_from_stream_with_id(file_id, filename, data)
+        return file_id
+
+    async def discard_attachment(self, file_id):
+        """Delete a stored upload once its email no longer needs it (sent, failed for good, or never queued)"""
+        if file_id is None:
+            return
+        try:
+            await self.attachments.delete(file_id)
+        except NoFile:
+            pass
+
+    async def _spool_message(self, email: dict):
+        """Write the MIME message to a temp file, base64-encoding the GridFS attachment chunk by chunk"""
+        boundary = f"==============={uuid.uuid4().hex}=="
+        head = build_message(email, boundary=boundary)
+        head = head[:head.rindex(f"--{boundary}--")]
+
+        spool = tempfile.TemporaryFile()
+        try:
+            spool.write(head.encode())
+            spool.write((
+                f"--{boundary}\n"
+                "Content-Type: application/octet-stream\n"
+                "MIME-Version: 1.0\n"
+                "Content-Transfer-Encoding: base64\n"
+                f"Content-Disposition: attachment; filename= {email['attachment_filename']}\n\n"
+            ).encode())
+
+            grid_out = await self.attachments.open_download_stream(email["attachment_file_id"])
+            pending = b""
+            while True:
+                chunk = await grid_out.readchunk()
+                if not chunk:
+                    break
+                pending += chunk
+                # Encode whole 57-byte groups so every line is a full 76 characters
+                whole = len(pending) - len(pending) % 57
+                spool.write(base64.encodebytes(pending[:whole]))
+                pending = pending[whole:]
+            if pending:
+                spool.write(base64.encodebytes(pending))
+
+            spool.write(f"\n--{boundary}--\n".encode())
+            return spool
+        except BaseException:
+            spool.close()
+            raise
+
+    async def create_indexes(self):
+        await self.outbox.create_index([("status", 1), ("run_after", 1), ("created_at", 1)])
+        await self.db.email_logs.create_index("id")
+
+    async def enqueue(self, from_email: str, to_email: str, cc_email: Optional[str], subject: str, message: str,
+                      tm_tag_id: Optional[str] = None, attachment_filename: Optional[str] = None,
+                      attachment_file_id=None) -> str:
+        """Queue an email for delivery; attachments are referenced by their GridFS id. Returns the email_logs id"""
+        now = datetime.utcnow()
+        email_id = str(uuid.uuid4())
+
+        await self.db.email_logs.insert_one({
+            "id": email_id,
+            "to_email": to_email,
+            "cc_email": cc_email,
+            "subject": subject,
+            "tm_tag_id": tm_tag_id,
+            "queued_at": now,
+            "attempts": 0,
+            "status": "queued"
+        })
+        await self.outbox.insert_one({
+            "id": email_id,
+            "status": "pending",
+            "from_email": from_email,
+            "to_email": to_email,
+            "cc_email": cc_email,
+            "subject": subject,
+            "message": message,
+            "attachment_file_id": attachment_file_id,  # GridFS, never inline: keeps outbox documents small
+            "attachment_filename": attachment_filename,
+            "attempts": 0,
+            "run_after": now,
+            "created_at": now
+        })
+
+        self.enqueued += 1
+        self._wakeup.set()
+        return email_id
+
+    def start(self):
+        """Spawn the sender pool on the running event loop"""
+        self._stopping = False
+        for i in range(self.workers):
+            connection = self.connect()
+            self._connections.append(connection)
+            self._tasks.append(asyncio.create_task(self._worker(i, connection)))
+        logger.info(f"Email outbox started with {self.workers} senders")
+
+    async def stop(self):
+        """Cancel senders and close their SMTP sessions; claimed emails are requeued by recover()"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for connection in self._connections:
+            await asyncio.to_thread(connection.close)
+        self._tasks = []
+        self._connections = []
+
+    async def recover(self):
+        """Return emails left sending by a previous process to the pending state"""
+        await self.outbox.update_many({"status": "sending"}, {"$set": {"status": "pending"}})
+
+    async def _claim(self):
+        return await self.outbox.find_one_and_update(
+            {"status": "pending", "run_after": {"$lte": datetime.utcnow()}},
+            {"$set": {"status": "sending", "started_at": datetime.utcnow()}, "$inc": {"attempts": 1}},
+            sort=[("run_after", 1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _worker(self, index: int, connection: SmtpConnection):
+        while not self._stopping:
+            try:
+                email = await self._claim()
+                if not email:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._send(email, connection)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Email sender {index} error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _send(self, email: dict, connection: SmtpConnection):
+        recipients = [email["to_email"]]
+        if email.get("cc_email"):
+            recipients.append(email["cc_email"])
+
+        spool = None
+        try:
+            if email.get("attachment_file_id") is not None:
+                spool = await self._spool_message(email)
+                await asyncio.to_thread(connection.send, email["from_email"], recipients, spool)
+            else:
+                await asyncio.to_thread(connection.send, email["from_email"], recipients, build_message(email))
+        except Exception as e:
+            logger.error(f"Email {email['id']} to {email['to_email']} failed (attempt {email['attempts']}): {e}")
+            self.failed += 1
+
+            if email["attempts"] >= self.max_attempts or isinstance(e, smtplib.SMTPRecipientsRefused):
+                await self.outbox.update_one({"id": email["id"]}, {"$set": {"status": "failed", "error": str(e)}})
+                await self.discard_attachment(email.get("attachment_file_id"))
+                await self._log(email, "failed", error=str(e))
+                return
+
+            backoff = self.retry_delay * (2 ** (email["attempts"] - 1))
+            await self.outbox.update_one(
+                {"id": email["id"]},
+                {"$set": {
+                    "status": "pending",
+                    "error": str(e),
+                    "run_after": datetime.utcnow() + timedelta(seconds=backoff)
+                }}
+            )
+            await self._log(email, "retrying", error=str(e))
+            return
+        finally:
+            if spool is not None:
+                spool.close()
+
+        # Delivered - the log keeps the record, the outbox copy (and its attachment) can go
+        await self.outbox.delete_one({"id": email["id"]})
+        await self.discard_attachment(email.get("attachment_file_id"))
+        await self._log(email, "sent", sent_at=datetime.utcnow())
+        self.sent += 1
+
+    async def delivery_status(self, email_id: str) -> Optional[dict]:
+        """email_logs entry for a queued email: queued, retrying, sent or failed, with attempts and last error"""
+        return await self.db.email_logs.find_one({"id": email_id}, {"_id": 0})
+
+    async def _log(self, email: dict, status: str, **fields):
+        await self.db.email_logs.update_one(
+            {"id": email["id"]},
+            {"$set": {"status": status, "attempts": email["attempts"], **fields}}
+        )
+
+    async def stats(self) -> dict:
+        """Outbox depth, lag of the oldest pending email and sender counters"""
+        counts = {"pending": 0, "sending": 0, "failed": 0}
+        async for row in self.outbox.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+
+        oldest = await self.outbox.find_one({"status": "pending"}, {"created_at": 1}, sort=[("created_at", 1)])
+        lag_seconds = (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0
+
+        return {
+            "depth": counts["pending"],
+            "sending": counts["sending"],
+            "failed": counts["failed"],
+            "lag_seconds": lag_seconds,
+            "senders": len(self._tasks),
+            "smtp_connects": sum(connection.connects for connection in self._connections),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "errors": self.failed
+        }
@@ -0,0 +1,87 @@
+"""
+Employee Rate Cache
+In-process cache of active employees' hourly rates keyed by name,
+invalidated on employee writes with a TTL safety net for other processes
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOURLY_RATE = 40.0  # Rate used for workers without an active employee record; analytics and migrations import it
+
+class EmployeeRateCache:
+    """Hourly rate lookups without a round trip to the employees collection"""
+
+    def __init__(self, db, ttl: float = 300.0):
+        self.db = db
+        self.ttl = ttl
+
+        self._by_name: Dict[str, float] = {}
+        self._employees = 0
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def load(self):
+        """(Re)load rates for all active employees"""
+        employees = await self.db.employees.find(
+            {"status": "active"},
+            {"_id": 0, "name": 1, "hourly_rate": 1}
+        ).to_list(None)
+
+        by_name = {}
+        for employee in employees:
+            if employee.get("name"):
+                by_name[employee["name"]] = employee.get("hourly_rate", DEFAULT_HOURLY_RATE)
+
+        self._by_name, self._employees = by_name, len(employees)
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+        logger.info(f"Loaded hourly rates for {len(employees)} active employees")
+
+    async def _ensure_loaded(self):
+        if self._fresh():
+            self.hits += 1
+            return
+        async with self._lock:
+            # Another request may have reloaded while we waited
+            if self._fresh():
+                self.hits += 1
+                return
+            self.misses += 1
+            await self.load()
+
+    def invalidate(self):
+        """Drop cached rates; the next lookup reloads them"""
+        self._loaded_at = None
+        self.invalidations += 1
+
+    async def rates_by_name(self) -> Dict[str, float]:
+        """{employee name: hourly rate} for active employees"""
+        await self._ensure_loaded()
+        return self._by_name
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "employees": self._employees,
+            "names": len(self._by_name),
+            "ttl_seconds": self.ttl,
+            "age_seconds": time.monotonic() - self._loaded_at if self._loaded_at is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "loads": self.loads,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,171 @@
+"""
+Event Bus
+In-process publish/subscribe for project-scoped change events, streamed to
+dashboards as Server-Sent Events; optionally fed from MongoDB change streams
+so every worker sees writes made by the others
+"""
+
+import asyncio
+import json
+import logging
+import secrets
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    """One SSE client's queue of events, optionally limited to a project"""
+
+    def __init__(self, bus: "EventBus", project_id: Optional[str], queue_size: int):
+        self.bus = bus
+        self.project_id = project_id
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def offer(self, event: dict):
+        if self.project_id and event["project_id"] != self.project_id:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True  # Slow client: it gets a reset instead of a backlog
+
+    def close(self):
+        self.bus.subscribers.discard(self)
+
+class EventBus:
+    """Fan-out of change events to subscribers, with a short history for Last-Event-ID reconnects"""
+
+    def __init__(self, history: int = 500, queue_size: int = 256, heartbeat: float = 15.0):
+        self.boot = secrets.token_hex(4)  # Event ids from an earlier process can't be replayed
+        self.sequence = 0
+        self.history = deque(maxlen=history)
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.subscribers = set()
+        self.published = 0
+
+    def publish(self, event_type: str, project_id: Optional[str], data: Optional[dict] = None) -> dict:
+        self.sequence += 1
+        event = {
+            "id": f"{self.boot}-{self.sequence}",
+            "type": event_type,
+            "project_id": project_id,
+            "data": data or {},
+            "at": datetime.utcnow().isoformat()
+        }
+        self.history.append(event)
+        self.published += 1
+        for subscription in list(self.subscribers):
+            subscription.offer(event)
+        return event
+
+    def subscribe(self, project_id: Optional[str] = None, last_event_id: Optional[str] = None) -> Subscription:
+        """Subscribe, first queueing events missed since last_event_id (or a reset when they're gone)"""
+        subscription = Subscription(self, project_id, self.queue_size)
+        if last_event_id:
+            missed = self._since(last_event_id)
+            if missed is None:
+                subscription.overflowed = True
+            else:
+                for event in missed:
+                    subscription.offer(event)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def _since(self, last_event_id: str):
+        boot, _, sequence = last_event_id.partition("-")
+        if boot != self.boot or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        oldest = self.sequence - len(self.history) + 1
+        if sequence < oldest - 1:
+            return None  # Fell out of the history window
+        return [event for event in self.history if int(event["id"].split("-")[1]) > sequence]
+
+    async def stream(self, subscription: Subscription):
+        """SSE body: events as they arrive, a comment every heartbeat seconds to keep proxies from timing out"""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if subscription.overflowed:
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.overflowed = False
+                    # Events were lost: the client should refetch what it shows
+                    yield format_sse({"id": None, "type": "reset", "data": {}})
+                    continue
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            subscription.close()
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self.subscribers), "published": self.published, "history": len(self.history)}
+
+def format_sse(event: dict) -> str:
+    lines = []
+    if event.get("id"):
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+class ChangeStreamRelay:
+    """Publish writes seen on a MongoDB change stream (replica set required), so all workers share one event source"""
+
+    def __init__(self, db, bus: EventBus, collections: Dict[str, Optional[str]], retry_delay: float = 5.0):
+        self.db = db
+        self.bus = bus
+        self.collections = collections  # collection -> field holding its project id
+        self.retry_delay = retry_delay
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _pipeline(self):
+        names = list(self.collections)
+        return [{"$match": {"$or": [
+            {"ns.coll": {"$in": names}, "operationType": {"$in": ["insert", "update", "replace"]}},
+            # Deletes arrive as tombstones, which still carry the project id
+            {"ns.coll": "sync_tombstones", "operationType": "insert", "fullDocument.collection": {"$in": names}}
+        ]}}]
+
+    async def _run(self):
+        resume_token = None
+        while True:
+            try:
+                async with self.db.watch(self._pipeline(), full_document="updateLookup", resume_after=resume_token) as stream:
+                    logger.info("Change stream relay watching " + ", ".join(self.collections))
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._relay(change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Change stream relay error, retrying in {self.retry_delay}s: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+    def _relay(self, change: dict):
+        collection = change["ns"]["coll"]
+        doc = change.get("fullDocument") or {}
+        if collection == "sync_tombstones":
+            self.bus.publish(f"{doc['collection']}.deleted", doc.get("project_id"), {"id": doc.get("id")})
+            return
+        action = "created" if change["operationType"] == "insert" else "updated"
+        project_field = self.collections[collection]
+        self.bus.publish(f"{collection}.{action}", doc.get(project_field) if project_field else None, {"id": doc.get("id")})
@@ -0,0 +1,156 @@
+"""
+Fast JSON Responses
+orjson-backed response class plus a trusted-read path that serializes Mongo
+documents without building a Pydantic model per row and re-validating it
+through response_model. Rows whose stored types differ from what the model
+would produce (raw-dict updates, old imports) are validated the slow way
+"""
+
+import json
+import logging
+import types
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# orjson is optional; the stdlib encoder produces the same JSON, just slower
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return str(value)  # ObjectId, UUID, Decimal128
+
+def dumps(content: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def _field_defaults(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Static defaults per field; default_factory fields (ids, timestamps) are resolved per row"""
+    defaults = {}
+    for name, field in model.model_fields.items():
+        if field.default_factory is None and not field.is_required():
+            defaults[name] = field.default
+    return defaults
+
+_DEFAULTS_CACHE: Dict[Type[BaseModel], Dict[str, Any]] = {}
+
+# Stored types that serialize exactly as the model's validated value would. Matched on type() so bools
+# don't pass for numbers or datetimes for dates
+_SCALAR_TYPES = {
+    str: frozenset({str}), int: frozenset({int}), float: frozenset({int, float}), bool: frozenset({bool}),
+    datetime: frozenset({datetime}), date: frozenset({date}), type(None): frozenset({type(None)})
+}
+
+# A field's spec: a frozenset of accepted types, a predicate (lists, nested models), or None for anything
+Spec = Union[frozenset, Callable[[Any], bool], None]
+
+def _type_spec(annotation) -> Spec:
+    if annotation in _SCALAR_TYPES:
+        return _SCALAR_TYPES[annotation]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _model_check(annotation)
+
+    origin = get_origin(annotation)
+    if origin in (Union, types.UnionType):
+        specs = [_type_spec(arg) for arg in get_args(annotation)]
+        if None in specs:
+            return None
+        scalars = frozenset().union(*(spec for spec in specs if isinstance(spec, frozenset)))
+        predicates = [spec for spec in specs if not isinstance(spec, frozenset)]
+        if not predicates:
+            return scalars
+        return lambda value: type(value) in scalars or any(predicate(value) for predicate in predicates)
+    if origin is list:
+        args = get_args(annotation)
+        item = _type_spec(args[0]) if args else None
+        if item is None:
+            return lambda value: type(value) is list
+        if isinstance(item, frozenset):
+            return lambda value: type(value) is list and all(type(entry) in item for entry in value)
+        return lambda value: type(value) is list and all(item(entry) for entry in value)
+    return None  # dict, Any, Literal, enums: passed through as stored
+
+def _field_specs(model: Type[BaseModel]) -> List[Tuple[str, Spec]]:
+    specs = []
+    for name, field in model.model_fields.items():
+        spec = _type_spec(field.annotation)
+        if spec is not None:
+            specs.append((name, spec))
+    return specs
+
+def _matches(doc: dict, specs: List[Tuple[str, Spec]]) -> bool:
+    for name, spec in specs:
+        if type(spec) is frozenset:
+            if type(doc[name]) not in spec:
+                return False
+        elif not spec(doc[name]):
+            return False
+    return True
+
+_MODEL_CHECK_CACHE: Dict[Type[BaseModel], Callable[[Any], bool]] = {}
+
+def _model_check(model: Type[BaseModel]) -> Callable[[Any], bool]:
+    """Predicate for a nested model's stored dict: exactly its fields, each already of the validated type"""
+    check = _MODEL_CHECK_CACHE.get(model)
+    if check is None:
+        names = set(model.model_fields)
+        specs = _field_specs(model)
+        check = _MODEL_CHECK_CACHE[model] = lambda value: (
+            type(value) is dict and value.keys() == names and _matches(value, specs)
+        )
+    return check
+
+_SPECS_CACHE: Dict[Type[BaseModel], List[Tuple[str, Spec]]] = {}
+
+def _validated_row(row: dict, model: Type[BaseModel]) -> dict:
+    """model_dump() of a row the fast path can't pass through; rows that don't validate are sent as stored"""
+    try:
+        return model.model_validate(row).model_dump()
+    except ValidationError as e:
+        logger.debug(f"{model.__name__} {row.get('id')} does not match its model: {e.error_count()} errors")
+        return row
+
+def trusted_rows(docs: List[dict], model: Type[BaseModel]) -> List[dict]:
+    """Shape stored documents like model.model_dump(): model fields only, missing ones defaulted"""
+    defaults = _DEFAULTS_CACHE.get(model)
+    if defaults is None:
+        defaults = _DEFAULTS_CACHE[model] = _field_defaults(model)
+    specs = _SPECS_CACHE.get(model)
+    if specs is None:
+        specs = _SPECS_CACHE[model] = _field_specs(model)
+    names = list(model.model_fields)
+
+    rows = []
+    for doc in docs:
+        row = {}
+        for name in names:
+            if name in doc:
+                row[name] = doc[name]
+            elif name in defaults:
+                row[name] = defaults[name]
+            else:
+                field = model.model_fields[name]
+                row[name] = field.default_factory() if field.default_factory is not None else None
+        if not _matches(row, specs):
+            row = _validated_row(row, model)
+        rows.append(row)
+    return rows
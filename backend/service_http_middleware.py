@@ -0,0 +1,234 @@
+"""
+HTTP Response Optimizations
+ASGI middleware shared by the FastAPI apps: weak ETags + 304s for unchanged
+GET responses, gzip/brotli compression of bodies above a size threshold, and
+request body size limits enforced before a body is parsed
+"""
+
+import hashlib
+import logging
+import zlib
+from typing import Dict
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Brotli is optional; without it clients get gzip
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+# Already-compressed payloads aren't worth another pass
+INCOMPRESSIBLE_TYPES = ("image/", "video/", "audio/", "application/pdf", "application/zip", "application/gzip")
+
+# Headers a 304 must repeat from the 200 it stands in for
+NOT_MODIFIED_HEADERS = ("etag", "cache-control", "vary", "expires", "content-location")
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison (RFC 9110 13.1.2) of an If-None-Match list against an ETag"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+class ConditionalGetMiddleware:
+    """Weak ETags for buffered JSON GET responses; 304 Not Modified when If-None-Match matches"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start = None
+        state = {"started": False, "done": False}
+
+        async def conditional_send(message):
+            nonlocal start
+            if state["done"]:
+                return  # Body of a response already answered with 304
+
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            if message["type"] == "http.response.body" and not state["started"]:
+                state["started"] = True
+                headers = MutableHeaders(scope=start)
+                etag = headers.get("etag")
+
+                if start["status"] == 200:
+                    # Hash single-message JSON bodies; streams and other types keep their own validators
+                    if (etag is None and not message.get("more_body", False)
+                            and headers.get("content-type", "").startswith("application/json")):
+                        etag = f'W/"{hashlib.blake2b(message.get("body", b""), digest_size=16).hexdigest()}"'
+                        headers["ETag"] = etag
+                        if "cache-control" not in headers:
+                            headers["Cache-Control"] = "no-cache"  # Always revalidate; 304s make it cheap
+
+                    if etag and if_none_match and _etag_matches(if_none_match, etag):
+                        state["done"] = True
+                        await send({
+                            "type": "http.response.start",
+                            "status": 304,
+                            "headers": [
+                                (name, value) for name, value in start["headers"]
+                                if name.decode("latin-1").lower() in NOT_MODIFIED_HEADERS
+                            ]
+                        })
+                        await send({"type": "http.response.body", "body": b""})
+                        return
+
+                await send(start)
+
+            await send(message)
+
+        await self.app(scope, receive, conditional_send)
+
+class CompressionMiddleware:
+    """gzip or brotli (when installed) compression of responses at least minimum_size bytes"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _negotiate(self, accept_encoding: str):
+        offered = {token.split(";")[0].strip().lower() for token in accept_encoding.split(",")}
+        if BROTLI_AVAILABLE and "br" in offered:
+            return "br"
+        if "gzip" in offered:
+            return "gzip"
+        return None
+
+    def _compressor(self, encoding: str):
+        """(compress chunk, flush pending, finish) callables for one response"""
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            return compressor.process, compressor.flush, compressor.finish
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        return (
+            compressor.compress,
+            lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+            lambda: compressor.flush(zlib.Z_FINISH)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        state = {"mode": None}  # None until the first body chunk decides: "identity" or "compress"
+        codec = {}
+
+        async def compressing_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if state["mode"] is None:
+                headers = MutableHeaders(scope=start)
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or content_type.startswith(INCOMPRESSIBLE_TYPES):
+                    state["mode"] = "identity"
+                    await send(start)
+                    await send(message)
+                    return
+
+                # Compressible: the representation depends on Accept-Encoding even when sent as-is,
+                # so shared caches must not hand this identity body to a gzip client (or vice versa)
+                headers.add_vary_header("Accept-Encoding")
+                if encoding is None or (not more_body and len(body) < self.minimum_size):
+                    state["mode"] = "identity"
+                    await send(start)
+                    await send(message)
+                    return
+
+                state["mode"] = "compress"
+                codec["compress"], codec["flush"], codec["finish"] = self._compressor(encoding)
+                headers["Content-Encoding"] = encoding
+
+                if not more_body:
+                    compressed = codec["compress"](body) + codec["finish"]()
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+
+                # Streaming: length unknown up front; flush each chunk so streams keep flowing
+                del headers["Content-Length"]
+                await send(start)
+
+            if state["mode"] == "identity":
+                await send(message)
+                return
+
+            if more_body:
+                chunk = codec["compress"](body) + codec["flush"]()
+            else:
+                chunk = codec["compress"](body) + codec["finish"]()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+class RequestBodyLimitMiddleware:
+    """413 for request bodies over a per-path byte limit, before the app parses (and spools) them"""
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits  # path -> max body bytes
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds {limit} bytes"
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        # Chunked bodies carry no Content-Length: count while the app reads
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def add_response_optimizations(app, minimum_size: int = 1024):
+    """Install conditional GET inside compression, so ETags hash the uncompressed body"""
+    app.add_middleware(ConditionalGetMiddleware)
+    app.add_middleware(CompressionMiddleware, minimum_size=minimum_size)
+    logger.info(f"Response optimizations enabled (ETag/304, {'brotli+gzip' if BROTLI_AVAILABLE else 'gzip'} >= {minimum_size} bytes)")
@@ -0,0 +1,94 @@
+"""
+Idempotency Keys
+Records the response to each (endpoint, Idempotency-Key) write so offline
+retries from the frontend get the original result instead of a second insert
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+class IdempotencyKeyInvalid(Exception):
+    """Key is empty or too long"""
+
+class IdempotencyKeyReused(Exception):
+    """Key was already used for a different request body"""
+
+class IdempotencyKeyInProgress(Exception):
+    """The original request with this key hasn't finished yet"""
+
+def request_fingerprint(payload) -> str:
+    """Stable hash of a JSON-compatible request body"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+class IdempotencyStore:
+    """idempotency_keys collection: one document per scope:key, expired by a TTL index"""
+
+    def __init__(self, db, ttl_hours: float = 24, pending_timeout: float = 60):
+        self.db = db
+        self.ttl = timedelta(hours=ttl_hours)
+        self.pending_timeout = timedelta(seconds=pending_timeout)
+
+    @property
+    def keys(self):
+        return self.db.idempotency_keys
+
+    async def create_indexes(self):
+        # _id (scope:key) is the unique constraint; created_at expires old keys
+        await self.keys.create_index("created_at", expireAfterSeconds=int(self.ttl.total_seconds()))
+
+    async def begin(self, scope: str, key: str, fingerprint: str) -> Optional[dict]:
+        """Claim a key before running the write. Returns the stored record when the write already completed"""
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyKeyInvalid(f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+        now = datetime.utcnow()
+        record_id = f"{scope}:{key}"
+        try:
+            await self.keys.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "status": "pending",
+                "created_at": now,
+                "started_at": now
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        record = await self.keys.find_one({"_id": record_id})
+        if record is None:
+            # Expired between the insert and the read; claim it again
+            return await self.begin(scope, key, fingerprint)
+        if record["fingerprint"] != fingerprint:
+            raise IdempotencyKeyReused(f"Idempotency-Key {key} was already used with a different request")
+        if record["status"] == "completed":
+            return record
+
+        # Still pending: take over only if the original request died mid-write
+        claimed = await self.keys.update_one(
+            {"_id": record_id, "status": "pending", "started_at": {"$lt": now - self.pending_timeout}},
+            {"$set": {"started_at": now}}
+        )
+        if claimed.modified_count:
+            logger.warning(f"Taking over stale idempotency key {record_id}")
+            return None
+        raise IdempotencyKeyInProgress(f"A request with Idempotency-Key {key} is still in progress")
+
+    async def complete(self, scope: str, key: str, status_code: int, body):
+        await self.keys.update_one(
+            {"_id": f"{scope}:{key}"},
+            {"$set": {"status": "completed", "status_code": status_code, "response": body, "completed_at": datetime.utcnow()}}
+        )
+
+    async def abandon(self, scope: str, key: str):
+        """Release a key whose write failed so the client's retry runs it again"""
+        await self.keys.delete_one({"_id": f"{scope}:{key}", "status": "pending"})
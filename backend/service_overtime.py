@@ -0,0 +1,181 @@
+"""
+Overtime Classification
+Rules engine re-splitting crew log hours into ST/OT/DT from each worker's
+running day and week totals (daily > 8 OT, > 12 DT, weekly > 40 OT unless a
+project configures otherwise), reporting the diff against the stored split
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+INFINITY = float("inf")
+HOUR_TOLERANCE = 0.01  # Stored splits this close to the computed one are left alone
+
+class OvertimeRules(BaseModel):
+    """Thresholds in hours worked; None turns a rule off"""
+    daily_ot_after: Optional[float] = 8
+    daily_dt_after: Optional[float] = 12
+    weekly_ot_after: Optional[float] = 40
+
+DEFAULT_RULES = OvertimeRules()
+
+def week_start(work_date: str) -> str:
+    """Monday (YYYY-MM-DD) of the pay week containing work_date"""
+    day = date.fromisoformat(work_date[:10])
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+def _threshold(value: Optional[float]) -> float:
+    return INFINITY if value is None else value
+
+def split_hours(hours: float, worked_today: float, regular_this_week: float, rules: OvertimeRules) -> Tuple[float, float, float]:
+    """(st, ot, dt) for hours worked on top of worked_today / regular_this_week"""
+    ot_after = _threshold(rules.daily_ot_after)
+    dt_after = _threshold(rules.daily_dt_after)
+    week_after = _threshold(rules.weekly_ot_after)
+
+    st = ot = dt = 0.0
+    remaining = hours
+    while remaining > 1e-9:
+        if worked_today >= dt_after:
+            chunk = remaining
+            dt += chunk
+        elif worked_today >= ot_after or regular_this_week >= week_after:
+            chunk = min(remaining, dt_after - worked_today)
+            ot += chunk
+        else:
+            # Only straight time counts toward the weekly limit (daily OT is already paid as OT)
+            chunk = min(remaining, ot_after - worked_today, dt_after - worked_today, week_after - regular_this_week)
+            st += chunk
+            regular_this_week += chunk
+        worked_today += chunk
+        remaining -= chunk
+    return st, ot, dt
+
+def classify(entries: Iterable[dict], rules_by_project: Dict[str, OvertimeRules]) -> List[dict]:
+    """Recompute the ST/OT/DT split of crew log lines in one pass per worker-week; returns lines whose split changes
+
+    Each entry: crew_log_id, member_index, project_id, work_date, worker, st, ot, dt, plus an
+    order key for lines on the same day. POT is entered separately and isn't reclassified.
+    """
+    by_worker_week = defaultdict(list)
+    for entry in entries:
+        by_worker_week[(entry["worker"], week_start(entry["work_date"]))].append(entry)
+
+    changes = []
+    for (worker, week), lines in sorted(by_worker_week.items()):
+        lines.sort(key=lambda line: (line["work_date"], line["order"]))
+        day = None
+        worked_today = regular_this_week = 0.0
+        for line in lines:
+            if line["work_date"] != day:
+                day, worked_today = line["work_date"], 0.0
+
+            hours = line["st"] + line["ot"] + line["dt"]
+            rules = rules_by_project.get(line["project_id"]) or DEFAULT_RULES
+            st, ot, dt = split_hours(hours, worked_today, regular_this_week, rules)
+            worked_today += hours
+            regular_this_week += st
+
+            after = {"st_hours": round(st, 2), "ot_hours": round(ot, 2), "dt_hours": round(dt, 2)}
+            before = {"st_hours": line["st"], "ot_hours": line["ot"], "dt_hours": line["dt"]}
+            if any(abs(after[field] - before[field]) > HOUR_TOLERANCE for field in after):
+                changes.append({
+                    "crew_log_id": line["crew_log_id"],
+                    "member_index": line["member_index"],
+                    "project_id": line["project_id"],
+                    "work_date": line["work_date"],
+                    "worker_name": worker,
+                    "before": before,
+                    "after": after
+                })
+    return changes
+
+def _hours(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+class OvertimeClassifier:
+    """Loads a pay week of crew logs, classifies them and writes changed splits back"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def rules_for(self, project_ids: Iterable[str]) -> Dict[str, OvertimeRules]:
+        project_ids = list({project_id for project_id in project_ids if project_id})
+        rules = {}
+        async for project in self.db.projects.find(
+            {"id": {"$in": project_ids}, "overtime_rules": {"$ne": None}}, {"_id": 0, "id": 1, "overtime_rules": 1}
+        ):
+            rules[project["id"]] = OvertimeRules(**project["overtime_rules"])
+        return rules
+
+    async def load_entries(self, days: List[str], workers: Optional[List[str]] = None) -> List[dict]:
+        """Detailed crew member lines for the days (old name-only members carry no split and are skipped)"""
+        query = {"work_date": {"$in": days}}
+        if workers:
+            query["crew_members.name"] = {"$in": workers}
+        cursor = self.db.crew_logs.find(
+            query, {"_id": 0, "id": 1, "project_id": 1, "work_date": 1, "crew_members": 1}
+        ).sort([("work_date", 1), ("created_at", 1), ("id", 1)])
+
+        entries = []
+        order = 0
+        async for log in cursor:
+            for index, member in enumerate(log.get("crew_members") or []):
+                if not isinstance(member, dict) or (workers and member.get("name") not in workers):
+                    continue
+                order += 1
+                entries.append({
+                    "crew_log_id": log["id"],
+                    "member_index": index,
+                    "project_id": log.get("project_id"),
+                    "work_date": log["work_date"],
+                    "worker": member.get("name") or "Unknown",
+                    "order": order,
+                    "st": _hours(member.get("st_hours")),
+                    "ot": _hours(member.get("ot_hours")),
+                    "dt": _hours(member.get("dt_hours"))
+                })
+        return entries
+
+    async def classify_week(self, day: str, workers: Optional[List[str]] = None) -> List[dict]:
+        """Diff for the pay week containing day, optionally limited to some workers"""
+        monday = date.fromisoformat(week_start(day))
+        days = [(monday + timedelta(days=offset)).isoformat() for offset in range(7)]
+        entries = await self.load_entries(days, workers)
+        rules = await self.rules_for(entry["project_id"] for entry in entries)
+        return classify(entries, rules)
+
+    async def apply(self, changes: List[dict]) -> List[dict]:
+        """Write reclassified splits (one update per crew log); returns the touched logs' id/project_id/work_date"""
+        by_log = defaultdict(list)
+        for change in changes:
+            by_log[change["crew_log_id"]].append(change)
+
+        writes = []
+        now = datetime.utcnow()
+        for crew_log_id, log_changes in by_log.items():
+            update = {"updated_at": now}
+            guard = {"id": crew_log_id}
+            for change in log_changes:
+                prefix = f"crew_members.{change['member_index']}"
+                guard[f"{prefix}.name"] = change["worker_name"]  # Skip logs whose members were edited meanwhile
+                for field, value in change["after"].items():
+                    update[f"{prefix}.{field}"] = value
+            writes.append(UpdateOne(guard, {"$set": update}))
+
+        if writes:
+            await self.db.crew_logs.bulk_write(writes, ordered=False)
+        return [
+            {"id": crew_log_id, "project_id": log_changes[0]["project_id"], "work_date": log_changes[0]["work_date"]}
+            for crew_log_id, log_changes in by_log.items()
+        ]
@@ -0,0 +1,132 @@
+"""
+Payroll Timesheets
+One aggregation over crew_logs (with tm_tags via $unionWith) summing each
+worker's ST/OT/DT/POT hours per project for a pay week, counting a synced
+crew log / T&M tag pair once (through the crew log)
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+TIMESHEET_COLUMNS = [
+    "worker_name", "project_id", "project_name", "days_worked",
+    "st_hours", "ot_hours", "dt_hours", "pot_hours", "total_hours"
+]
+
+HOUR_CLASSES = ("st", "ot", "dt", "pot")
+
+def week_days(week: Optional[str] = None) -> List[str]:
+    """YYYY-MM-DD days, Monday first, of an ISO week ("2025-W36"), the week containing a date, or this week"""
+    if not week:
+        day = datetime.utcnow().date()
+    elif "-W" in week.upper():
+        year, number = week.upper().split("-W")
+        day = date.fromisocalendar(int(year), int(number), 1)
+    else:
+        day = date.fromisoformat(week[:10])
+    monday = day - timedelta(days=day.weekday())
+    return [(monday + timedelta(days=offset)).isoformat() for offset in range(7)]
+
+def _hours(path: str) -> dict:
+    """Hours as a number; blank or malformed values (old form input) count as 0"""
+    return {"$convert": {"input": path, "to": "double", "onError": 0, "onNull": 0}}
+
+def _sheet(entries: dict) -> dict:
+    return {"$project": {"_id": 0, "project_id": 1, "work_date": 1, "entries": entries}}
+
+def timesheet_pipeline(days: List[str]) -> list:
+    """crew_logs pipeline yielding one document per worker: hour totals plus a per-project breakdown"""
+    members = {"$cond": [{"$isArray": "$crew_members"}, "$crew_members", []]}
+    crew_entries = {"$map": {"input": members, "as": "member", "in": {"$cond": [
+        {"$eq": [{"$type": "$$member"}, "object"]},
+        {
+            "name": {"$ifNull": ["$$member.name", "Unknown"]},
+            **{hour_class: _hours(f"$$member.{hour_class}_hours") for hour_class in HOUR_CLASSES}
+        },
+        # Old format: names only, hours_worked split evenly and paid as straight time
+        {
+            "name": "$$member",
+            "st": {"$divide": [_hours("$hours_worked"), {"$max": [{"$size": members}, 1]}]},
+            "ot": 0, "dt": 0, "pot": 0
+        }
+    ]}}}
+    tm_entries = {"$map": {"input": {"$ifNull": ["$labor_entries", []]}, "as": "entry", "in": {
+        "name": {"$ifNull": ["$$entry.worker_name", "Unknown"]},
+        **{hour_class: _hours(f"$$entry.{hour_class}_hours") for hour_class in HOUR_CLASSES}
+    }}}
+    in_week = {"$match": {"work_date": {"$in": days}}}
+    hour_sums = {hour_class: {"$sum": f"${hour_class}"} for hour_class in HOUR_CLASSES}
+
+    # A tag synced with a crew log (the crew log came from it, or overwrote its labor entries)
+    # mirrors that log, so only tags without a sync link count. Other tags on the same day still do
+    unsynced_tags = [
+        {"$match": {"crew_log_synced": {"$ne": True}}},
+        {"$lookup": {"from": "crew_logs", "localField": "id", "foreignField": "tm_tag_id", "as": "crew_logs"}},
+        {"$match": {"crew_logs": {"$size": 0}}},
+    ]
+
+    return [
+        in_week,
+        _sheet(crew_entries),
+        {"$unionWith": {"coll": "tm_tags", "pipeline": [in_week, *unsynced_tags, _sheet(tm_entries)]}},
+        {"$unwind": "$entries"},
+        {"$project": {
+            "worker": "$entries.name",
+            "project_id": 1,
+            "work_date": 1,
+            **{hour_class: f"$entries.{hour_class}" for hour_class in HOUR_CLASSES}
+        }},
+
+        # Per worker and project, then per worker
+        {"$group": {
+            "_id": {"worker": "$worker", "project_id": "$project_id"},
+            **hour_sums,
+            "days": {"$addToSet": "$work_date"}
+        }},
+        {"$lookup": {"from": "projects", "localField": "_id.project_id", "foreignField": "id", "as": "project"}},
+        {"$group": {
+            "_id": "$_id.worker",
+            "projects": {"$push": {
+                "project_id": "$_id.project_id",
+                "project_name": {"$arrayElemAt": ["$project.name", 0]},
+                "days_worked": {"$size": "$days"},
+                **{hour_class: f"${hour_class}" for hour_class in HOUR_CLASSES}
+            }},
+            **hour_sums,
+            "day_sets": {"$push": "$days"}
+        }},
+        {"$project": {
+            **{hour_class: 1 for hour_class in HOUR_CLASSES},
+            "projects": 1,
+            "days_worked": {"$size": {"$reduce": {
+                "input": "$day_sets", "initialValue": [], "in": {"$setUnion": ["$$value", "$$this"]}
+            }}}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
+def _hour_columns(totals: dict) -> dict:
+    columns = {f"{hour_class}_hours": round(float(totals.get(hour_class) or 0), 2) for hour_class in HOUR_CLASSES}
+    columns["total_hours"] = round(float(sum(totals.get(hour_class) or 0 for hour_class in HOUR_CLASSES)), 2)
+    return columns
+
+def flatten_timesheet(worker: dict):
+    """One row per project the worker logged hours on, then the worker's TOTAL row"""
+    for project in sorted(worker.get("projects", []), key=lambda project: project.get("project_name") or ""):
+        yield {
+            "worker_name": worker["_id"],
+            "project_id": project.get("project_id"),
+            "project_name": project.get("project_name") or "",
+            "days_worked": project.get("days_worked", 0),
+            **_hour_columns(project)
+        }
+    yield {
+        "worker_name": worker["_id"],
+        "project_id": "",
+        "project_name": "TOTAL",
+        "days_worked": worker.get("days_worked", 0),
+        **_hour_columns(worker)
+    }
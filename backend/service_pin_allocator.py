@@ -0,0 +1,172 @@
+"""
+GC PIN Allocator
+Pool of every PIN in the configured space (gc_pins collection), claimed and
+released atomically so allocation is O(1) round trips and race-free. The pool
+is seeded on startup (only missing batches are inserted) and by migrate_project_pins.py
+"""
+
+import logging
+import random
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+SEED_BATCH_SIZE = 10000
+RECONCILE_GRACE_SECONDS = 60  # Leave in-flight claims alone when freeing orphaned PINs
+
+# Legacy projects created before PINs were assigned on create
+MISSING_PIN_QUERY = {"gc_pin": {"$in": [None, ""]}}
+
+class PinPoolExhausted(Exception):
+    """Every PIN in the configured space is assigned"""
+
+class GcPinAllocator:
+    """Atomic claim/release of unique GC access PINs"""
+
+    def __init__(self, db, digits: int = 4):
+        self.db = db
+        self.digits = digits
+        self.low = 10 ** (digits - 1)
+        self.high = 10 ** digits - 1
+        self.width = {"$regex": f"^[0-9]{{{digits}}}$"}  # PINs of the configured width
+
+    @property
+    def pool(self):
+        return self.db.gc_pins
+
+    async def create_indexes(self):
+        # Random-order claims: {status: free, r >= x} sorted by r
+        await self.pool.create_index([("status", 1), ("r", 1)])
+        # Backstop against two projects ever holding the same PIN
+        await self.db.projects.create_index(
+            "gc_pin",
+            unique=True,
+            partialFilterExpression={"gc_pin": {"$gt": ""}}  # Non-empty strings only
+        )
+
+    async def seed(self) -> int:
+        """Populate the pool batch by batch, skipping batches already complete; returns the PINs inserted"""
+        inserted = 0
+        for start in range(self.low, self.high + 1, SEED_BATCH_SIZE):
+            end = min(start + SEED_BATCH_SIZE, self.high + 1)
+            in_batch = {"_id": {"$gte": f"{start}", "$lte": f"{end - 1}", **self.width}}
+            if await self.pool.count_documents(in_batch) >= end - start:
+                continue
+
+            batch = [{"_id": f"{pin}", "status": "free", "r": random.random()} for pin in range(start, end)]
+            try:
+                result = await self.pool.insert_many(batch, ordered=False)
+                inserted += len(result.inserted_ids)
+            except BulkWriteError as e:
+                inserted += e.details["nInserted"]  # Rest seeded by an earlier (interrupted) run
+
+        if inserted:
+            logger.info(f"Seeded GC PIN pool with {inserted} {self.digits}-digit PINs")
+        return inserted
+
+    async def retire_other_widths(self) -> int:
+        """Drop free PINs left from a previous GC_PIN_DIGITS; assigned ones go when their project releases them"""
+        result = await self.pool.delete_many({"status": "free", "_id": {"$not": self.width}})
+        if result.deleted_count:
+            logger.info(f"Retired {result.deleted_count} free GC PINs of other widths")
+        return result.deleted_count
+
+    async def reconcile(self):
+        """Make the pool match the PINs projects actually hold"""
+        held = set()
+        async for project in self.db.projects.find({"gc_pin": {"$gt": ""}}, {"_id": 0, "id": 1, "gc_pin": 1}):
+            held.add(project["gc_pin"])
+            await self.pool.update_one(
+                {"_id": project["gc_pin"], "project_id": {"$ne": project["id"]}},
+                {"$set": {"status": "assigned", "project_id": project["id"], "assigned_at": datetime.utcnow()}}
+            )
+
+        # Claimed but never stored (crash between allocate and the project write) or left by deleted projects
+        settled = datetime.utcnow() - timedelta(seconds=RECONCILE_GRACE_SECONDS)
+        async for pin in self.pool.find({"status": "assigned", "assigned_at": {"$lt": settled}}, {"_id": 1}):
+            if pin["_id"] not in held:
+                await self.pool.update_one(
+                    {"_id": pin["_id"], "status": "assigned"},
+                    {"$set": {"status": "free", "r": random.random()}, "$unset": {"project_id": "", "assigned_at": ""}}
+                )
+
+    async def allocate(self, project_id: str) -> str:
+        """Claim a random free PIN for a project"""
+        update = {"$set": {"status": "assigned", "project_id": project_id, "assigned_at": datetime.utcnow()}}
+        pivot = random.random()
+
+        claimed = await self.pool.find_one_and_update(
+            {"status": "free", "r": {"$gte": pivot}, "_id": self.width},
+            update,
+            sort=[("r", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if not claimed:
+            # Wrap around below the pivot
+            claimed = await self.pool.find_one_and_update(
+                {"status": "free", "_id": self.width},
+                update,
+                sort=[("r", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+        if not claimed:
+            raise PinPoolExhausted(f"No free {self.digits}-digit GC PINs left")
+
+        return claimed["_id"]
+
+    async def release(self, pin: str, project_id: str):
+        """Return a project's PIN to the pool at a fresh random position"""
+        if not pin:
+            return
+        if len(pin) != self.digits:
+            await self.pool.delete_one({"_id": pin, "project_id": project_id})  # Retired width
+            return
+        await self.pool.update_one(
+            {"_id": pin, "project_id": project_id},
+            {"$set": {"status": "free", "r": random.random()}, "$unset": {"project_id": "", "assigned_at": ""}}
+        )
+
+    async def assign(self, project_id: str):
+        """Give a project without a PIN one from the pool; returns the project's PIN"""
+        pin = await self.allocate(project_id)
+        result = await self.db.projects.update_one(
+            {"id": project_id, **MISSING_PIN_QUERY},
+            {"$set": {"gc_pin": pin, "gc_pin_used": False, "updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count == 0:
+            # Another writer assigned one first (or the project is gone)
+            await self.release(pin, project_id)
+            project = await self.db.projects.find_one({"id": project_id}, {"_id": 0, "gc_pin": 1})
+            return project.get("gc_pin") if project else None
+        return pin
+
+    async def backfill(self) -> int:
+        """Assign PINs to every project still missing one"""
+        project_ids = await self.db.projects.distinct("id", MISSING_PIN_QUERY)
+        for project_id in project_ids:
+            await self.assign(project_id)
+        return len(project_ids)
+
+    async def check(self) -> dict:
+        """Compare projects against the pool; a healthy deployment reports no missing or mismatched PINs"""
+        with_pin = await self.db.projects.count_documents({"gc_pin": {"$gt": ""}})
+        assigned = await self.pool.count_documents({"status": "assigned"})
+        return {
+            "pool_seeded": await self.pool.find_one({"status": "free", "_id": self.width}, {"_id": 1}) is not None,
+            "projects_missing_pin": await self.db.projects.count_documents(MISSING_PIN_QUERY),
+            "projects_with_pin": with_pin,
+            "pool_assigned": assigned,
+            "consistent": with_pin == assigned
+        }
+
+    async def stats(self) -> dict:
+        free = await self.pool.count_documents({"status": "free"})
+        return {
+            "digits": self.digits,
+            "space": self.high - self.low + 1,
+            "free": free,
+            "assigned": await self.pool.count_documents({"status": "assigned"})
+        }
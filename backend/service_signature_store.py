@@ -0,0 +1,78 @@
+"""
+Signature Store
+Content-addressed collection of T&M tag signature images (data URLs keyed by
+SHA-256), referenced from tm_tags by signature_id instead of stored inline
+"""
+
+import base64
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+def signature_id(data: str) -> str:
+    return hashlib.sha256(data.encode()).hexdigest()
+
+def decode_data_url(data: str) -> Tuple[str, bytes]:
+    """(media type, bytes) for a data:image/...;base64 URL or bare base64"""
+    if data.startswith("data:") and "," in data:
+        header, payload = data.split(",", 1)
+        media_type = header[5:].split(";")[0] or "application/octet-stream"
+    else:
+        media_type, payload = "image/png", data
+    return media_type, base64.b64decode(payload)
+
+class SignatureStore:
+    """Deduplicated signature images shared by every tag that carries them"""
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def signatures(self):
+        return self.db.signatures
+
+    async def put(self, data: str) -> str:
+        """Store a signature data URL (once per distinct image); returns its id"""
+        digest = signature_id(data)
+        try:
+            await self.signatures.update_one(
+                {"_id": digest},
+                {"$setOnInsert": {"data": data, "size": len(data), "created_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # Concurrent upsert of the same image
+        return digest
+
+    async def get(self, digest: str) -> Optional[str]:
+        doc = await self.signatures.find_one({"_id": digest}, {"data": 1})
+        return doc["data"] if doc else None
+
+    async def get_many(self, digests: Iterable[str]) -> Dict[str, str]:
+        digests = list({digest for digest in digests if digest})
+        if not digests:
+            return {}
+        return {
+            doc["_id"]: doc["data"]
+            async for doc in self.signatures.find({"_id": {"$in": digests}}, {"data": 1})
+        }
+
+    async def extract(self, tm_tag: dict) -> dict:
+        """Move an inline signature out of a tag document about to be written"""
+        signature = tm_tag.pop("signature", None)
+        if signature:
+            tm_tag["signature_id"] = await self.put(signature)
+        return tm_tag
+
+    async def hydrate(self, tm_tags: list) -> list:
+        """Fill signature back in on tags read for clients that expect it inline (one query per page)"""
+        stored = await self.get_many(tm_tag.get("signature_id") for tm_tag in tm_tags if not tm_tag.get("signature"))
+        for tm_tag in tm_tags:
+            if not tm_tag.get("signature") and tm_tag.get("signature_id") in stored:
+                tm_tag["signature"] = stored[tm_tag["signature_id"]]
+        return tm_tags
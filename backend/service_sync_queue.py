@@ -0,0 +1,190 @@
+"""
+Crew Log <-> T&M Sync Queue
+Mongo-backed outbox of sync jobs drained by an asyncio worker pool,
+coalescing repeated pending jobs for the same source document
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+class SyncQueue:
+    """Persistent job queue for crew log <-> T&M tag syncs"""
+
+    def __init__(self, db, handlers: Dict[str, Callable[[dict], Awaitable[None]]],
+                 workers: int = 2, poll_interval: float = 5.0, max_attempts: int = 5):
+        self.db = db
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+        # In-process counters since startup
+        self.enqueued = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def jobs(self):
+        return self.db.sync_jobs
+
+    async def create_indexes(self):
+        """One pending job per key is what makes enqueue coalesce"""
+        await self.jobs.create_index(
+            [("kind", 1), ("project_id", 1), ("work_date", 1), ("source_id", 1)],
+            unique=True,
+            partialFilterExpression={"status": "pending"}
+        )
+        await self.jobs.create_index([("status", 1), ("run_after", 1), ("created_at", 1)])
+
+    async def enqueue(self, kind: str, project_id: Optional[str], work_date: Optional[str], source_id: str):
+        """Queue a sync, folding it into an already-pending job for the same source document
+
+        Keyed by source_id as well as project and date: two crew logs on one day each need their own sync
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown sync job kind: {kind}")
+        if not project_id or not work_date:
+            logger.warning(f"Skipping {kind} sync for {source_id} - missing project_id or work_date")
+            return
+
+        now = datetime.utcnow()
+        for _ in range(2):
+            try:
+                result = await self.jobs.update_one(
+                    {"kind": kind, "project_id": project_id, "work_date": work_date, "source_id": source_id, "status": "pending"},
+                    {
+                        "$set": {"updated_at": now},
+                        "$setOnInsert": {
+                            "id": str(uuid.uuid4()),
+                            "attempts": 0,
+                            "run_after": now,
+                            "created_at": now
+                        },
+                        "$inc": {"requests": 1}
+                    },
+                    upsert=True
+                )
+                break
+            except DuplicateKeyError:
+                # Lost an upsert race to another request; the retry folds into its job
+                continue
+        else:
+            return
+
+        self.enqueued += 1
+        if result.upserted_id is None:
+            self.coalesced += 1
+        self._wakeup.set()
+
+    def start(self):
+        """Spawn the worker pool on the running event loop"""
+        self._stopping = False
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        logger.info(f"Sync queue started with {self.workers} workers")
+
+    async def stop(self):
+        """Cancel workers; claimed jobs are requeued on next start by recover()"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def recover(self):
+        """Return jobs left running by a previous process to the pending state"""
+        async for job in self.jobs.find({"status": "running"}):
+            try:
+                await self.jobs.update_one({"id": job["id"]}, {"$set": {"status": "pending"}})
+            except DuplicateKeyError:
+                # A newer pending job for the same key already covers it
+                await self.jobs.delete_one({"id": job["id"]})
+
+    async def _claim(self):
+        return await self.jobs.find_one_and_update(
+            {"status": "pending", "run_after": {"$lte": datetime.utcnow()}},
+            {"$set": {"status": "running", "started_at": datetime.utcnow()}, "$inc": {"attempts": 1}},
+            sort=[("run_after", 1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _worker(self, index: int):
+        while not self._stopping:
+            try:
+                job = await self._claim()
+                if not job:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._run(job)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Sync worker {index} error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _run(self, job: dict):
+        try:
+            await self.handlers[job["kind"]](job)
+            await self.jobs.delete_one({"id": job["id"]})
+            self.processed += 1
+        except Exception as e:
+            logger.error(f"Sync job {job['id']} ({job['kind']}) failed: {e}")
+            self.failed += 1
+
+            if job["attempts"] >= self.max_attempts:
+                await self.jobs.update_one({"id": job["id"]}, {"$set": {"status": "failed", "error": str(e)}})
+                return
+
+            backoff = self.poll_interval * (2 ** job["attempts"])
+            try:
+                await self.jobs.update_one(
+                    {"id": job["id"]},
+                    {"$set": {
+                        "status": "pending",
+                        "error": str(e),
+                        "run_after": datetime.utcnow() + timedelta(seconds=backoff)
+                    }}
+                )
+            except DuplicateKeyError:
+                # A newer pending job for the same key will redo this sync
+                await self.jobs.delete_one({"id": job["id"]})
+
+    async def stats(self) -> dict:
+        """Queue depth, lag of the oldest pending job and worker counters"""
+        counts = {"pending": 0, "running": 0, "failed": 0}
+        async for row in self.jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+
+        oldest = await self.jobs.find_one({"status": "pending"}, sort=[("created_at", 1)])
+        lag_seconds = (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0
+
+        return {
+            "depth": counts["pending"],
+            "running": counts["running"],
+            "failed": counts["failed"],
+            "lag_seconds": lag_seconds,
+            "workers": len(self._tasks),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "processed": self.processed,
+            "errors": self.failed
+        }
@@ -0,0 +1,417 @@
+"""
+T&M Tag PDF Renderer
+Server-side ReportLab port of the PDFGenerator.jsx layout for legacy TMTag
+documents, rendered in a process pool and cached by content hash
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from bson import Binary
+
+logger = logging.getLogger(__name__)
+
+RENDERER_VERSION = 1  # Bump when the layout changes so cached PDFs are re-rendered
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+# Fields that affect the rendered PDF; anything else (status, ids) leaves the cache valid
+RENDERED_FIELDS = (
+    "project_name", "cost_code", "date_of_work", "company_name", "tm_tag_title", "description_of_work",
+    "labor_entries", "material_entries", "equipment_entries", "other_entries",
+    "signature", "signer_name", "foreman_name", "submitted_at", "created_at"
+)
+
+def content_hash(tm_tag: dict) -> str:
+    """Stable hash of everything the renderer reads from a tag"""
+    content = {field: tm_tag.get(field) for field in RENDERED_FIELDS}
+    payload = json.dumps({"v": RENDERER_VERSION, **content}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _num(value) -> str:
+    """Number.toString(): 8.0 -> '8', 8.5 -> '8.5'"""
+    if value is None:
+        return "0"
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return str(int(number)) if number.is_integer() else str(number)
+
+def _money(value) -> str:
+    try:
+        return f"{float(value or 0):.2f}"
+    except (TypeError, ValueError):
+        return "0.00"
+
+def _date_text(value) -> str:
+    """toLocaleDateString() (en-US) for datetimes and ISO strings"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value[:10]
+    if isinstance(value, datetime):
+        return f"{value.month}/{value.day}/{value.year}"
+    return ""
+
+def _truncate(text: str, limit: int) -> str:
+    text = text or ""
+    return text[:limit] + "..." if len(text) > limit else text
+
+def render_tm_tag_pdf(tm_tag: dict) -> bytes:
+    """Render a T&M tag with the same layout as PDFGenerator.jsx (runs in a worker process)"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import ImageReader, simpleSplit
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    page_height = A4[1]
+    state = {"font": "Helvetica", "size": 10}
+
+    # jsPDF-style helpers: millimetres from the top-left corner
+    def font(bold=None, size=None):
+        if bold is not None:
+            state["font"] = "Helvetica-Bold" if bold else "Helvetica"
+        if size is not None:
+            state["size"] = size
+        pdf.setFont(state["font"], state["size"])
+
+    def text(value, x, y):
+        pdf.drawString(x * mm, page_height - y * mm, str(value))
+
+    def rect(x, y, w, h):
+        pdf.rect(x * mm, page_height - (y + h) * mm, w * mm, h * mm, stroke=1, fill=0)
+
+    def split(value, width):
+        return simpleSplit(str(value or ""), state["font"], state["size"], width * mm)
+
+    def line_height():
+        return state["size"] * 1.15 * 0.3528  # jsPDF line height factor, pt -> mm
+
+    def border():
+        pdf.setStrokeColorRGB(0, 0, 0)
+        pdf.setLineWidth(0.5 * mm)
+        rect(10, 10, 190, 277)
+
+    def table_lines():
+        pdf.setStrokeColorRGB(150 / 255, 150 / 255, 150 / 255)
+        pdf.setLineWidth(0.1 * mm)
+
+    def ensure_space(y, needed):
+        """Start a new bordered page when the next block would run off this one"""
+        if y + needed <= 280:
+            return y
+        pdf.showPage()
+        border()
+        table_lines()
+        font()
+        return 20
+
+    def table(y, columns, header, rows):
+        font(bold=True, size=8)
+        for x, width in columns:
+            rect(x, y, width, 8)
+        for (x, _), (label, offset) in zip(columns, header):
+            text(label, x + offset, y + 5)
+        y += 8
+
+        font(bold=False)
+        for row in rows:
+            y = ensure_space(y, 6)
+            for x, width in columns:
+                rect(x, y, width, 6)
+            for (x, _), (_, offset), value in zip(columns, header, row):
+                text(value, x + offset, y + 4)
+            y += 6
+        return y
+
+    border()
+
+    # Header - text-only variant of the client layout (no remote logo fetch)
+    font(bold=True, size=18)
+    text("RHINO FIRE PROTECTION", 15, 25)
+    font(size=16)
+    text("TIME & MATERIAL TAG", 15, 35)
+
+    # Project information
+    y = 50
+    font(bold=True, size=12)
+    text("PROJECT INFORMATION", 15, y)
+
+    y += 8
+    font(bold=False, size=10)
+    text("Project Name:", 15, y)
+    text(tm_tag.get("project_name") or "", 50, y)
+    text("Cost Code:", 120, y)
+    text(tm_tag.get("cost_code") or "", 145, y)
+
+    y += 7
+    text("Date of Work:", 15, y)
+    text(_date_text(tm_tag.get("date_of_work")), 50, y)
+    text("Foreman:", 120, y)
+    text(tm_tag.get("foreman_name") or "Jesus Garcia", 145, y)
+
+    y += 7
+    text("T&M Tag Title:", 15, y)
+    for i, line in enumerate(split(tm_tag.get("tm_tag_title"), 110)):
+        text(line, 50, y + i * line_height())
+
+    if tm_tag.get("company_name"):
+        y += 7
+        text("Company Name:", 15, y)
+        text(tm_tag["company_name"], 65, y)
+
+    # Description of work
+    y += 12
+    font(bold=True)
+    text("DESCRIPTION OF WORK:", 15, y)
+    y += 6
+    font(bold=False)
+    description = split(tm_tag.get("description_of_work"), 170)
+    for i, line in enumerate(description):
+        text(line, 15, y + i * line_height())
+    y += len(description) * 4 + 10
+
+    labor_entries = tm_tag.get("labor_entries") or []
+    if labor_entries:
+        y = ensure_space(y, 26)
+        font(bold=True, size=11)
+        text("LABOR", 15, y)
+        y += 6
+        table_lines()
+        y = table(
+            y,
+            [(15, 60), (75, 15), (90, 15), (105, 15), (120, 15), (135, 15), (150, 20), (170, 25)],
+            [("Worker Name", 2), ("Qty", 3), ("ST", 5), ("OT", 5), ("DT", 5), ("POT", 5), ("Total", 5), ("Date", 5)],
+            [
+                (
+                    _truncate(entry.get("worker_name"), 20), _num(entry.get("quantity", 1)),
+                    _num(entry.get("st_hours")), _num(entry.get("ot_hours")), _num(entry.get("dt_hours")),
+                    _num(entry.get("pot_hours")), _num(entry.get("total_hours")), str(entry.get("date") or "")[:10]
+                )
+                for entry in labor_entries
+            ]
+        )
+        total_hours = sum(float(entry.get("total_hours") or 0) for entry in labor_entries)
+        y = ensure_space(y, 6)
+        font(bold=True)
+        rect(120, y, 50, 6)
+        rect(170, y, 25, 6)
+        text("TOTAL HOURS:", 125, y + 4)
+        text(f"{total_hours:.2f}", 175, y + 4)
+        y += 12
+
+    material_entries = tm_tag.get("material_entries") or []
+    if material_entries:
+        y = ensure_space(y, 26)
+        font(bold=True, size=11)
+        text("MATERIALS", 15, y)
+        y += 6
+        table_lines()
+        y = table(
+            y,
+            [(15, 55), (70, 25), (95, 20), (115, 25), (140, 25), (165, 30)],
+            [("Material Name", 2), ("Unit", 7), ("Qty", 5), ("Unit Cost", 5), ("Total", 7), ("Date", 5)],
+            [
+                (
+                    _truncate(entry.get("material_name"), 18), (entry.get("unit_of_measure") or "")[:8],
+                    _num(entry.get("quantity")), f"${_money(entry.get('unit_cost'))}", f"${_money(entry.get('total'))}",
+                    str(entry.get("date_of_work") or "")[:10]
+                )
+                for entry in material_entries
+            ]
+        )
+        material_total = sum(float(entry.get("total") or 0) for entry in material_entries)
+        y = ensure_space(y, 6)
+        font(bold=True)
+        rect(115, y, 50, 6)
+        rect(165, y, 30, 6)
+        text("TOTAL MATERIALS:", 120, y + 4)
+        text(f"${material_total:.2f}", 170, y + 4)
+        y += 12
+
+    equipment_entries = tm_tag.get("equipment_entries") or []
+    if equipment_entries:
+        y = ensure_space(y, 20)
+        font(bold=True, size=11)
+        text("EQUIPMENT", 15, y)
+        y += 6
+        table_lines()
+        y = table(
+            y,
+            [(15, 50), (65, 25), (90, 25), (115, 25), (140, 25), (165, 30)],
+            [("Equipment Name", 2), ("Pieces", 7), ("Unit", 7), ("Quantity", 7), ("Total", 7), ("Date", 7)],
+            [
+                (
+                    entry.get("equipment_name") or "", _num(entry.get("pieces_of_equipment")),
+                    entry.get("unit_of_measure") or "", _num(entry.get("quantity")), _money(entry.get("total")),
+                    str(entry.get("date_of_work") or "")[:8]
+                )
+                for entry in equipment_entries
+            ]
+        )
+        y += 6
+
+    other_entries = tm_tag.get("other_entries") or []
+    if other_entries:
+        y = ensure_space(y, 20)
+        font(bold=True, size=11)
+        text("OTHER", 15, y)
+        y += 6
+        table_lines()
+        y = table(
+            y,
+            [(15, 50), (65, 25), (90, 25), (115, 25), (140, 25), (165, 30)],
+            [("Other Name", 2), ("Qty Other", 7), ("Unit", 7), ("Qty Unit", 7), ("Total", 7), ("Date", 7)],
+            [
+                (
+                    entry.get("other_name") or "", _num(entry.get("quantity_of_other")),
+                    entry.get("unit_of_measure") or "", _num(entry.get("quantity_of_unit")), _money(entry.get("total")),
+                    str(entry.get("date_of_work") or "")[:8]
+                )
+                for entry in other_entries
+            ]
+        )
+        y += 6
+
+    # Signature blocks
+    y = ensure_space(y + 10, 100)
+    font(bold=True, size=10)
+    rect(15, y, 90, 25)
+    rect(110, y, 85, 25)
+    text("FOREMAN SIGNATURE:", 17, y + 5)
+    text("DATE:", 112, y + 5)
+
+    signature = tm_tag.get("signature")
+    if signature:
+        try:
+            image = base64.b64decode(signature.split(",", 1)[1] if "," in signature else signature)
+            pdf.drawImage(ImageReader(io.BytesIO(image)), 17 * mm, page_height - (y + 22) * mm,
+                          width=70 * mm, height=15 * mm, mask="auto")
+        except Exception:
+            font(size=8)
+            text("(Digital signature captured)", 17, y + 15)
+            font(size=10)
+
+    # The client prints today's date; the tag's own date keeps the output cacheable
+    text(_date_text(tm_tag.get("submitted_at") or tm_tag.get("created_at")), 112, y + 15)
+    y += 30
+
+    rect(15, y, 180, 15)
+    text("FOREMAN PRINT NAME:", 17, y + 8)
+    if tm_tag.get("signer_name"):
+        font(bold=False, size=9)
+        text(tm_tag["signer_name"], 17, y + 12)
+        font(bold=True, size=10)
+    y += 20
+
+    rect(15, y, 90, 20)
+    rect(110, y, 85, 20)
+    text("COMPANY REPRESENTATIVE SIGNATURE:", 17, y + 5)
+    text("COMPANY DATE:", 112, y + 5)
+    y += 25
+
+    rect(15, y, 180, 15)
+    text("COMPANY REPRESENTATIVE PRINT NAME:", 17, y + 8)
+    y += 15
+
+    # Footer
+    pdf.setStrokeColorRGB(0, 0, 0)
+    pdf.setLineWidth(0.5 * mm)
+    pdf.line(15 * mm, page_height - y * mm, 195 * mm, page_height - y * mm)
+    y += 10
+    font(bold=True, size=10)
+    pdf.drawCentredString(105 * mm, page_height - (y + 2) * mm, "RHINO FIRE PROTECTION T&M TAG APP")
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+class TmTagPdfRenderer:
+    """Process-pool PDF rendering with a Mongo cache keyed by tag content hash"""
+
+    def __init__(self, db, workers: int = 2):
+        self.db = db
+        self.workers = workers
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+
+    @property
+    def cache(self):
+        return self.db.tm_tag_pdf_cache
+
+    async def create_indexes(self):
+        await self.cache.create_index("created_at", expireAfterSeconds=CACHE_TTL_SECONDS)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def render(self, tm_tag: dict) -> Tuple[bytes, str]:
+        """PDF bytes and content hash for a tag, rendering only on a cache miss"""
+        digest = content_hash(tm_tag)
+
+        cached = await self.cache.find_one({"_id": digest}, {"pdf": 1})
+        if cached:
+            self.hits += 1
+            return bytes(cached["pdf"]), digest
+
+        # Concurrent requests for the same content share one render
+        if digest in self._inflight:
+            self.hits += 1
+            return await asyncio.shield(self._inflight[digest]), digest
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[digest] = future
+        try:
+            content = {field: tm_tag.get(field) for field in RENDERED_FIELDS}
+            pdf = await asyncio.get_running_loop().run_in_executor(self._pool(), render_tm_tag_pdf, content)
+            self.renders += 1
+            await self.cache.update_one(
+                {"_id": digest},
+                {"$set": {"pdf": Binary(pdf), "tm_tag_id": tm_tag.get("id"), "created_at": datetime.utcnow()}},
+                upsert=True
+            )
+            future.set_result(pdf)
+            return pdf, digest
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[digest]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "workers": self.workers,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "renders": self.renders,
+            "inflight": len(self._inflight)
+        }
@@ -0,0 +1,76 @@
+"""
+Shared fixtures for the backend unit tests.
+
+The API tests run server.py against mongomock-motor (in-memory, skipped when it
+isn't installed). Tests of aggregation pipelines need a real mongod: point
+MONGO_TEST_URL at one (>= 4.4) or they are skipped.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "tm_tracker_test")
+
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL")
+
+@pytest.fixture
+def server():
+    """server.py with every collection on a fresh in-memory database"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import motor.motor_asyncio
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+    import server as server_module
+    db = server_module.db
+    for name in asyncio.run(db.list_collection_names()):
+        asyncio.run(db.drop_collection(name))
+    return server_module
+
+@pytest.fixture
+def api(server):
+    from fastapi.testclient import TestClient
+    return TestClient(server.app)
+
+@pytest.fixture
+def mock_db():
+    """Fresh mongomock-motor database for service-level tests"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()[f"test_{uuid.uuid4().hex[:8]}"]
+
+@pytest.fixture
+def gridfs():
+    """Let GridFS buckets (email attachments) run on mongomock databases for the test"""
+    mongomock_gridfs = pytest.importorskip("mongomock.gridfs")
+    mongomock_gridfs.enable_gridfs_integration()  # Patches gridfs' isinstance checks with mock.patch().start()
+    yield
+    mock.patch.stopall()
+
+@pytest.fixture
+def run_on_mongod():
+    """Run an async test body against a throwaway database on MONGO_TEST_URL"""
+    if not MONGO_TEST_URL:
+        pytest.skip("MONGO_TEST_URL not set (aggregation pipelines need a real mongod)")
+
+    def run(scenario):
+        async def main():
+            client = AsyncIOMotorClient(MONGO_TEST_URL)
+            name = f"tm_tracker_test_{uuid.uuid4().hex[:8]}"
+            try:
+                return await scenario(client[name])
+            finally:
+                await client.drop_database(name)
+                client.close()
+        return asyncio.run(main())
+
+    return run
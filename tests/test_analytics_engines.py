@@ -0,0 +1,127 @@
+"""engine=aggregate and engine=rollup return the same analytics totals (needs MONGO_TEST_URL)"""
+
+from datetime import datetime
+
+import pytest
+
+from service_analytics_pipeline import aggregate_project_totals
+from service_analytics_rollups import AnalyticsRollups, rollup_totals
+from service_employee_rates import EmployeeRateCache
+
+LABOR_RATE = 95.0
+
+EMPLOYEES = [
+    {"id": "e1", "name": "Ann", "hourly_rate": 52.5, "status": "active"},
+    {"id": "e2", "name": "Bob", "hourly_rate": 38, "status": "active"},
+    {"id": "e3", "name": "Cy", "hourly_rate": 70, "status": "terminated"},  # Inactive: default rate
+]
+
+TM_TAGS = [
+    {"id": "t1", "project_id": "p1", "date_of_work": datetime(2025, 9, 1), "work_date": "2025-09-01",
+     "labor_entries": [
+         {"worker_name": "Ann", "total_hours": 10},
+         {"worker_name": "Bob", "total_hours": 8.5},
+     ],
+     "material_entries": [{"total": 120.25}, {"total": 30}],
+     "other_entries": [{"total": 45}],
+     "signature": "data:image/png;base64,AAAA"},
+    {"id": "t2", "project_id": "p1", "date_of_work": "2025-09-02T07:00:00",  # Not backfilled: no work_date
+     "labor_entries": [
+         {"worker_name": "Ann", "total_hours": 4},
+         {"worker_name": None, "total_hours": 2},
+         {"worker_name": "Cy", "total_hours": 6},
+     ],
+     "material_entries": [], "other_entries": []},
+    {"id": "t3", "project_id": "p1", "date_of_work": "2025-09-02", "work_date": "2025-09-02",
+     "labor_entries": [], "material_entries": [{"total": 10}]},
+    {"id": "other", "project_id": "p2", "date_of_work": "2025-09-01", "work_date": "2025-09-01",
+     "labor_entries": [{"worker_name": "Ann", "total_hours": 99}]},
+]
+
+CREW_LOGS = [
+    {"id": "c1", "project_id": "p1", "date": "2025-09-01", "work_date": "2025-09-01",
+     "crew_members": [
+         {"name": "Ann", "st_hours": 8, "ot_hours": 2, "total_hours": 10},
+         {"name": "Bob", "st_hours": 8, "total_hours": 8},
+     ]},
+    # Old format: names only, hours_worked split across them
+    {"id": "c2", "project_id": "p1", "date": datetime(2025, 9, 3), "crew_members": ["Ann", "Dee", "Bob"],
+     "hours_worked": 24},
+    {"id": "c3", "project_id": "p1", "date": "2025-09-04", "work_date": "2025-09-04",
+     "crew_members": [{"st_hours": 3, "total_hours": 3}]},  # No name: "Unknown"
+]
+
+MATERIALS = [
+    {"id": "m1", "project_id": "p1", "total_cost": 250.75},
+    {"id": "m2", "project_id": "p1", "total_cost": 99.25},
+    {"id": "m3", "project_id": "p2", "total_cost": 1000},
+]
+
+
+async def seed(db, with_rollup_writes=None):
+    await db.employees.insert_many([dict(employee) for employee in EMPLOYEES])
+    for collection, kind, docs in (("tm_tags", "tm_tag", TM_TAGS), ("crew_logs", "crew_log", CREW_LOGS),
+                                   ("materials", "material", MATERIALS)):
+        await db[collection].insert_many([dict(doc) for doc in docs])
+        if with_rollup_writes:
+            for doc in docs:
+                await with_rollup_writes.apply(kind, new=doc)
+
+
+def assert_same_totals(aggregated, rolled_up):
+    assert set(aggregated) == set(rolled_up)
+    for key, value in rolled_up.items():
+        if isinstance(value, float) or isinstance(aggregated[key], float):
+            assert aggregated[key] == pytest.approx(value), key
+        else:
+            assert aggregated[key] == value, key
+
+
+def test_engines_agree_on_rebuilt_rollup(run_on_mongod):
+    async def scenario(db):
+        await seed(db)
+        rollups = AnalyticsRollups(db)
+        rates = await EmployeeRateCache(db).rates_by_name()
+
+        rolled_up = rollup_totals(await rollups.rebuild("p1"), rates, LABOR_RATE)
+        aggregated = await aggregate_project_totals(db, "p1", LABOR_RATE)
+        assert_same_totals(aggregated, rolled_up)
+
+        # Spot-check the fixture actually exercises the edge cases
+        assert rolled_up["crew_members"] == ["Ann", "Bob", "Cy", "Dee", "Unknown"]
+        assert rolled_up["work_days"] == 4
+        assert rolled_up["tm_hours"] == pytest.approx(30.5)
+        assert rolled_up["crew_hours"] == pytest.approx(45)
+
+    run_on_mongod(scenario)
+
+
+def test_engines_agree_on_incremental_rollup(run_on_mongod):
+    async def scenario(db):
+        rollups = AnalyticsRollups(db)
+        await rollups.rebuild("p1")  # Start from an empty stored rollup, then maintain it write by write
+        await seed(db, with_rollup_writes=rollups)
+
+        # A deleted and an edited document, as the endpoints report them
+        await db.tm_tags.delete_one({"id": "t3"})
+        await rollups.apply("tm_tag", old=TM_TAGS[2])
+        edited = {**CREW_LOGS[0], "crew_members": [{"name": "Ann", "total_hours": 12}]}
+        await db.crew_logs.replace_one({"id": "c1"}, edited)
+        await rollups.apply("crew_log", old=CREW_LOGS[0], new=edited)
+
+        rates = await EmployeeRateCache(db).rates_by_name()
+        rolled_up = rollup_totals(await rollups.get("p1"), rates, LABOR_RATE)
+        aggregated = await aggregate_project_totals(db, "p1", LABOR_RATE)
+        assert_same_totals(aggregated, rolled_up)
+        assert await rollups.drift("p1") == {}
+
+    run_on_mongod(scenario)
+
+
+def test_engines_agree_on_empty_project(run_on_mongod):
+    async def scenario(db):
+        rolled_up = rollup_totals(await AnalyticsRollups(db).rebuild("none"), {}, LABOR_RATE)
+        aggregated = await aggregate_project_totals(db, "none", LABOR_RATE)
+        assert_same_totals(aggregated, rolled_up)
+
+    run_on_mongod(scenario)
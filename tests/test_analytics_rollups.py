@@ -0,0 +1,81 @@
+"""AnalyticsRollups rebuild racing concurrent writes"""
+
+import asyncio
+
+import service_analytics_rollups
+from service_analytics_rollups import AnalyticsRollups
+
+
+def crew_log(log_id, worker, hours):
+    return {"id": log_id, "project_id": "p1", "work_date": "2025-09-01",
+            "crew_members": [{"name": worker, "total_hours": hours}]}
+
+
+async def write_crew_log(db, rollups, log):
+    await db.crew_logs.insert_one(dict(log))
+    await rollups.apply("crew_log", new=log)
+
+
+def racing_compute(rollups, db, logs):
+    """compute() that lets one write land after it has read the collections, once per log"""
+    compute = rollups.compute
+    pending = list(logs)
+
+    async def compute_then_write(project_id):
+        rollup = await compute(project_id)
+        if pending:
+            await write_crew_log(db, rollups, pending.pop(0))
+        return rollup
+
+    return compute_then_write
+
+
+def test_write_during_first_read_rebuild_is_kept(mock_db):
+    async def scenario():
+        rollups = AnalyticsRollups(mock_db)
+        await write_crew_log(mock_db, rollups, crew_log("a", "Ann", 8))  # No rollup yet: nothing to $inc
+        rollups.compute = racing_compute(rollups, mock_db, [crew_log("b", "Bob", 6)])
+
+        await rollups.get("p1")
+        stored = await mock_db.project_analytics_rollups.find_one({"project_id": "p1"})
+        assert stored["crew"]["count"] == 2
+        assert stored["crew"]["workers"]["Bob"]["hours"] == 6
+        assert stored["rebuilt_at"] is not None
+        assert await AnalyticsRollups(mock_db).drift("p1") == {}
+
+    asyncio.run(scenario())
+
+
+def test_write_during_explicit_rebuild_is_kept(mock_db):
+    async def scenario():
+        rollups = AnalyticsRollups(mock_db)
+        await write_crew_log(mock_db, rollups, crew_log("a", "Ann", 8))
+        await rollups.rebuild("p1")
+        rollups.compute = racing_compute(rollups, mock_db, [crew_log("b", "Bob", 6)])
+
+        await rollups.rebuild("p1")
+        assert await AnalyticsRollups(mock_db).drift("p1") == {}
+        stored = await mock_db.project_analytics_rollups.find_one({"project_id": "p1"})
+        assert stored["crew"]["count"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_rebuild_that_keeps_losing_is_not_stored(mock_db, monkeypatch):
+    monkeypatch.setattr(service_analytics_rollups, "REBUILD_ATTEMPTS", 2)
+
+    async def scenario():
+        rollups = AnalyticsRollups(mock_db)
+        rollups.compute = racing_compute(rollups, mock_db, [crew_log(f"log-{i}", "Ann", 1) for i in range(2)])
+
+        result = await rollups.get("p1")
+        assert result["rebuilt_at"] is None
+        stored = await mock_db.project_analytics_rollups.find_one({"project_id": "p1"})
+        assert stored["rebuilt_at"] is None  # Placeholder: the next read rebuilds
+
+        rollups.compute = AnalyticsRollups(mock_db).compute
+        rebuilt = await rollups.get("p1")
+        assert rebuilt["crew"]["count"] == 2
+        assert await rollups.drift("p1") == {}
+
+    asyncio.run(scenario())
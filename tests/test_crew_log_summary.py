@@ -0,0 +1,46 @@
+"""GET /api/crew-logs?fields=summary against crew logs as the API stores them"""
+
+
+def test_summary_of_created_crew_log(api):
+    created = api.post("/api/crew-logs", json={
+        "project_id": "p1",
+        "date": "2025-09-02T07:00:00",
+        "crew_members": [
+            {"name": "Ann", "st_hours": 8, "ot_hours": 2, "dt_hours": 0, "pot_hours": 0, "total_hours": 10},
+            {"name": "Bob", "st_hours": 8, "ot_hours": 0, "dt_hours": 0, "pot_hours": 0}
+        ],
+        "work_description": "Rough-in"
+    }).json()
+
+    response = api.get("/api/crew-logs", params={"fields": "summary", "project_id": "p1"})
+    assert response.status_code == 200
+    [summary] = response.json()
+    assert summary["id"] == created["id"]
+    assert summary["project_id"] == "p1"
+    assert summary["work_date"] == "2025-09-02"
+    assert summary["date"] == "2025-09-02T07:00:00"
+    assert [member["name"] for member in summary["crew_members"]] == ["Ann", "Bob"]
+    assert summary["total_hours"] == 18
+    assert summary["status"] is None
+    assert summary["synced_to_tm"] is False
+    assert "work_description" not in summary
+
+
+def test_summary_of_legacy_and_generated_logs(api, server):
+    import asyncio
+    asyncio.run(server.db.crew_logs.insert_many([
+        # Old format: names only, hours at the log level
+        {"id": "old", "project_id": "p2", "date": "2024-03-01", "work_date": "2024-03-01",
+         "crew_members": ["Ann", "Bob"], "hours_worked": 16, "created_at": server.datetime(2024, 3, 1)},
+        server.crew_log_from_tm_tag({
+            "id": "tag-1", "project_id": "p2", "date_of_work": "2024-03-02",
+            "labor_entries": [{"worker_name": "Cy", "st_hours": 8, "ot_hours": 1, "total_hours": 9}]
+        }, "2024-03-02")
+    ]))
+
+    rows = {row["work_date"]: row for row in api.get("/api/crew-logs", params={"fields": "summary", "project_id": "p2"}).json()}
+    assert rows["2024-03-01"]["crew_members"] == ["Ann", "Bob"]
+    assert rows["2024-03-01"]["total_hours"] == 16
+    assert rows["2024-03-02"]["total_hours"] == 9
+    assert rows["2024-03-02"]["status"] == "pending_review"
+    assert rows["2024-03-02"]["synced_to_tm"] is True
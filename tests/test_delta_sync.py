@@ -0,0 +1,63 @@
+"""POST /api/sync download paging"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+
+def seed(server, project_id, count):
+    base = datetime(2025, 9, 1)
+    asyncio.run(server.db.crew_logs.insert_many([
+        {"id": f"{project_id}-log-{i}", "project_id": project_id, "work_date": "2025-09-01", "crew_members": [],
+         "created_at": base + timedelta(minutes=i), "updated_at": base + timedelta(minutes=i)}
+        for i in range(count)
+    ]))
+
+
+def test_full_download_requires_project(api):
+    response = api.post("/api/sync", json={})
+    assert response.status_code == 400
+    assert "project_id" in response.json()["detail"]
+
+
+def test_full_download_is_paged(api, server):
+    seed(server, "p1", 5)
+    seed(server, "p2", 3)
+
+    first = api.post("/api/sync", json={"project_id": "p1", "limit": 2}).json()
+    assert first["full"] is True
+    assert first["has_more"] is True
+
+    ids = [log["id"] for log in first["changes"]["crew_logs"]]
+    response = first
+    while response["has_more"]:
+        response = api.post("/api/sync", json={"project_id": "p1", "limit": 2, "cursor": response["cursor"]}).json()
+        assert response["watermark"] == first["watermark"]
+        ids += [log["id"] for log in response["changes"]["crew_logs"]]
+
+    assert ids == [f"p1-log-{i}" for i in range(5)]
+    assert response["cursor"] is None
+
+
+def test_delta_download_pages_and_sends_deletes_once(api, server):
+    seed(server, "p1", 3)
+    since = (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+    now = datetime.utcnow()
+    asyncio.run(server.db.crew_logs.update_many({}, {"$set": {"updated_at": now}}))
+    asyncio.run(server.db.sync_tombstones.insert_one(
+        {"collection": "crew_logs", "id": "gone", "project_id": "p1", "deleted_at": now}
+    ))
+
+    first = api.post("/api/sync", json={"since": since, "limit": 2}).json()
+    assert first["full"] is False
+    assert len(first["changes"]["crew_logs"]) == 2
+    assert first["changes"]["deleted"]["crew_logs"] == ["gone"]
+
+    second = api.post("/api/sync", json={"since": since, "limit": 2, "cursor": first["cursor"]}).json()
+    assert [log["id"] for log in second["changes"]["crew_logs"]] == ["p1-log-2"]
+    assert second["changes"]["deleted"]["crew_logs"] == []
+    assert second["has_more"] is False
+
+
+def test_invalid_cursor(api):
+    response = api.post("/api/sync", json={"project_id": "p1", "cursor": "not-a-cursor"})
+    assert response.status_code == 400
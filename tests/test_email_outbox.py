@@ -0,0 +1,208 @@
+"""EmailOutbox delivery against a local aiosmtpd server, and /api/send-email queueing and status"""
+
+import asyncio
+import base64
+import email
+import socket
+
+import pytest
+
+from service_email_outbox import EmailOutbox, SmtpConnection
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class Mailbox:
+    """aiosmtpd handler that keeps what it receives, refusing the first `reject` DATA commands"""
+
+    def __init__(self, reject=0):
+        self.messages = []
+        self.reject = reject
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.reject:
+            self.reject -= 1
+            return "451 Try again later"
+        self.messages.append((envelope.rcpt_tos, email.message_from_bytes(envelope.content)))
+        return "250 Message accepted for delivery"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtpd():
+    def start(reject=0):
+        mailbox = Mailbox(reject)
+        controller = aiosmtpd_controller.Controller(mailbox, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        started.append(controller)
+        return mailbox, lambda: SmtpConnection(controller.hostname, controller.port, starttls=False)
+
+    started = []
+    yield start
+    for controller in started:
+        controller.stop()
+
+
+async def wait_for_sent(db, count, timeout=10):
+    for _ in range(int(timeout / 0.05)):
+        if await db.email_logs.count_documents({"status": "sent"}) >= count:
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"{count} emails not sent within {timeout}s")
+
+
+def test_sender_pool_delivers_over_reused_connections(mock_db, smtpd, gridfs):
+    mailbox, connect = smtpd()
+
+    async def scenario():
+        outbox = EmailOutbox(mock_db, connect, workers=2, poll_interval=0.05)
+        outbox.start()
+        try:
+            for i in range(5):
+                filename = f"TM_Tag_{i}.pdf"
+                file_id = await outbox.store_attachment_data(b"%PDF-1.4 tag", filename, 1024)
+                await outbox.enqueue("foreman@x.com", f"gc{i}@x.com", "office@x.com" if i == 0 else None,
+                                     f"T&M tag {i}", "See attached", tm_tag_id=f"t{i}",
+                                     attachment_filename=filename, attachment_file_id=file_id)
+            await wait_for_sent(mock_db, 5)
+            stats = await outbox.stats()
+        finally:
+            await outbox.stop()
+
+        assert stats["sent"] == 5 and stats["depth"] == 0
+        assert stats["smtp_connects"] <= 2  # One session per sender, not one per email
+        assert await mock_db.email_outbox.count_documents({}) == 0
+        assert await mock_db["email_attachments.files"].count_documents({}) == 0
+
+    asyncio.run(scenario())
+
+    assert sorted(message["Subject"] for _, message in mailbox.messages) == [f"T&M tag {i}" for i in range(5)]
+    recipients, first = next((rcpt, m) for rcpt, m in mailbox.messages if m["Subject"] == "T&M tag 0")
+    assert recipients == ["gc0@x.com", "office@x.com"]
+    attachment = [part for part in first.walk() if part.get_filename()][0]
+    assert attachment.get_filename() == "TM_Tag_0.pdf"
+    assert attachment.get_payload(decode=True) == b"%PDF-1.4 tag"
+
+
+def test_temporary_failure_is_retried(mock_db, smtpd):
+    mailbox, connect = smtpd(reject=1)
+
+    async def scenario():
+        outbox = EmailOutbox(mock_db, connect, workers=1, retry_delay=0)
+        connection = connect()
+        email_id = await outbox.enqueue("foreman@x.com", "gc@x.com", None, "T&M tag", "See attached")
+
+        await outbox._send(await outbox._claim(), connection)
+        log = await mock_db.email_logs.find_one({"id": email_id})
+        assert log["status"] == "retrying" and "451" in log["error"]
+
+        await outbox._send(await outbox._claim(), connection)
+        log = await mock_db.email_logs.find_one({"id": email_id})
+        assert log["status"] == "sent" and log["attempts"] == 2
+        connection.close()
+
+    asyncio.run(scenario())
+    assert len(mailbox.messages) == 1
+
+
+def test_spooled_message_is_streamed_with_dot_stuffing(mock_db, smtpd, gridfs):
+    mailbox, connect = smtpd()
+    body = "Line one\n.starts with a dot\n..two dots"
+    pdf = bytes(range(256)) * 2000  # Several GridFS chunks, not a multiple of the 57-byte base64 line
+
+    async def scenario():
+        outbox = EmailOutbox(mock_db, connect)
+        file_id = await outbox.store_attachment_data(pdf, "TM.pdf", len(pdf))
+        await outbox.enqueue("foreman@x.com", "gc@x.com", None, "T&M tag", body,
+                             attachment_filename="TM.pdf", attachment_file_id=file_id)
+        connection = connect()
+        await outbox._send(await outbox._claim(), connection)
+        connection.close()
+
+    asyncio.run(scenario())
+    [(_, message)] = mailbox.messages
+    text, attachment = message.get_payload()
+    assert text.get_payload().splitlines() == body.splitlines()
+    assert attachment.get_payload(decode=True) == pdf
+
+
+def test_send_email_queues_attachment_in_gridfs(api, server, monkeypatch, gridfs):
+    monkeypatch.setenv("SMTP_USERNAME", "foreman@x.com")
+    monkeypatch.setenv("SMTP_PASSWORD", "secret")
+    pdf = b"%PDF-1.4 " + b"x" * 5000
+
+    response = api.post("/api/send-email", json={
+        "to_email": "gc@x.com", "subject": "T&M tag", "message": "See attached", "tm_tag_id": "t1",
+        "pdf_data": "data:application/pdf;base64," + base64.b64encode(pdf).decode()
+    })
+    body = response.json()
+    assert response.status_code == 200
+    assert body["status"] == "queued" and body["message"] == "Email queued for delivery"
+
+    queued = asyncio.run(server.db.email_outbox.find_one({"id": body["email_id"]}))
+    assert "attachment" not in queued and queued["attachment_file_id"] is not None
+
+    async def stored_attachment():
+        return await (await server.email_outbox.attachments.open_download_stream(queued["attachment_file_id"])).read()
+
+    assert asyncio.run(stored_attachment()) == pdf
+
+    status = api.get(f"/api/email-logs/{body['email_id']}")
+    assert status.status_code == 200
+    assert status.json()["status"] == "queued" and status.json()["attempts"] == 0
+    assert api.get("/api/email-logs/unknown").status_code == 404
+
+
+def test_send_email_rejects_oversized_pdf(api, server, monkeypatch):
+    monkeypatch.setenv("SMTP_USERNAME", "foreman@x.com")
+    monkeypatch.setenv("SMTP_PASSWORD", "secret")
+    monkeypatch.setattr(server, "MAX_EMAIL_ATTACHMENT_BYTES", 100)
+
+    response = api.post("/api/send-email", json={
+        "to_email": "gc@x.com", "subject": "T&M tag", "message": "See attached", "tm_tag_id": "t1",
+        "pdf_data": base64.b64encode(b"x" * 200).decode()
+    })
+    assert response.status_code == 413
+    assert asyncio.run(server.db.email_outbox.count_documents({})) == 0
+
+
+def test_uploaded_pdf_is_sent_and_removed_from_gridfs(api, server, monkeypatch, smtpd, gridfs):
+    monkeypatch.setenv("SMTP_USERNAME", "foreman@x.com")
+    monkeypatch.setenv("SMTP_PASSWORD", "secret")
+    mailbox, connect = smtpd()
+    pdf = b"%PDF-1.4 " + bytes(range(256)) * 1200  # Spans several GridFS chunks
+
+    response = api.post("/api/send-email/upload", data={
+        "to_email": "gc@x.com", "subject": "T&M tag", "message": "See attached", "tm_tag_id": "t1"
+    }, files={"pdf": ("upload.pdf", pdf, "application/pdf")})
+    assert response.status_code == 200 and response.json()["status"] == "queued"
+    email_id = response.json()["email_id"]
+    assert asyncio.run(server.db["email_attachments.files"].count_documents({})) == 1
+    assert asyncio.run(server.db["email_attachments.chunks"].count_documents({})) > 1
+
+    async def deliver():
+        # A sender pool on the app's database, pointed at the local SMTP server
+        outbox = EmailOutbox(server.db, connect, workers=1, poll_interval=0.05)
+        outbox.start()
+        try:
+            await wait_for_sent(server.db, 1)
+        finally:
+            await outbox.stop()
+
+    asyncio.run(deliver())
+
+    [(recipients, message)] = mailbox.messages
+    assert recipients == ["gc@x.com"]
+    [attachment] = [part for part in message.walk() if part.get_filename()]
+    assert attachment.get_filename().startswith("TM_Tag_")
+    assert attachment.get_payload(decode=True) == pdf
+
+    assert api.get(f"/api/email-logs/{email_id}").json()["status"] == "sent"
+    assert asyncio.run(server.db.email_outbox.count_documents({})) == 0
+    assert asyncio.run(server.db["email_attachments.files"].count_documents({})) == 0
+    assert asyncio.run(server.db["email_attachments.chunks"].count_documents({})) == 0
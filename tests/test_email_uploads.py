@@ -0,0 +1,97 @@
+"""Upload size limits and attachment cleanup for /api/send-email/upload"""
+
+import asyncio
+import smtplib
+import tempfile
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from service_email_outbox import EmailOutbox
+from service_http_middleware import RequestBodyLimitMiddleware
+
+LIMIT = 1024
+
+
+def limited_app(calls):
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(pdf: UploadFile = File(...)):
+        calls.append(pdf.filename)
+        return {"size": len(await pdf.read())}
+
+    @app.post("/other")
+    async def other(pdf: UploadFile = File(...)):
+        return {"size": len(await pdf.read())}
+
+    app.add_middleware(RequestBodyLimitMiddleware, limits={"/upload": LIMIT})
+    return TestClient(app)
+
+
+def test_small_upload_passes():
+    calls = []
+    response = limited_app(calls).post("/upload", files={"pdf": ("a.pdf", b"x" * 100)})
+    assert response.status_code == 200
+    assert calls == ["a.pdf"]
+
+
+def test_content_length_over_limit_is_rejected_before_parsing():
+    calls = []
+    response = limited_app(calls).post("/upload", files={"pdf": ("a.pdf", b"x" * (LIMIT * 4))})
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_chunked_body_over_limit_is_rejected():
+    calls = []
+    body = b"--b\r\nContent-Disposition: form-data; name=\"pdf\"; filename=\"a.pdf\"\r\n\r\n" + b"x" * (LIMIT * 4) + b"\r\n--b--\r\n"
+
+    def chunks():
+        for start in range(0, len(body), 256):
+            yield body[start:start + 256]
+
+    response = limited_app(calls).post(
+        "/upload", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=b"}
+    )
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_other_paths_are_not_limited():
+    response = limited_app([]).post("/other", files={"pdf": ("a.pdf", b"x" * (LIMIT * 4))})
+    assert response.status_code == 200
+
+
+class RefusingConnection:
+    def send(self, sender, recipients, message):
+        raise smtplib.SMTPRecipientsRefused({recipients[0]: (550, b"No such user")})
+
+    def close(self):
+        pass
+
+
+def test_attachment_is_deleted_when_email_fails_for_good(mock_db, monkeypatch):
+    discarded = []
+
+    async def scenario():
+        outbox = EmailOutbox(mock_db, RefusingConnection)
+
+        async def spool(email):
+            return tempfile.TemporaryFile()
+
+        async def discard(file_id):
+            discarded.append(file_id)
+
+        monkeypatch.setattr(outbox, "_spool_message", spool)
+        monkeypatch.setattr(outbox, "discard_attachment", discard)
+
+        email_id = await outbox.enqueue("from@x.com", "nobody@x.com", None, "T&M tag", "See attached",
+                                        attachment_filename="TM.pdf", attachment_file_id="file-1")
+        await outbox._send(await outbox._claim(), RefusingConnection())
+
+        assert (await mock_db.email_outbox.find_one({"id": email_id}))["status"] == "failed"
+        assert (await mock_db.email_logs.find_one({"id": email_id}))["status"] == "failed"
+
+    asyncio.run(scenario())
+    assert discarded == ["file-1"]
@@ -0,0 +1,78 @@
+"""trusted_rows output against the response_model path, for clean and mistyped stored documents"""
+
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+import service_fast_json
+from service_fast_json import dumps, trusted_rows
+
+LABOR = {"id": "l1", "worker_name": "Ann", "quantity": 1, "st_hours": 8.0, "ot_hours": 2.0, "dt_hours": 0.0,
+         "pot_hours": 0.0, "total_hours": 10.0, "date": "2025-09-01"}
+
+
+def tm_tag(**changes):
+    return {
+        "_id": "mongo-id", "id": "t1", "project_id": "p1", "project_name": "Alpha", "cost_code": "FP-100",
+        "date_of_work": datetime(2025, 9, 1, 7), "company_name": "", "tm_tag_title": "Extra heads",
+        "description_of_work": "Lobby", "labor_entries": [dict(LABOR)], "material_entries": [],
+        "equipment_entries": [], "other_entries": [], "gc_email": "gc@x.com", "signature_id": "abc",
+        "foreman_name": "Ann", "status": "completed", "created_at": datetime(2025, 9, 1, 8),
+        "submitted_at": None, "work_date": "2025-09-01", **changes
+    }
+
+
+def as_json(content):
+    return json.loads(dumps(content))
+
+
+def model_path(model, doc):
+    return as_json(jsonable_encoder(model(**doc)))
+
+
+def test_clean_rows_skip_validation(server, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("clean row was validated")
+
+    monkeypatch.setattr(service_fast_json, "_validated_row", fail)
+    doc = tm_tag()
+    [row] = trusted_rows([doc], server.TMTag)
+    assert as_json(row) == model_path(server.TMTag, doc)
+
+
+@pytest.mark.parametrize("changes", [
+    {"date_of_work": "2025-09-01"},  # Raw-dict PUT stored the client's string
+    {"date_of_work": "2025-09-01T07:00:00"},
+    {"labor_entries": [{**LABOR, "st_hours": "8", "total_hours": "10"}]},
+    {"labor_entries": [{**LABOR, "notes": "extra key from an old client"}]},
+    {"created_at": "2025-09-01T08:00:00Z"},
+])
+def test_mistyped_rows_match_the_model(server, changes):
+    doc = tm_tag(**changes)
+    [row] = trusted_rows([doc], server.TMTag)
+    assert as_json(row) == model_path(server.TMTag, doc)
+
+
+def test_material_purchase_with_string_numbers_and_date(server):
+    doc = {"id": "m1", "project_id": "p1", "project_name": "Alpha", "purchase_date": "2025-09-02",
+           "vendor": "Ferguson", "material_name": "Pipe", "quantity": "3", "unit_cost": 2.5, "total_cost": 7.5,
+           "created_at": datetime(2025, 9, 2)}
+    [row] = trusted_rows([doc], server.MaterialPurchase)
+    assert row["purchase_date"] == datetime(2025, 9, 2)
+    assert row["quantity"] == 3.0
+    assert as_json(row) == model_path(server.MaterialPurchase, doc)
+
+
+def test_invalid_row_is_sent_as_stored(server):
+    doc = tm_tag(date_of_work="last Tuesday")
+    [row] = trusted_rows([doc], server.TMTag)
+    assert row["date_of_work"] == "last Tuesday"
+    assert "_id" not in row
+
+
+def test_benchmark_script_runs(server):
+    import benchmark_list_serialization
+    results = benchmark_list_serialization.run_benchmark(count=20, labor_entries=2, repeat=1)
+    assert set(results) == {"model path", "trusted rows (clean)", "trusted rows (all mistyped)"}
@@ -0,0 +1,78 @@
+"""ETag/304 revalidation and gzip/brotli negotiation from add_response_optimizations"""
+
+import gzip
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import service_http_middleware
+from service_http_middleware import add_response_optimizations
+
+MINIMUM_SIZE = 512
+ROWS = [{"id": f"r{i}", "name": "Sprinkler head"} for i in range(40)]  # Well over MINIMUM_SIZE as JSON
+
+
+def optimized_app():
+    app = FastAPI()
+
+    @app.get("/rows")
+    async def rows():
+        return ROWS
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    add_response_optimizations(app, minimum_size=MINIMUM_SIZE)
+    return TestClient(app)
+
+
+def test_matching_if_none_match_gets_304():
+    client = optimized_app()
+    first = client.get("/rows", headers={"Accept-Encoding": "identity"})
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"') and first.headers["cache-control"] == "no-cache"
+
+    revalidated = client.get("/rows", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == etag  # Same ETag whichever encoding the 200 used
+    assert "content-encoding" not in revalidated.headers
+
+    stale = client.get("/rows", headers={"If-None-Match": 'W/"other"'})
+    assert stale.status_code == 200 and stale.json() == ROWS
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("br;q=1.0, gzip;q=0.8", "br"),
+    ("deflate", None),
+])
+def test_encoding_negotiation(accept_encoding, expected):
+    response = optimized_app().get("/rows", headers={"Accept-Encoding": accept_encoding})
+    assert response.headers.get("content-encoding") == expected
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == ROWS  # httpx decodes gzip and br
+
+
+def test_gzip_wire_body_and_length():
+    with optimized_app().stream("GET", "/rows", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+    assert int(response.headers["content-length"]) == len(raw)
+    assert json.loads(gzip.decompress(raw)) == ROWS
+
+
+def test_gzip_only_without_brotli(monkeypatch):
+    monkeypatch.setattr(service_http_middleware, "BROTLI_AVAILABLE", False)
+    response = optimized_app().get("/rows", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_bodies_under_the_threshold_are_sent_as_is():
+    response = optimized_app().get("/small", headers={"Accept-Encoding": "gzip, br"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == {"ok": True}
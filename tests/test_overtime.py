@@ -0,0 +1,122 @@
+"""Overtime classification rules, the on-write pass and the backfill script"""
+
+import asyncio
+
+import pytest
+
+from service_overtime import DEFAULT_RULES, OvertimeRules, classify, split_hours, week_start
+
+
+@pytest.mark.parametrize("hours, worked_today, regular_this_week, expected", [
+    (8, 0, 0, (8, 0, 0)),
+    (10, 0, 0, (8, 2, 0)),
+    (14, 0, 0, (8, 4, 2)),
+    (4, 10, 0, (0, 2, 2)),  # Second log of a day that already has 10 hours
+    (8, 0, 36, (4, 4, 0)),  # Crosses 40 straight hours in the week
+    (8, 0, 40, (0, 8, 0)),
+    (13, 0, 40, (0, 12, 1)),  # Weekly OT still turns DT past 12 in a day
+])
+def test_split_hours_default_rules(hours, worked_today, regular_this_week, expected):
+    assert split_hours(hours, worked_today, regular_this_week, DEFAULT_RULES) == expected
+
+
+@pytest.mark.parametrize("rules, hours, regular_this_week, expected", [
+    (OvertimeRules(daily_ot_after=None), 14, 0, (12, 0, 2)),
+    (OvertimeRules(daily_dt_after=None), 14, 0, (8, 6, 0)),
+    (OvertimeRules(weekly_ot_after=None), 8, 40, (8, 0, 0)),
+    (OvertimeRules(daily_ot_after=None, daily_dt_after=None), 14, 30, (10, 4, 0)),
+    (OvertimeRules(daily_ot_after=None, daily_dt_after=None, weekly_ot_after=None), 16, 60, (16, 0, 0)),
+    (OvertimeRules(daily_ot_after=10, daily_dt_after=10), 12, 0, (10, 0, 2)),
+])
+def test_split_hours_configured_rules(rules, hours, regular_this_week, expected):
+    assert split_hours(hours, 0, regular_this_week, rules) == expected
+
+
+def line(crew_log_id, work_date, st, worker="Ann", project_id="p1", order=0, ot=0, dt=0):
+    return {"crew_log_id": crew_log_id, "member_index": 0, "project_id": project_id, "work_date": work_date,
+            "worker": worker, "order": order, "st": st, "ot": ot, "dt": dt}
+
+
+def test_week_start():
+    assert week_start("2025-09-03") == "2025-09-01"
+    assert week_start("2025-09-07T10:00:00") == "2025-09-01"
+    with pytest.raises(ValueError):
+        week_start("09/01/2025")
+
+
+def test_classify_daily_and_weekly():
+    # Mon-Fri 10 hours entered as straight time, then a Saturday
+    entries = [line(f"log-{day}", f"2025-09-0{day}", 10) for day in range(1, 6)]
+    entries.append(line("log-6", "2025-09-06", 6))
+    changes = {change["crew_log_id"]: change for change in classify(entries, {})}
+
+    for day in range(1, 6):
+        assert changes[f"log-{day}"]["after"] == {"st_hours": 8, "ot_hours": 2, "dt_hours": 0}
+    assert changes["log-6"]["after"] == {"st_hours": 0, "ot_hours": 6, "dt_hours": 0}  # 40 straight hours reached
+    assert changes["log-6"]["before"] == {"st_hours": 6, "ot_hours": 0, "dt_hours": 0}
+
+
+def test_classify_returns_only_changed_lines():
+    entries = [line("ok", "2025-09-01", 8, ot=2), line("other-week", "2025-09-08", 8)]
+    assert classify(entries, {}) == []
+
+
+def test_classify_same_day_logs_in_order_across_projects():
+    entries = [
+        line("morning", "2025-09-01", 7, project_id="p1", order=1),
+        line("evening", "2025-09-01", 7, project_id="p2", order=2),
+    ]
+    changes = {change["crew_log_id"]: change for change in classify(entries, {})}
+    assert "morning" not in changes
+    assert changes["evening"]["after"] == {"st_hours": 1, "ot_hours": 4, "dt_hours": 2}
+
+
+def test_classify_uses_each_lines_project_rules():
+    entries = [line("a", "2025-09-01", 10, project_id="p1"), line("b", "2025-09-02", 10, project_id="p2")]
+    rules = {"p2": OvertimeRules(daily_ot_after=None, daily_dt_after=None)}
+    changes = {change["crew_log_id"]: change for change in classify(entries, rules)}
+    assert changes["a"]["after"] == {"st_hours": 8, "ot_hours": 2, "dt_hours": 0}
+    assert "b" not in changes
+
+
+def test_classify_keeps_workers_apart():
+    entries = [line("ann", "2025-09-01", 10, worker="Ann"), line("bob", "2025-09-01", 6, worker="Bob")]
+    changes = classify(entries, {})
+    assert [change["worker_name"] for change in changes] == ["Ann"]
+
+
+def test_reclassify_groups_logs_by_pay_week(server, monkeypatch):
+    weeks = []
+
+    async def classify_week(day, workers=None):
+        weeks.append((day, workers))
+        return []
+
+    monkeypatch.setattr(server, "OVERTIME_AUTO_CLASSIFY", True)
+    monkeypatch.setattr(server.overtime, "classify_week", classify_week)
+    logs = [
+        {"id": f"log-{day}", "work_date": f"2025-09-0{day}", "crew_members": [{"name": "Ann"}, {"name": "Bob"}]}
+        for day in range(1, 6)
+    ]
+    logs.append({"id": "next-week", "work_date": "2025-09-08", "crew_members": [{"name": "Ann"}]})
+    logs.append({"id": "bad", "work_date": "09/01/2025", "crew_members": [{"name": "Cy"}]})
+
+    asyncio.run(server.reclassify_overtime(logs))
+    assert sorted(weeks) == [("2025-09-01", ["Ann", "Bob"]), ("2025-09-08", ["Ann"])]
+
+
+def test_backfill_skips_malformed_work_dates(mock_db, monkeypatch, caplog):
+    import rebuild_overtime_splits
+
+    client = mock_db.client
+    monkeypatch.setattr(client, "close", lambda: None)
+    monkeypatch.setattr(rebuild_overtime_splits, "AsyncIOMotorClient", lambda url: client)
+    monkeypatch.setattr(rebuild_overtime_splits, "DB_NAME", mock_db.name)
+    asyncio.run(mock_db.crew_logs.insert_many([
+        {"id": "a", "project_id": "p1", "work_date": "2025-09-01", "crew_members": [{"name": "Ann", "st_hours": 13}]},
+        {"id": "b", "project_id": "p1", "work_date": "09/01/2025", "crew_members": [{"name": "Ann", "st_hours": 9}]},
+    ]))
+
+    changed = asyncio.run(rebuild_overtime_splits.rebuild_overtime(dry_run=True))
+    assert changed == 1
+    assert "'09/01/2025'" in caplog.text
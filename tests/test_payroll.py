@@ -0,0 +1,133 @@
+"""Payroll timesheet week parsing, row flattening and the aggregation itself (needs MONGO_TEST_URL)"""
+
+import pytest
+
+from service_payroll import flatten_timesheet, timesheet_pipeline, week_days
+
+WEEK = "2025-W36"  # Monday 2025-09-01
+
+
+def test_week_days():
+    days = week_days(WEEK)
+    assert days[0] == "2025-09-01" and days[-1] == "2025-09-07"
+    assert week_days("2025-09-04") == days
+    assert week_days("2025-09-07T23:00:00") == days
+    with pytest.raises(ValueError):
+        week_days("last week")
+
+
+def test_flatten_timesheet_rows():
+    worker = {
+        "_id": "Ann", "st": 12, "ot": 2, "dt": 0, "pot": 1, "days_worked": 2,
+        "projects": [
+            {"project_id": "p2", "project_name": "Beta", "days_worked": 1, "st": 4, "ot": 0, "dt": 0, "pot": 1},
+            {"project_id": "p1", "project_name": "Alpha", "days_worked": 1, "st": 8, "ot": 2, "dt": 0, "pot": 0},
+        ]
+    }
+    rows = list(flatten_timesheet(worker))
+    assert [row["project_name"] for row in rows] == ["Alpha", "Beta", "TOTAL"]
+    assert rows[0]["total_hours"] == 10
+    assert rows[-1] == {
+        "worker_name": "Ann", "project_id": "", "project_name": "TOTAL", "days_worked": 2,
+        "st_hours": 12, "ot_hours": 2, "dt_hours": 0, "pot_hours": 1, "total_hours": 15
+    }
+
+
+async def timesheet(db):
+    rows = {}
+    async for worker in db.crew_logs.aggregate(timesheet_pipeline(week_days(WEEK))):
+        for row in flatten_timesheet(worker):
+            rows[(row["worker_name"], row["project_name"])] = row
+    return rows
+
+
+def hours(row):
+    return tuple(row[f"{hour_class}_hours"] for hour_class in ("st", "ot", "dt", "pot")) + (row["days_worked"],)
+
+
+def test_timesheet_pipeline(run_on_mongod):
+    async def scenario(db):
+        await db.projects.insert_many([{"id": "p1", "name": "Alpha"}, {"id": "p2", "name": "Beta"}])
+        await db.crew_logs.insert_many([
+            # Synced with the p1 2025-09-01 T&M tag below: counted once
+            {"id": "c1", "project_id": "p1", "work_date": "2025-09-01", "synced_to_tm": True, "tm_tag_id": "t1",
+             "crew_members": [
+                {"name": "Ann", "st_hours": 8, "ot_hours": 2, "dt_hours": 0, "pot_hours": 0},
+                {"name": "Bob", "st_hours": 8, "ot_hours": 0, "dt_hours": 0, "pot_hours": 0},
+            ]},
+            # Old format: names only, hours_worked split evenly as straight time
+            {"id": "c2", "project_id": "p2", "work_date": "2025-09-03", "crew_members": ["Ann", "Cy"], "hours_worked": 10},
+            # Hours from old form input: numeric strings, blanks, nulls and garbage
+            {"id": "c3", "project_id": "p1", "work_date": "2025-09-04", "crew_members": [
+                {"name": "Bob", "st_hours": "7.5", "ot_hours": "", "dt_hours": None, "pot_hours": "abc"},
+            ]},
+            # Next week
+            {"id": "c4", "project_id": "p1", "work_date": "2025-09-08", "crew_members": [
+                {"name": "Ann", "st_hours": 8},
+            ]},
+        ])
+        await db.tm_tags.insert_many([
+            {"id": "t1", "project_id": "p1", "work_date": "2025-09-01", "crew_log_synced": True, "labor_entries": [
+                {"worker_name": "Ann", "st_hours": 8, "ot_hours": 2, "dt_hours": 0, "pot_hours": 0},
+                {"worker_name": "Bob", "st_hours": 8, "ot_hours": 0, "dt_hours": 0, "pot_hours": 0},
+            ]},
+            # No crew log for this day: the tag counts
+            {"id": "t2", "project_id": "p2", "work_date": "2025-09-02", "labor_entries": [
+                {"worker_name": "Ann", "st_hours": 4, "ot_hours": 0, "dt_hours": 1, "pot_hours": 2},
+                {"st_hours": 1},
+            ]},
+        ])
+
+        rows = await timesheet(db)
+        assert set(rows) == {
+            ("Ann", "Alpha"), ("Ann", "Beta"), ("Ann", "TOTAL"),
+            ("Bob", "Alpha"), ("Bob", "TOTAL"),
+            ("Cy", "Beta"), ("Cy", "TOTAL"),
+            ("Unknown", "Beta"), ("Unknown", "TOTAL"),
+        }
+        assert hours(rows[("Ann", "Alpha")]) == (8, 2, 0, 0, 1)
+        assert hours(rows[("Ann", "Beta")]) == (9, 0, 1, 2, 2)
+        assert hours(rows[("Ann", "TOTAL")]) == (17, 2, 1, 2, 3)
+        assert rows[("Ann", "TOTAL")]["total_hours"] == 22
+        assert hours(rows[("Bob", "TOTAL")]) == (15.5, 0, 0, 0, 2)
+        assert hours(rows[("Cy", "TOTAL")]) == (5, 0, 0, 0, 1)
+        assert hours(rows[("Unknown", "Beta")]) == (1, 0, 0, 0, 1)
+        assert rows[("Ann", "Alpha")]["project_id"] == "p1"
+
+    run_on_mongod(scenario)
+
+
+def test_timesheet_counts_unsynced_tags_on_a_crew_log_day(run_on_mongod):
+    async def scenario(db):
+        await db.projects.insert_one({"id": "p1", "name": "Alpha"})
+        await db.crew_logs.insert_many([
+            {"id": "c1", "project_id": "p1", "work_date": "2025-09-01", "synced_to_tm": True, "tm_tag_id": "t1",
+             "crew_members": [{"name": "Ann", "st_hours": 8}]},
+            # Created from t3, which was never marked on its side
+            {"id": "c3", "project_id": "p1", "work_date": "2025-09-02", "synced_from_tm": True, "tm_tag_id": "t3",
+             "crew_members": [{"name": "Cy", "st_hours": 3}]},
+        ])
+        await db.tm_tags.insert_many([
+            {"id": "t1", "project_id": "p1", "work_date": "2025-09-01", "crew_log_synced": True,
+             "labor_entries": [{"worker_name": "Ann", "st_hours": 8}]},
+            # Second tag the same day: sync_tm_to_crew_log leaves the existing crew log alone
+            {"id": "t2", "project_id": "p1", "work_date": "2025-09-01",
+             "labor_entries": [{"worker_name": "Dee", "st_hours": 6, "ot_hours": 1}]},
+            {"id": "t3", "project_id": "p1", "work_date": "2025-09-02",
+             "labor_entries": [{"worker_name": "Cy", "st_hours": 3}]},
+        ])
+
+        rows = await timesheet(db)
+        assert hours(rows[("Ann", "TOTAL")]) == (8, 0, 0, 0, 1)
+        assert hours(rows[("Dee", "Alpha")]) == (6, 1, 0, 0, 1)
+        assert hours(rows[("Cy", "TOTAL")]) == (3, 0, 0, 0, 1)
+
+    run_on_mongod(scenario)
+
+
+def test_timesheet_pipeline_empty_week(run_on_mongod):
+    async def scenario(db):
+        await db.crew_logs.insert_one({"id": "c1", "project_id": "p1", "work_date": "2025-08-25", "crew_members": []})
+        assert await timesheet(db) == {}
+
+    run_on_mongod(scenario)
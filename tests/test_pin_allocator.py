@@ -0,0 +1,77 @@
+"""GC PIN pool seeding, width changes and startup"""
+
+import asyncio
+
+import service_pin_allocator
+from service_pin_allocator import GcPinAllocator
+
+
+def pool_ids(db):
+    return sorted(doc["_id"] for doc in asyncio.run(db.gc_pins.find({}, {"_id": 1}).to_list(None)))
+
+
+def test_seed_is_batched_and_resumable(mock_db, monkeypatch):
+    monkeypatch.setattr(service_pin_allocator, "SEED_BATCH_SIZE", 25)
+    allocator = GcPinAllocator(mock_db, digits=2)
+    inserts = []
+
+    # An interrupted run left part of the second batch
+    asyncio.run(mock_db.gc_pins.insert_many([{"_id": f"{pin}", "status": "free", "r": 0.5} for pin in range(35, 40)]))
+
+    collection = type(mock_db.gc_pins)
+    insert_many = collection.insert_many
+
+    async def counting_insert_many(self, docs, **kwargs):
+        inserts.append(len(docs))
+        return await insert_many(self, docs, **kwargs)
+
+    monkeypatch.setattr(collection, "insert_many", counting_insert_many)
+
+    assert asyncio.run(allocator.seed()) == 85
+    assert pool_ids(mock_db) == [f"{pin}" for pin in range(10, 100)]
+    assert inserts == [25, 25, 25, 15]
+
+    assert asyncio.run(allocator.seed()) == 0
+    assert inserts == [25, 25, 25, 15]  # Complete batches are skipped, not re-inserted
+
+
+def test_widening_retires_free_pins_of_the_old_width(mock_db):
+    async def scenario():
+        narrow = GcPinAllocator(mock_db, digits=2)
+        await narrow.seed()
+        held = await narrow.allocate("p-old")
+
+        wide = GcPinAllocator(mock_db, digits=3)
+        await wide.seed()
+        assert await wide.retire_other_widths() == 89
+        assert len(await wide.allocate("p-new")) == 3
+
+        await wide.release(held, "p-old")  # The old-width PIN leaves the pool instead of going free
+        assert await mock_db.gc_pins.find_one({"_id": held}) is None
+
+    asyncio.run(scenario())
+    assert all(len(pin) == 3 for pin in pool_ids(mock_db))
+    assert len(pool_ids(mock_db)) == 900
+
+
+def test_project_created_on_an_empty_database(api, server, monkeypatch):
+    monkeypatch.setattr(server.pin_allocator, "digits", 2)
+    monkeypatch.setattr(server.pin_allocator, "low", 10)
+    monkeypatch.setattr(server.pin_allocator, "high", 99)
+    monkeypatch.setattr(server.pin_allocator, "width", {"$regex": "^[0-9]{2}$"})
+    asyncio.run(server.db.projects.insert_one({"id": "legacy", "name": "Old", "gc_pin": "42"}))
+
+    asyncio.run(server.prepare_pin_pool())
+    assert asyncio.run(server.pin_allocator.check())["consistent"]
+
+    response = api.post("/api/projects", json={
+        "name": "Alpha", "client_company": "GC Inc", "gc_email": "gc@x.com", "start_date": "2025-09-01T00:00:00"
+    })
+    assert response.status_code == 200
+    assert response.json()["client_company"] == "GC Inc"
+    pin = response.json()["gc_pin"]
+    assert len(pin) == 2 and pin != "42"
+
+    asyncio.run(server.prepare_pin_pool())  # Restart: nothing re-seeded, nothing freed
+    assert asyncio.run(server.db.gc_pins.count_documents({"status": "assigned"})) == 2
+    assert len(pool_ids(server.db)) == 90
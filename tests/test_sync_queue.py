@@ -0,0 +1,124 @@
+"""SyncQueue coalescing, retry and failure handling"""
+
+import asyncio
+
+from service_sync_queue import SyncQueue
+
+
+async def drain(queue):
+    """Run every job that is due, as the workers would"""
+    while True:
+        job = await queue._claim()
+        if job is None:
+            return
+        await queue._run(job)
+
+
+def test_coalesces_per_source_document(mock_db):
+    synced = []
+
+    async def handler(job):
+        synced.append(job["source_id"])
+
+    async def scenario():
+        queue = SyncQueue(mock_db, {"crew_log_to_tm": handler})
+        await queue.enqueue("crew_log_to_tm", "p1", "2025-09-01", "log-a")
+        await queue.enqueue("crew_log_to_tm", "p1", "2025-09-01", "log-b")
+        await queue.enqueue("crew_log_to_tm", "p1", "2025-09-01", "log-a")  # Second edit of log-a folds in
+        assert await mock_db.sync_jobs.count_documents({"status": "pending"}) == 2
+        assert queue.coalesced == 1
+
+        await drain(queue)
+        assert await mock_db.sync_jobs.count_documents({}) == 0
+        assert queue.processed == 2
+
+    asyncio.run(scenario())
+    assert sorted(synced) == ["log-a", "log-b"]
+
+
+def test_failed_job_is_retried_then_marked_failed(mock_db):
+    async def handler(job):
+        raise RuntimeError("T&M tag write failed")
+
+    async def scenario():
+        queue = SyncQueue(mock_db, {"crew_log_to_tm": handler}, poll_interval=0, max_attempts=3)
+        await queue.enqueue("crew_log_to_tm", "p1", "2025-09-01", "log-a")
+
+        await drain(queue)
+        job = await mock_db.sync_jobs.find_one({"source_id": "log-a"})
+        assert job["status"] == "failed"
+        assert job["attempts"] == 3
+        assert job["error"] == "T&M tag write failed"
+        assert queue.processed == 0
+        assert queue.failed == 3
+
+    asyncio.run(scenario())
+
+
+def test_backoff_delays_the_retry(mock_db):
+    async def handler(job):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        queue = SyncQueue(mock_db, {"crew_log_to_tm": handler}, poll_interval=60)
+        await queue.enqueue("crew_log_to_tm", "p1", "2025-09-01", "log-a")
+        await queue._run(await queue._claim())
+
+        job = await mock_db.sync_jobs.find_one({"source_id": "log-a"})
+        assert job["status"] == "pending"
+        assert job["attempts"] == 1
+        assert await queue._claim() is None  # Not due until the backoff passes
+
+    asyncio.run(scenario())
+
+
+def test_crew_log_sync_errors_reach_the_queue(server, monkeypatch):
+    async def broken_rollup(*args, **kwargs):
+        raise RuntimeError("rollup unavailable")
+
+    async def scenario():
+        queue = server.sync_queue
+        await server.db.projects.insert_one({"id": "p1", "name": "P", "client_company": "C", "gc_email": "g@x.com"})
+        await server.insert_crew_log({
+            "project_id": "p1", "date": "2025-09-01",
+            "crew_members": [{"name": "Ann", "st_hours": 8, "total_hours": 8}]
+        })
+        monkeypatch.setattr(server.analytics_rollups, "apply", broken_rollup)
+        processed = queue.processed
+
+        await queue._run(await queue._claim())
+        job = await server.db.sync_jobs.find_one({})
+        assert job["status"] == "pending"
+        assert job["error"] == "rollup unavailable"
+        assert queue.processed == processed
+
+    asyncio.run(scenario())
+
+
+def test_failed_bulk_sync_is_queued_per_tag(api, server, monkeypatch):
+    build = server.crew_log_from_tm_tag
+    calls = []
+
+    def fail_first_batch(tm_tag, work_date):
+        calls.append(tm_tag["id"])
+        if len(calls) == 1:
+            raise RuntimeError("crew_logs unavailable")
+        return build(tm_tag, work_date)
+
+    monkeypatch.setattr(server, "crew_log_from_tm_tag", fail_first_batch)
+    tag = {"project_id": "p1", "project_name": "Alpha", "cost_code": "FP-100", "tm_tag_title": "Extra heads",
+           "description_of_work": "Lobby", "gc_email": "gc@x.com"}
+    response = api.post("/api/tm-tags/bulk", json=[
+        {**tag, "date_of_work": "2025-09-01T07:00:00"}, {**tag, "date_of_work": "2025-09-02T07:00:00"}
+    ])
+    assert response.status_code == 200 and response.json()["crew_logs_created"] == 0
+
+    async def scenario():
+        assert await server.db.sync_jobs.count_documents({"kind": "tm_to_crew_log", "status": "pending"}) == 2
+        await drain(server.sync_queue)
+        assert await server.db.sync_jobs.count_documents({}) == 0
+        logs = await server.db.crew_logs.find({}, {"_id": 0, "work_date": 1, "tm_tag_id": 1}).to_list(None)
+        assert sorted(log["work_date"] for log in logs) == ["2025-09-01", "2025-09-02"]
+        assert {log["tm_tag_id"] for log in logs} == set(response.json()["ids"])
+
+    asyncio.run(scenario())
@@ -0,0 +1,49 @@
+"""T&M tag signatures: referenced by id in lists and idempotency records, inline only on single-tag reads"""
+
+import asyncio
+
+SIGNATURE = "data:image/png;base64,iVBORw0KGgo="
+
+TAG = {
+    "project_id": "p1",
+    "project_name": "Alpha",
+    "cost_code": "FP-100",
+    "date_of_work": "2025-09-01T07:00:00",
+    "tm_tag_title": "Extra heads",
+    "description_of_work": "Added two heads in the lobby",
+    "gc_email": "gc@x.com",
+    "signature": SIGNATURE,
+}
+
+
+def test_list_returns_signature_id_and_single_get_hydrates(api, server):
+    created = api.post("/api/tm-tags", json=TAG).json()
+    assert created["signature"] is None and created["signature_id"]
+
+    # Un-migrated tag with the image still inline
+    asyncio.run(server.db.tm_tags.insert_one({
+        **TAG, "id": "legacy", "date_of_work": server.datetime(2025, 9, 2), "created_at": server.datetime(2025, 9, 2)
+    }))
+
+    listed = {tag["id"]: tag for tag in api.get("/api/tm-tags").json()}
+    assert listed[created["id"]]["signature"] is None
+    assert listed[created["id"]]["signature_id"] == created["signature_id"]
+    assert listed["legacy"]["signature"] is None
+
+    assert api.get(f"/api/tm-tags/{created['id']}").json()["signature"] == SIGNATURE
+    assert api.get("/api/tm-tags/legacy").json()["signature"] == SIGNATURE
+    image = api.get(f"/api/tm-tags/{created['id']}/signature")
+    assert image.status_code == 200 and image.headers["content-type"] == "image/png"
+
+
+def test_idempotency_record_keeps_the_stored_form(api, server):
+    headers = {"Idempotency-Key": "tag-create-1"}
+    first = api.post("/api/tm-tags", json=TAG, headers=headers)
+    replay = api.post("/api/tm-tags", json=TAG, headers=headers)
+
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json() == first.json()
+    [record] = asyncio.run(server.db.idempotency_keys.find({}).to_list(None))
+    assert record["response"]["signature"] is None
+    assert record["response"]["signature_id"] == first.json()["signature_id"]
+    assert asyncio.run(server.db.tm_tags.count_documents({})) == 1